@@ -1,44 +1,306 @@
 # admin_web.py
 
-from flask import Flask, render_template, request, redirect, session
-from db import Database
-from config import Config
-import os
+import asyncio
+import hmac
+import json
+import secrets
+import time
+from collections import deque
+from aiohttp import web
 
-app = Flask(__name__)
-app.secret_key = os.urandom(24)
+COOKIE = "admin_session"
 
-config = Config()
-db = Database(config.SUPABASE_URL, config.SUPABASE_KEY)
-
-ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "change_me_please")
-
-@app.route('/')
-def index():
-    if not session.get('logged_in'):
-        return redirect('/login')
+class ThroughputMeter:
+    """Вопросы в секунду за последнюю минуту: корзины по секундам, без запросов к БД"""
     
-    stats = db.get_stats()
-    subject_stats = db.get_subject_stats()
+    def __init__(self, seconds: int = 60):
+        self.seconds = seconds
+        self.buckets = deque()  # [секунда, всего, из кеша]
+        self.total = 0
     
-    return render_template('dashboard.html', 
-                         stats=stats, 
-                         subject_stats=subject_stats)
+    def mark(self, from_cache: bool = False):
+        now = int(time.time())
+        if not self.buckets or self.buckets[-1][0] != now:
+            self.buckets.append([now, 0, 0])
+            while self.buckets[0][0] <= now - self.seconds:
+                self.buckets.popleft()
+        self.buckets[-1][1] += 1
+        self.buckets[-1][2] += from_cache
+        self.total += 1
+    
+    def snapshot(self) -> dict:
+        now = int(time.time())
+        recent = [b for b in self.buckets if b[0] > now - self.seconds]
+        last = next((b for b in reversed(recent) if b[0] == now - 1), None)
+        return {
+            't': now,
+            'last_second': last[1] if last else 0,
+            'per_minute': sum(b[1] for b in recent),
+            'cached_per_minute': sum(b[2] for b in recent),
+            'total': self.total,
+        }
 
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    if request.method == 'POST':
-        if request.form['password'] == ADMIN_PASSWORD:
-            session['logged_in'] = True
-            return redirect('/')
-        return "Неверный пароль"
+class AdminDashboard:
+    """
+    Админка на aiohttp-сервере бота. Все ответы - из агрегатов в памяти,
+    которые обновляются фоном и только пока админку кто-то смотрит.
+    """
+    
+    def __init__(self, password: str, refresh_interval: float = 60.0, idle_after: float = 300.0):
+        self.password = password
+        self.refresh_interval = refresh_interval
+        self.idle_after = idle_after  # без зрителей агрегаты не обновляем
+        self.meter = ThroughputMeter()
+        
+        self.sessions = {}  # токен -> срок действия
+        self.sections = {}  # раздел -> {'updated_at', 'data'}
+        self.sources = None
+        self.last_seen = float('-inf')
+        self._wake = asyncio.Event()
+    
+    def attach(self, db, usage=None, cache=None, lanes=None, loop_monitor=None, heap=None, sessions=None,
+               budget=None):
+        """Подключить источники данных (компоненты создаются после старта сервера)"""
+        self.sources = {'db': db, 'usage': usage, 'cache': cache, 'lanes': lanes, 'loop': loop_monitor,
+                        'heap': heap, 'sessions': sessions, 'budget': budget}
+        self._wake.set()
+    
+    def setup(self, app: web.Application):
+        app.router.add_get('/admin', self.page)
+        app.router.add_get('/admin/login', self.login_form)
+        app.router.add_post('/admin/login', self.login)
+        app.router.add_get('/admin/logout', self.logout)
+        app.router.add_get('/admin/api/stats', self.api_stats)
+        app.router.add_get('/admin/api/stream', self.api_stream)
+        app.router.add_get('/admin/api/metrics', self.api_metrics)
+        app.router.add_get('/admin/api/memory', self.api_memory)
+        app.router.add_post('/admin/api/memory', self.api_memory_trace)
+    
+    # ---- авторизация ----
+    
+    def _authorized(self, request) -> bool:
+        expires = self.sessions.get(request.cookies.get(COOKIE, ''))
+        return expires is not None and expires > time.time()
+    
+    async def login_form(self, request):
+        return web.Response(text=LOGIN_HTML, content_type='text/html')
+    
+    async def login(self, request):
+        form = await request.post()
+        if not self.password or not hmac.compare_digest(form.get('password', ''), self.password):
+            return web.Response(text="Неверный пароль", status=403)
+        
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        self.sessions = {t: exp for t, exp in self.sessions.items() if exp > now}
+        self.sessions[token] = now + 12 * 3600
+        
+        response = web.HTTPFound('/admin')
+        response.set_cookie(COOKIE, token, httponly=True, samesite='Strict', max_age=12 * 3600)
+        raise response
+    
+    async def logout(self, request):
+        self.sessions.pop(request.cookies.get(COOKIE, ''), None)
+        response = web.HTTPFound('/admin/login')
+        response.del_cookie(COOKIE)
+        raise response
+    
+    # ---- страницы и API ----
+    
+    def _viewed(self):
+        """Кто-то смотрит админку - будим обновление агрегатов после простоя"""
+        idle = time.monotonic() - self.last_seen > self.idle_after
+        self.last_seen = time.monotonic()
+        if idle:
+            self._wake.set()
     
-    return render_template('login.html')
+    async def page(self, request):
+        if not self._authorized(request):
+            raise web.HTTPFound('/admin/login')
+        self._viewed()
+        return web.Response(text=DASHBOARD_HTML, content_type='text/html')
+    
+    async def api_stats(self, request):
+        """Разделы, изменившиеся после ?since= (unix-время); без since - все"""
+        if not self._authorized(request):
+            raise web.HTTPUnauthorized()
+        self._viewed()
+        
+        try:
+            since = float(request.query.get('since', 0))
+        except ValueError:
+            raise web.HTTPBadRequest(text="since должен быть unix-временем")
+        
+        changed = {name: section['data'] for name, section in self.sections.items() if section['updated_at'] > since}
+        return web.json_response({'now': time.time(), 'sections': changed}, dumps=_dumps)
+    
+    async def api_metrics(self, request):
+        """Гистограмма задержки event loop для Prometheus (cookie или Authorization: Bearer <пароль>)"""
+        bearer = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not self._authorized(request) and not (self.password and hmac.compare_digest(bearer, self.password)):
+            raise web.HTTPUnauthorized()
+        monitor = self.sources and self.sources['loop']
+        if not monitor:
+            raise web.HTTPServiceUnavailable(text="loop monitor is off")
+        return web.Response(text=monitor.prometheus(), content_type='text/plain')
+    
+    async def api_memory(self, request):
+        """RSS во времени, топ выделений tracemalloc (?top=20, ?diff=1 - прирост) и размер сессий"""
+        if not self._authorized(request):
+            raise web.HTTPUnauthorized()
+        heap = self.sources and self.sources['heap']
+        if not heap:
+            raise web.HTTPServiceUnavailable(text="heap monitor is off")
+        
+        try:
+            limit = min(int(request.query.get('top', 20)), 200)
+        except ValueError:
+            raise web.HTTPBadRequest(text="top должен быть числом")
+        # Снимок кучи - заметная работа, не в потоке цикла
+        top = await asyncio.to_thread(heap.top, limit, request.query.get('diff') == '1')
+        sessions = self.sources['sessions']
+        return web.json_response({
+            **heap.summary(),
+            'top': top,
+            'sessions': sessions.summary() if sessions else None,
+        }, dumps=_dumps)
+    
+    async def api_memory_trace(self, request):
+        """Включить (trace=on) или выключить (trace=off) tracemalloc"""
+        if not self._authorized(request):
+            raise web.HTTPUnauthorized()
+        heap = self.sources and self.sources['heap']
+        if not heap:
+            raise web.HTTPServiceUnavailable(text="heap monitor is off")
+        
+        form = await request.post()
+        if form.get('trace') == 'on':
+            heap.start_trace()
+        elif form.get('trace') == 'off':
+            heap.stop_trace()
+        else:
+            raise web.HTTPBadRequest(text="trace=on или trace=off")
+        return web.json_response(heap.summary(), dumps=_dumps)
+    
+    async def api_stream(self, request):
+        """Server-sent events: пропускная способность раз в секунду"""
+        if not self._authorized(request):
+            raise web.HTTPUnauthorized()
+        self._viewed()
+        
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        })
+        await response.prepare(request)
+        try:
+            while True:
+                await response.write(f"data: {json.dumps(self.meter.snapshot())}\n\n".encode())
+                self.last_seen = time.monotonic()
+                await asyncio.sleep(1)
+        except ConnectionResetError:
+            pass  # админ закрыл вкладку
+        return response
+    
+    # ---- агрегаты ----
+    
+    def _update(self, name: str, data):
+        """Раздел получает новую отметку времени только если данные изменились"""
+        section = self.sections.get(name)
+        if section is None or section['data'] != data:
+            self.sections[name] = {'updated_at': time.time(), 'data': data}
+    
+    async def refresh(self):
+        """Пересчитать агрегаты (несколько параллельных запросов раз в refresh_interval)"""
+        db, usage, cache = self.sources['db'], self.sources['usage'], self.sources['cache']
+        
+        stats, subjects, today = await asyncio.gather(
+            db.get_stats(), db.get_subject_stats(), db.get_stats_today()
+        )
+        self._update('stats', stats)
+        self._update('subjects', subjects)
+        self._update('today', today)
+        if usage:
+            self._update('usage', usage.summary())
+        if cache:
+            self._update('cache', cache.local_stats())
+        if self.sources['lanes']:
+            self._update('lanes', self.sources['lanes'].stats())
+        if self.sources['loop']:
+            self._update('loop', self.sources['loop'].snapshot())
+        if self.sources['sessions']:
+            self._update('sessions', self.sources['sessions'].summary())
+        if self.sources['budget']:
+            self._update('budget', self.sources['budget'].summary())
+    
+    async def run(self):
+        """Фоновая задача: обновлять агрегаты, пока админку смотрят"""
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            
+            while self.sources and time.monotonic() - self.last_seen < self.idle_after:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    print(f"Admin refresh error: {e}")
+                await asyncio.sleep(self.refresh_interval)
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+LOGIN_HTML = """<!doctype html>
+<html lang="ru"><head><meta charset="utf-8"><title>Вход</title></head>
+<body style="font-family: sans-serif; max-width: 320px; margin: 80px auto">
+<form method="post" action="/admin/login">
+  <input type="password" name="password" placeholder="Пароль" autofocus style="width: 100%; padding: 8px">
+  <button type="submit" style="margin-top: 8px; padding: 8px 16px">Войти</button>
+</form>
+</body></html>
+"""
+
+DASHBOARD_HTML = """<!doctype html>
+<html lang="ru"><head><meta charset="utf-8"><title>Училка — админка</title>
+<style>
+  body { font-family: sans-serif; max-width: 960px; margin: 24px auto; }
+  section { border: 1px solid #ddd; border-radius: 6px; padding: 12px; margin-bottom: 12px; }
+  pre { margin: 0; white-space: pre-wrap; }
+  .live { font-size: 28px; }
+</style></head>
+<body>
+<h1>Училка — админка <a href="/admin/logout" style="font-size: 14px">выйти</a></h1>
+<section><h3>Поток вопросов</h3><div class="live" id="live">—</div></section>
+<div id="sections"></div>
+<script>
+  const state = {};
+  let since = 0;
+
+  async function poll() {
+    const r = await fetch('/admin/api/stats?since=' + since);
+    if (r.status === 401) { location = '/admin/login'; return; }
+    const body = await r.json();
+    since = body.now;
+    Object.assign(state, body.sections);
+    const root = document.getElementById('sections');
+    root.innerHTML = '';
+    for (const [name, data] of Object.entries(state)) {
+      const el = document.createElement('section');
+      el.innerHTML = '<h3>' + name + '</h3><pre></pre>';
+      el.querySelector('pre').textContent = JSON.stringify(data, null, 2);
+      root.appendChild(el);
+    }
+  }
 
-@app.route('/logout')
-def logout():
-    session.pop('logged_in', None)
-    return redirect('/login')
+  const live = new EventSource('/admin/api/stream');
+  live.onmessage = (e) => {
+    const s = JSON.parse(e.data);
+    document.getElementById('live').textContent =
+      s.per_minute + ' вопр./мин (из кеша ' + s.cached_per_minute + '), за секунду: ' + s.last_second;
+  };
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+  poll();
+  setInterval(poll, 15000);
+</script>
+</body></html>
+"""
@@ -0,0 +1,104 @@
+"""
+Бенчмарк сжатия ответов кеша: экономия места и стоимость CPU на операцию.
+
+    python benchmarks/bench_compression.py                      # синтетические тексты
+    python benchmarks/bench_compression.py --samples dump.ndjson  # строки {"subject", "text"}
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from compression import Compressor, train_dict, zstd
+from prompts import PROMPTS
+
+PHRASES = [
+    "Давай разберём по шагам.", "Сначала вспомни правило:", "Например,", "Обрати внимание на",
+    "Это похоже на", "Попробуй сам следующий шаг.", "Формула выглядит так:", "В этом случае",
+    "Подставь значения в", "Типичная ошибка -", "Артикль зависит от рода:", "Время глагола показывает",
+]
+
+def synthetic_samples(count: int) -> dict:
+    """Тексты в стиле ответов бота по каждому предмету"""
+    rnd = random.Random(42)
+    samples = {}
+    for subject, prompt in PROMPTS.items():
+        words = prompt.split()
+        samples[subject] = [
+            " ".join(rnd.choice(PHRASES) + " " + " ".join(rnd.sample(words, 12)) for _ in range(3))
+            for _ in range(count)
+        ]
+    return samples
+
+def load_samples(path: str) -> dict:
+    samples = {}
+    with open(path) as f:
+        for line in f:
+            row = json.loads(line)
+            samples.setdefault(row["subject"], []).append(row["text"])
+    return samples
+
+def measure(pack, unpack, texts: list) -> dict:
+    raw = sum(len(t.encode()) for t in texts)
+    
+    started = time.perf_counter()
+    packed = [pack(t) for t in texts]
+    pack_time = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    for p in packed:
+        unpack(p)
+    unpack_time = time.perf_counter() - started
+    
+    stored = sum(len(p) for p in packed)
+    return {
+        'raw': raw,
+        'stored': stored,
+        'ratio': raw / stored if stored else 0,
+        'pack_us': pack_time / len(texts) * 1e6,
+        'unpack_us': unpack_time / len(texts) * 1e6,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", help="NDJSON с полями subject и text")
+    parser.add_argument("--count", type=int, default=500, help="синтетических текстов на предмет")
+    parser.add_argument("--dict-size", type=int, default=16 * 1024)
+    args = parser.parse_args()
+    
+    if zstd is None:
+        sys.exit("zstandard не установлен: pip install zstandard")
+    
+    samples = load_samples(args.samples) if args.samples else synthetic_samples(args.count)
+    
+    print(f"{'предмет':<10} {'вариант':<12} {'сырой':>9} {'хранимый':>9} {'сжатие':>7} {'pack мкс':>9} {'unpack мкс':>11}")
+    for subject, texts in samples.items():
+        # Словарь учим на половине выборки, меряем на другой
+        train, test = texts[::2], texts[1::2]
+        
+        plain = Compressor(dict_dir="", enabled=True)
+        with_dict = Compressor(dict_dir="", enabled=True)
+        with_dict.add_dict(subject, train_dict(train, args.dict_size))
+        
+        variants = {
+            # Все варианты хранятся как base64 - так же, как в колонке *_z
+            'zlib': (
+                lambda t: base64.b64encode(zlib.compress(t.encode(), 9)).decode(),
+                lambda p: zlib.decompress(base64.b64decode(p)).decode()
+            ),
+            'zstd': (lambda t: plain.pack(t, subject), plain.unpack),
+            'zstd+dict': (lambda t: with_dict.pack(t, subject), with_dict.unpack),
+        }
+        for name, (pack, unpack) in variants.items():
+            r = measure(pack, unpack, test)
+            print(f"{subject:<10} {name:<12} {r['raw']:>9} {r['stored']:>9} {r['ratio']:>6.2f}x "
+                  f"{r['pack_us']:>9.1f} {r['unpack_us']:>11.1f}")
+
+if __name__ == "__main__":
+    main()
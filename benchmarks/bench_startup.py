@@ -0,0 +1,56 @@
+"""
+Бенчмарк холодного старта: время импорта bot.py до ответа health-эндпоинта
+в сравнении с прежним порядком (все SDK импортируются сразу).
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 5 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+VARIANTS = {
+    # Что импортируется до старта health-сервера сейчас
+    'lazy': "import bot",
+    # Прежний порядок: aiogram, handlers и оба SDK на верхнем уровне
+    'eager': "import bot, aiogram, handlers, groq, supabase",
+}
+
+def import_times(code: str) -> dict:
+    """Накопленное время импорта (мкс) по модулям верхнего уровня из -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Модули верхнего уровня идут без отступа в имени
+        if not name.startswith("  "):
+            times[name.strip()] = int(cumulative)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="сколько самых тяжёлых модулей показать")
+    args = parser.parse_args()
+    
+    for variant, code in VARIANTS.items():
+        runs = [import_times(code) for _ in range(args.runs)]
+        totals = [sum(times.values()) / 1000 for times in runs]
+        print(f"{variant:<6} медиана {statistics.median(totals):8.1f} мс  "
+              f"(мин {min(totals):.1f}, макс {max(totals):.1f}, запусков {args.runs})")
+        
+        heaviest = sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)[:args.top]
+        for name, us in heaviest:
+            print(f"    {name:<30} {us / 1000:8.1f} мс")
+
+if __name__ == "__main__":
+    main()
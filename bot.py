@@ -1,27 +1,35 @@
 import asyncio
+import importlib
 import logging
-from aiogram import Bot, Dispatcher
 from aiohttp import web
 
 from config import Config
-from handlers import router
-from groq_client import GroqRouter
-from vision import VisionProcessor
-from cache import Cache
-from db import Database
+from lifecycle import Lifecycle
+from admin_web import AdminDashboard
+from loopmon import LoopMonitor
+from heap import HeapMonitor
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Тяжёлые модули (aiogram и SDK) загружаются после старта health-сервера
+HEAVY_MODULES = ("aiogram", "handlers")
+
 async def health_check(request):
     """Endpoint для UptimeRobot - держит Render живым"""
+    # При остановке отвечаем 503, чтобы платформа увела трафик на новый экземпляр
+    if request.app['lifecycle'].draining:
+        return web.Response(text="draining", status=503)
     return web.Response(text="OK", status=200)
 
-async def start_health_server():
-    """Мини-сервер для UptimeRobot"""
+async def start_health_server(lifecycle: Lifecycle, admin: AdminDashboard | None = None):
+    """Мини-сервер для UptimeRobot (и веб-админка на том же порту)"""
     app = web.Application()
+    app['lifecycle'] = lifecycle
     app.router.add_get('/health', health_check)
     app.router.add_get('/', health_check)
+    if admin:
+        admin.setup(app)
     
     runner = web.AppRunner(app)
     await runner.setup()
@@ -30,51 +38,321 @@ async def start_health_server():
     await site.start()
     logger.info("Health server started on port 8000")
 
+async def prepare_clients(*layers) -> bool:
+    """Создать клиенты Groq и Supabase в потоках (импорт SDK не блокирует цикл)"""
+    # Ждём все потоки: иначе после ошибки одного другой ещё держал бы блокировку клиента
+    results = await asyncio.gather(*(asyncio.to_thread(layer.prepare) for layer in layers), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    for e in errors:
+        # Клиент создастся при первом обращении - готовность не задерживаем
+        print(f"Clients prepare error: {e}")
+    return not errors
+
+async def start_when_ready(ready: asyncio.Task, start):
+    """Фоновая задача, которой нужны клиенты: ждёт их готовности, а не блокировку в потоке цикла"""
+    await asyncio.shield(ready)
+    await start()
+
+def import_heavy_modules():
+    """Импорт тяжёлых модулей (выполняется в потоке, health уже отвечает)"""
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
 async def main():
     config = Config()
+    lifecycle = Lifecycle(drain_timeout=config.SHUTDOWN_TIMEOUT)
+    # Задержка event loop с первых секунд: импорт и инициализация тоже могут блокировать цикл
+    loop_monitor = LoopMonitor(threshold_ms=config.LOOP_BLOCK_MS, debug=config.LOOP_DEBUG) \
+        if config.LOOP_MONITOR else None
+    if loop_monitor:
+        loop_monitor.start()
+    # RSS с самого старта; tracemalloc - только по MEMORY_TRACE или из админки
+    heap = HeapMonitor(interval=config.MEMORY_SAMPLE_INTERVAL, trace=config.MEMORY_TRACE)
+    heap_task = asyncio.create_task(heap.run())
+    # Маршруты админки регистрируются сразу, источники данных подключаются позже
+    admin = AdminDashboard(config.ADMIN_PASSWORD, refresh_interval=config.ADMIN_REFRESH_INTERVAL) \
+        if config.ADMIN_PASSWORD else None
+    
+    # Health-эндпоинт первым: платформа видит живой сервис, пока грузится остальное
+    await start_health_server(lifecycle, admin)
+    await asyncio.to_thread(import_heavy_modules)
+    
+    from aiogram import Bot, Dispatcher
+    from handlers import router, SUBJECTS
+    from groq_client import GroqRouter
+    from vision import VisionProcessor
+    from cache import Cache
+    from db import Database
+    from datalayer import DataLayer
+    from local_store import LocalStore, LocalSync
+    from history import ConversationHistory
+    from warmup import CacheWarmer
+    from retention import CacheRetention
+    from users import UserProfiles
+    from compression import Compressor
+    from exercises import BatchSolver
+    from usage import UsageTracker
+    from ratelimit import MemoryRateLimiter, RedisRateLimiter, RateLimitMiddleware
+    from replay import TrafficRecorder
+    from outbox import SendQueue
+    from lanes import LaneScheduler
+    from speculation import Speculator
+    from fastpath import LocalAnswerer
+    from namespaces import CacheNamespaces, Regenerator
+    from export import Exporter
+    from sessions import BlobStore, TTLMemoryStorage
+    from budget import AnswerBudget
     
     # Инициализация компонентов
     bot = Bot(token=config.BOT_TOKEN)
-    dp = Dispatcher()
+    # Сессии FSM: большие значения (распознанный текст) - сжатыми и с вытеснением, простой - TTL
+    sessions = TTLMemoryStorage(
+        BlobStore(max_bytes=int(config.SESSION_BLOB_MB * 1024 * 1024)),
+        ttl=config.SESSION_TTL,
+        inline_limit=config.SESSION_INLINE_LIMIT
+    )
+    dp = Dispatcher(storage=sessions)
     
-    # Groq с rotation API ключей
-    groq_router = GroqRouter(config.GROQ_API_KEYS)
+    # Все запросы к чатам - через очередь чата: порядок, лимиты Telegram, RetryAfter, склейка и нарезка
+    send_queue = SendQueue(
+        global_rate=config.SEND_GLOBAL_RATE,
+        chat_rate=config.SEND_CHAT_RATE,
+        chat_burst=config.SEND_CHAT_BURST
+    )
+    bot.session.middleware(send_queue)
+    
+    # Полосы работы: быстрые ответы не ждут за OCR и LLM (свои слоты и потоки)
+    lanes = LaneScheduler({'fast': config.LANE_FAST, 'llm': config.LANE_LLM, 'vision': config.LANE_VISION})
+    
+    # Распаковка сжатых записей работает всегда, сжатие новых - по флагу
+    compressor = Compressor(dict_dir=config.ZSTD_DICT_DIR, enabled=config.COMPRESSION_ENABLED)
+    # Один асинхронный клиент Supabase на Cache и Database
+    data_layer = DataLayer(config.SUPABASE_URL, config.SUPABASE_KEY, timeout=config.SUPABASE_TIMEOUT)
+    # Локальный SQLite: кеш и журнал работают и при недоступном Supabase
+    store = LocalStore(
+        config.LOCAL_STORE_PATH, executor=lanes['fast'].executor, max_rows=config.LOCAL_STORE_MAX_ROWS
+    ) if config.LOCAL_STORE_PATH else None
+    db = Database(data_layer, compressor=compressor, store=store, meter=admin.meter if admin else None)
+    # Версия промпта и моделей - часть ключа кеша; старые ответы живут ещё CACHE_NAMESPACE_GRACE_HOURS
+    namespaces = CacheNamespaces(db, grace_hours=config.CACHE_NAMESPACE_GRACE_HOURS) if config.CACHE_NAMESPACES else None
+    cache = Cache(
+        data_layer,
+        local_size=config.CACHE_LOCAL_SIZE,
+        compressor=compressor,
+        store=store,
+        remote_timeout=config.CACHE_REMOTE_TIMEOUT if store else None,
+        namespaces=namespaces
+    )
+    # Учёт токенов; прогноз квоты определяет, какой ключ брать следующим
+    usage = UsageTracker(
+        db, config.GROQ_API_KEYS,
+        daily_quota=config.GROQ_DAILY_TOKEN_QUOTA,
+        flush_interval=config.USAGE_FLUSH_INTERVAL
+    )
+    # Groq с rotation API ключей (клиенты создаются при первом обращении)
+    # Лимит ответа под вопрос: учится на длине ответов, экономия - против контрольной группы с 384
+    budget = AnswerBudget(enabled=config.ANSWER_BUDGET, control_share=config.ANSWER_BUDGET_CONTROL)
+    groq_router = GroqRouter(config.GROQ_API_KEYS, usage=usage, lanes=lanes, budget=budget)
     vision = VisionProcessor(groq_router)
-    cache = Cache(config.SUPABASE_URL, config.SUPABASE_KEY)
-    db = Database(config.SUPABASE_URL, config.SUPABASE_KEY)
+    # Ответы, отданные из прошлой версии кеша, перегенерируются в фоне с ограничением скорости
+    regenerator = Regenerator(groq_router, cache, per_minute=config.CACHE_REGEN_PER_MINUTE, lanes=lanes)
+    cache.on_stale = regenerator.submit
+    # Арифметика, уравнения и словарь отвечаются локально, до кеша и Groq
+    answerer = LocalAnswerer(
+        dict_dir=config.FASTPATH_DICT_DIR,
+        enabled=config.FASTPATH_ENABLED,
+        reveal_arithmetic=config.FASTPATH_ARITHMETIC_RESULT
+    )
+    # Объяснение задания готовится сразу после OCR (в пределах бюджета и без давления на LLM)
+    speculator = Speculator(
+        groq_router,
+        daily_budget=config.SPECULATION_BUDGET,
+        ttl=config.SPECULATION_TTL,
+        max_prompts=config.SPECULATION_MAX_PROMPTS,
+        lanes=lanes,
+        usage=usage
+    )
+    local_sync = LocalSync(store, cache, db, interval=config.LOCAL_SYNC_INTERVAL) if store else None
+    # Потоковая выгрузка таблиц (/export и python export.py)
+    exporter = Exporter(db, config.EXPORT_DIR)
+    history = ConversationHistory(
+        groq_router,
+        token_budget=config.HISTORY_TOKEN_BUDGET,
+        prompt_budget=config.PROMPT_TOKEN_BUDGET,
+        subject_names=SUBJECTS
+    )
+    warmer = CacheWarmer(
+        cache, db, groq_router,
+        per_subject=config.WARMUP_PER_SUBJECT,
+        pregen_budget=config.WARMUP_PREGEN_BUDGET,
+        offpeak_hours=config.WARMUP_OFFPEAK_HOURS
+    )
+    users = UserProfiles(db, capacity=config.USERS_BLOOM_CAPACITY)
+    batch = BatchSolver(per_user=config.BATCH_CONCURRENCY, max_exercises=config.BATCH_MAX_EXERCISES)
+    retention = CacheRetention(
+        db,
+        cache=cache,
+        max_rows=config.CACHE_MAX_ROWS,
+        max_bytes=config.CACHE_MAX_MB * 1024 * 1024,
+        interval=config.CACHE_RETENTION_HOURS * 3600
+    )
+    
+    # Запись трафика для регрессии задержки: ответы Groq и Supabase с таймингами
+    recorder = None
+    if config.RECORD_TRAFFIC_PATH:
+        recorder = TrafficRecorder(config.RECORD_TRAFFIC_PATH, sample=config.RECORD_TRAFFIC_SAMPLE)
+        recorder.wrap_datalayer(data_layer)
+        recorder.wrap_groq(groq_router)
+    
+    # Клиенты Groq и Supabase независимы - создаём параллельно в потоках.
+    # В ленивом режиме не ждём: polling стартует сразу, клиенты готовятся в фоне. Всё, что
+    # ходит в БД или Groq, сначала ждёт clients_ready: иначе первое обращение к клиенту
+    # ждало бы в потоке цикла, пока поток подготовки импортирует SDK
+    clients_ready = asyncio.create_task(prepare_clients(groq_router, data_layer))
+    if not config.LAZY_INIT:
+        await clients_ready
+    
+    # Остановка: новые апдейты не берём, текущие ответы дожидаемся
+    dp.message.outer_middleware(lifecycle.middleware)
+    dp.callback_query.outer_middleware(lifecycle.middleware)
+    
+    # Лимиты на пользователя: отказ до скачивания фото и запросов к LLM
+    limits = {'text': config.RATE_LIMIT_TEXT, 'photo': config.RATE_LIMIT_PHOTO, 'admin': config.RATE_LIMIT_ADMIN}
+    if config.RATE_LIMIT_REDIS_URL:
+        limiter = RedisRateLimiter(config.RATE_LIMIT_REDIS_URL, limits)
+    else:
+        limiter = MemoryRateLimiter(limits)
+    rate_limit = RateLimitMiddleware(limiter, config.ADMIN_IDS)
+    dp.message.middleware(rate_limit)
+    dp.callback_query.middleware(rate_limit)
+    # Слот полосы на время обработки: фото - vision, команды и кнопки - fast
+    dp.message.middleware(lanes.middleware)
+    dp.callback_query.middleware(lanes.middleware)
+    if recorder:
+        dp.message.middleware(recorder.middleware)
     
     # Middleware для внедрения зависимостей
     @dp.message.middleware()
     async def inject_dependencies(handler, event, data):
+        if not clients_ready.done():
+            await asyncio.shield(clients_ready)
         data['groq'] = groq_router
         data['vision'] = vision
         data['cache'] = cache
         data['db'] = db
+        data['history'] = history
+        data['warmer'] = warmer
+        data['retention'] = retention
+        data['users'] = users
+        data['local_sync'] = local_sync
+        data['batch'] = batch
+        data['usage'] = usage
+        data['rate_limit'] = rate_limit
+        data['send_queue'] = send_queue
+        data['lanes'] = lanes
+        data['speculator'] = speculator
+        data['answerer'] = answerer
+        data['regenerator'] = regenerator
+        data['exporter'] = exporter
+        data['loop_monitor'] = loop_monitor
+        data['sessions'] = sessions
+        data['heap'] = heap
+        data['budget'] = budget
         data['config'] = config  # ← ДОБАВЬ config сюда!
         return await handler(event, data)
     
     @dp.callback_query.middleware()
     async def inject_dependencies_callback(handler, event, data):
+        if not clients_ready.done():
+            await asyncio.shield(clients_ready)
         data['groq'] = groq_router
         data['vision'] = vision
         data['cache'] = cache
         data['db'] = db
+        data['history'] = history
+        data['warmer'] = warmer
+        data['retention'] = retention
+        data['users'] = users
+        data['local_sync'] = local_sync
+        data['batch'] = batch
+        data['usage'] = usage
+        data['rate_limit'] = rate_limit
+        data['send_queue'] = send_queue
+        data['lanes'] = lanes
+        data['speculator'] = speculator
+        data['answerer'] = answerer
+        data['regenerator'] = regenerator
+        data['exporter'] = exporter
+        data['loop_monitor'] = loop_monitor
+        data['sessions'] = sessions
+        data['heap'] = heap
+        data['budget'] = budget
         data['config'] = config  # ← ДОБАВЬ config сюда!
         return await handler(event, data)
     
     dp.include_router(router)
     
-    # Запускаем health-сервер и polling параллельно
     logger.info("Starting bot...")
     logger.info(f"Admin IDs: {config.ADMIN_IDS}")  # ← Логируем для проверки
     
-    await asyncio.gather(
-        start_health_server(),
-        dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
-    )
+    # Прогрев кеша в фоне - polling стартует не дожидаясь
+    warmup_task = asyncio.create_task(start_when_ready(clients_ready, warmer.run))
+    retention_task = asyncio.create_task(start_when_ready(clients_ready, retention.run))
+    users_task = asyncio.create_task(start_when_ready(clients_ready, users.run))
+    sync_task = asyncio.create_task(start_when_ready(clients_ready, local_sync.run)) if local_sync else None
+    usage_task = asyncio.create_task(start_when_ready(clients_ready, usage.run))
+    namespaces_task = asyncio.create_task(start_when_ready(clients_ready, namespaces.load)) if namespaces else None
+    regen_task = asyncio.create_task(start_when_ready(clients_ready, regenerator.run))
+    sessions_task = asyncio.create_task(sessions.run())
+    admin_task = None
+    if admin:
+        admin.attach(db, usage=usage, cache=cache, lanes=lanes, loop_monitor=loop_monitor,
+                     heap=heap, sessions=sessions, budget=budget)
+        admin_task = asyncio.create_task(start_when_ready(clients_ready, admin.run))
+    background = [
+        t for t in (clients_ready, warmup_task, retention_task, users_task, sync_task, usage_task,
+                    namespaces_task, regen_task, sessions_task, heap_task, admin_task) if t
+    ]
+    
+    async def stop_background():
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+    
+    # Порядок важен: остановить фоновые циклы, сбросить буферы, закрыть соединения
+    lifecycle.on_shutdown("background", stop_background)
+    lifecycle.on_shutdown("cache writes", cache.wait_background)
+    lifecycle.on_shutdown("history", history.wait_background)
+    lifecycle.on_shutdown("users", users.flush)
+    lifecycle.on_shutdown("cache hits", cache.flush_hits)
+    lifecycle.on_shutdown("usage", usage.flush)
+    if recorder:
+        lifecycle.on_shutdown("traffic recorder", recorder.flush)
+    if local_sync:
+        lifecycle.on_shutdown("local sync", local_sync.sync_once)
+    lifecycle.on_shutdown("send queue", send_queue.drain)
+    lifecycle.on_shutdown("supabase", data_layer.close)
+    if store:
+        lifecycle.on_shutdown("local store", store.close)
+    lifecycle.on_shutdown("bot session", bot.session.close)
+    lifecycle.on_shutdown("lanes", lanes.shutdown)
+    if loop_monitor:
+        lifecycle.on_shutdown("loop monitor", loop_monitor.stop)
+    
+    # SIGTERM обрабатываем сами; сессию бота закрываем после дренажа, а не вместе с polling
+    lifecycle.install_signals(dp.stop_polling)
+    try:
+        await dp.start_polling(
+            bot,
+            allowed_updates=dp.resolve_used_update_types(),
+            handle_signals=False,
+            close_bot_session=False
+        )
+    finally:
+        await lifecycle.shutdown()
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
-        logger.info("Bot stopped")
\ No newline at end of file
+        logger.info("Bot stopped")
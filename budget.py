@@ -0,0 +1,160 @@
+import math
+import random
+import re
+from collections import deque
+
+from groq_client import SIMPLE_MODEL, MEDIUM_MODEL, COMPLEX_MODEL, GENERATION
+
+# Прежний фиксированный лимит - с ним сравнивается контрольная группа
+BASELINE_MAX_TOKENS = GENERATION['max_tokens']
+
+# Бюджет по типу вопроса, пока по связке предмет/модель/тип мало наблюдений
+PRIORS = {'short': 192, 'question': 320, 'explain': 448, 'followup': 384, 'exercise': 512, 'ocr': 640}
+# Потолок: разбор задания с фото может быть длинным, ответ на короткий вопрос - нет
+CEILINGS = {'short': 384, 'question': 512, 'explain': 768, 'followup': 640, 'exercise': 768, 'ocr': 1024}
+FLOOR = 96
+
+# Модель начинает писать за ученика или повторять формат промпта - ответ уже закончен
+STOP_SEQUENCES = ["\nУченик:", "\nВопрос ученика:", "\nКонтекст ("]
+# gpt-oss рассуждает в тех же completion-токенах: стоп-последовательности только для llama,
+# а пока наблюдений мало - лимит не ниже прежнего
+STOP_MODELS = (SIMPLE_MODEL, MEDIUM_MODEL)
+REASONING_MODELS = (COMPLEX_MODEL,)
+# Служебные запросы со своим лимитом
+SKIP_KINDS = ('health',)
+
+EXPLAIN = re.compile(r'(объясни|почему|докажи|разбери|сравни|проанализируй|explain|why)', re.IGNORECASE)
+
+def question_type(messages: list) -> str:
+    """Тип запроса по последнему сообщению и наличию истории диалога"""
+    question = messages[-1]['content']
+    if question.startswith("Контекст (задание с фото)"):
+        return 'exercise'
+    if question.startswith("Контекст (распознанный текст)"):
+        return 'ocr'
+    if any(message['role'] == 'assistant' for message in messages):
+        return 'followup'
+    if EXPLAIN.search(question):
+        return 'explain'
+    return 'short' if len(question) < 50 else 'question'
+
+class _Bucket:
+    def __init__(self, window: int):
+        self.lengths = deque(maxlen=window)    # completion_tokens последних ответов
+        self.truncated = deque(maxlen=window)  # обрезан ли ответ лимитом
+        self.headroom = 1.25
+
+class AnswerBudget:
+    """
+    max_tokens и стоп-последовательности на каждый запрос: p95 длины ответа по предмету,
+    модели и типу вопроса (из usage.completion_tokens) с запасом. Обрезанный ответ
+    (finish_reason=length) увеличивает запас связки. Доля control_share запросов идёт
+    с прежним лимитом 384 - по ней считается экономия токенов и задержки.
+    """
+    
+    def __init__(self, enabled: bool = True, control_share: float = 0.05, window: int = 200,
+                 min_samples: int = 20, quantile: float = 0.95):
+        self.enabled = enabled
+        self.control_share = control_share
+        self.window = window
+        self.min_samples = min_samples
+        self.quantile = quantile
+        self.buckets = {}  # (предмет, модель, тип) -> _Bucket
+        
+        self.groups = {
+            name: {'calls': 0, 'reserved': 0, 'completion': 0, 'truncated': 0, 'latency_ms': deque(maxlen=1000)}
+            for name in ('adaptive', 'control')
+        }
+        self.stats = {'reserved_saved': 0, 'rescued': 0}
+    
+    def predict(self, key: tuple, qtype: str) -> int:
+        bucket = self.buckets.get(key)
+        if bucket is None or len(bucket.lengths) < self.min_samples:
+            if bucket is not None and any(bucket.truncated):
+                return CEILINGS[qtype]  # стартовое значение уже обрезало ответ - не повторяем
+            if key[1] in REASONING_MODELS:
+                return max(PRIORS[qtype], BASELINE_MAX_TOKENS)
+            return PRIORS[qtype]
+        ordered = sorted(bucket.lengths)
+        needed = ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))] * bucket.headroom
+        # Кратно 16: лимит не дёргается от каждого ответа
+        return min(max(math.ceil(needed / 16) * 16, FLOOR), CEILINGS[qtype])
+    
+    def plan(self, messages: list, model: str, subject: str | None = None, kind: str = "text") -> dict | None:
+        """Параметры запроса; None - оставить вызывающему (выключено или служебный запрос)"""
+        if not self.enabled or kind in SKIP_KINDS:
+            return None
+        qtype = question_type(messages)
+        key = (subject or '-', model, qtype)
+        if random.random() < self.control_share:
+            return {'key': key, 'qtype': qtype, 'max_tokens': BASELINE_MAX_TOKENS, 'stop': None, 'group': 'control'}
+        return {
+            'key': key,
+            'qtype': qtype,
+            'max_tokens': self.predict(key, qtype),
+            'stop': STOP_SEQUENCES if model in STOP_MODELS else None,
+            'group': 'adaptive',
+        }
+    
+    def observe(self, plan: dict, response, latency: float):
+        """Учесть ответ: длину, обрезку лимитом и задержку"""
+        completion = getattr(getattr(response, 'usage', None), 'completion_tokens', None)
+        if completion is None:
+            return
+        truncated = response.choices[0].finish_reason == 'length'
+        
+        group = self.groups[plan['group']]
+        group['calls'] += 1
+        group['reserved'] += plan['max_tokens']
+        group['completion'] += completion
+        group['truncated'] += truncated
+        group['latency_ms'].append(latency * 1000)
+        if plan['group'] == 'adaptive':
+            self.stats['reserved_saved'] += BASELINE_MAX_TOKENS - plan['max_tokens']
+            if completion >= BASELINE_MAX_TOKENS and not truncated:
+                self.stats['rescued'] += 1  # с лимитом 384 этот ответ был бы обрезан
+        
+        bucket = self.buckets.setdefault(plan['key'], _Bucket(self.window))
+        bucket.lengths.append(completion)
+        if plan['group'] == 'control':
+            return  # обрезка при 384 - свойство контрольной группы, а не ошибка прогноза
+        bucket.truncated.append(truncated)
+        if truncated:
+            bucket.headroom = min(bucket.headroom + 0.15, 2.0)
+        else:
+            bucket.headroom = max(bucket.headroom - 0.005, 1.1)
+    
+    def _group_summary(self, name: str) -> dict:
+        group = self.groups[name]
+        calls = group['calls']
+        latency = sorted(group['latency_ms'])
+        return {
+            'calls': calls,
+            'avg_max_tokens': round(group['reserved'] / calls) if calls else None,
+            'avg_completion': round(group['completion'] / calls) if calls else None,
+            'truncation_rate': round(group['truncated'] / calls, 3) if calls else None,
+            'latency_p50_ms': round(latency[len(latency) // 2]) if latency else None,
+            'ms_per_token': round(sum(latency) / max(group['completion'], 1), 2) if calls else None,
+        }
+    
+    def summary(self) -> dict:
+        adaptive, control = self._group_summary('adaptive'), self._group_summary('control')
+        latency_saved = None
+        if adaptive['latency_p50_ms'] is not None and control['latency_p50_ms'] is not None:
+            latency_saved = control['latency_p50_ms'] - adaptive['latency_p50_ms']
+        busiest = sorted(self.buckets.items(), key=lambda item: -len(item[1].lengths))[:10]
+        return {
+            'adaptive': adaptive,
+            'control': control,
+            **self.stats,
+            'latency_p50_saved_ms': latency_saved,
+            'buckets': {
+                "/".join(key): {
+                    'max_tokens': self.predict(key, key[2]),
+                    'samples': len(bucket.lengths),
+                    'truncation_rate': round(sum(bucket.truncated) / len(bucket.truncated), 3)
+                    if bucket.truncated else None,
+                }
+                for key, bucket in busiest
+            },
+        }
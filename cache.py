@@ -1,49 +1,247 @@
-from supabase import create_client
+from collections import OrderedDict, Counter
+import asyncio
 import hashlib
 
+from compression import read_column
+
 class Cache:
-    def __init__(self, supabase_url, supabase_key):
-        self.db = create_client(supabase_url, supabase_key)
+    def __init__(self, data, local_size: int = 2000, compressor=None, store=None, remote_timeout: float | None = None,
+                 namespaces=None):
+        self.data = data  # общий DataLayer
+        self.namespaces = namespaces  # CacheNamespaces: версия промпта и моделей в ключе
+        self.on_stale = None  # вызывается, когда ответ отдан из прошлой версии (перегенерация)
+        self.stale_hits = 0
+        self.truncated_skipped = 0  # ответы, обрезанные max_tokens, в кеш не попали
+        self.compressor = compressor
+        self.store = store  # LocalStore (SQLite) - надёжный локальный уровень, может отсутствовать
+        self.remote_timeout = remote_timeout  # при наличии store не ждём медленный Supabase
+        self._background = set()  # фоновые записи, на которые не ждём ответа
+        
+        # Локальный уровень (LRU в памяти процесса): key -> (response, hit_count)
+        self.local = OrderedDict()
+        self.local_size = local_size
+        self.local_hits = 0
+        self.pending_hits = Counter()  # хиты из локального уровня, ещё не записанные в Supabase
     
-    def _hash_query(self, subject: str, question: str) -> str:
-        """Хеш для кеша"""
+    def _digest(self, subject: str, question: str) -> str:
         content = f"{subject}:{question.lower().strip()}"
         return hashlib.md5(content.encode()).hexdigest()
     
+    def _hash_query(self, subject: str, question: str) -> str:
+        """Ключ кеша (в текущей версии промпта и моделей)"""
+        digest = self._digest(subject, question)
+        return self.namespaces.key(subject, digest) if self.namespaces else digest
+    
+    def _local_put(self, cache_key: str, response: str, hit_count: int = 0):
+        self.local[cache_key] = (response, hit_count)
+        self.local.move_to_end(cache_key)
+        while len(self.local) > self.local_size:
+            self.local.popitem(last=False)
+    
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+    
+    async def wait_background(self):
+        """Дождаться фоновых записей (при остановке процесса)"""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+    
+    async def _update_hits(self, cache_key: str, hit_count: int):
+        try:
+            await self.data.execute(
+                self.data.table('cache')
+                .update({'hit_count': hit_count})
+                .eq('key', cache_key)
+            )
+        except Exception as e:
+            print(f"Cache hit_count update error: {e}")
+    
+    def preload(self, cache_key: str, response: str, hit_count: int = 0):
+        """Положить готовую запись в локальный уровень (прогрев)"""
+        self._local_put(cache_key, response, hit_count)
+    
     async def get(self, subject: str, question: str) -> str | None:
         """Получить из кеша"""
-        cache_key = self._hash_query(subject, question)
+        keys = [self._hash_query(subject, question)]
+        
+        # В переходный период после смены промпта/моделей годится и ответ прошлой версии
+        stale_key = self.namespaces.stale_key(subject, self._digest(subject, question)) if self.namespaces else None
+        if stale_key:
+            keys.append(stale_key)
+        
+        cache_key, response = await self._lookup(subject, question, keys)
+        if response and cache_key != keys[0]:
+            self.stale_hits += 1
+            if self.on_stale:
+                self.on_stale(subject, question)
+        return response
+    
+    async def _lookup(self, subject: str, question: str, keys: list) -> tuple[str | None, str | None]:
+        """Первый найденный по порядку ключей ответ: память, SQLite, Supabase (один запрос)"""
+        # Сначала локальный уровень - без сетевого запроса
+        for cache_key in keys:
+            if cache_key in self.local:
+                self.local.move_to_end(cache_key)
+                self.local_hits += 1
+                self.pending_hits[cache_key] += 1
+                return cache_key, self.local[cache_key][0]
+        
+        # Затем SQLite - переживает рестарты и недоступность Supabase
+        if self.store:
+            try:
+                for cache_key in keys:
+                    stored = await self.store.get(cache_key)
+                    if stored:
+                        self._local_put(cache_key, stored[0], stored[1])
+                        self.pending_hits[cache_key] += 1
+                        return cache_key, stored[0]
+            except Exception as e:
+                print(f"Cache local store error: {e}")
         
         try:
-            result = self.db.table('cache') \
-                .select('response') \
-                .eq('key', cache_key) \
-                .execute()
+            query = self.data.table('cache').select('key', 'response', 'response_z', 'hit_count')
+            result = await self.data.execute(
+                query.eq('key', keys[0]) if len(keys) == 1 else query.in_('key', keys),
+                timeout=self.remote_timeout,
+                attempts=1 if self.store else None
+            )
             
-            if result.data:
-                # Обновляем счетчик использования
-                self.db.table('cache') \
-                    .update({'hit_count': result.data[0].get('hit_count', 0) + 1}) \
-                    .eq('key', cache_key) \
-                    .execute()
+            rows = {row.get('key', keys[0]): row for row in result.data}
+            cache_key = next((key for key in keys if key in rows), None)
+            response = read_column(self.compressor, rows[cache_key], 'response') if cache_key else None
+            if response:
+                hit_count = (rows[cache_key].get('hit_count') or 0) + 1
+                
+                # Обновляем счетчик использования в фоне - ответ не ждёт второго round-trip
+                self._spawn(self._update_hits(cache_key, hit_count))
                 
-                return result.data[0]['response']
+                self._local_put(cache_key, response, hit_count)
+                if self.store:
+                    self._spawn(self.store.put(cache_key, subject, question[:500], response, hit_count, synced=True))
+                return cache_key, response
         except Exception as e:
             print(f"Cache get error: {e}")
         
-        return None
+        return None, None
+    
+    async def get_many(self, subject: str, questions: list) -> dict:
+        """Найти готовые ответы для списка вопросов одним запросом (без учёта хитов)"""
+        keys = {self._hash_query(subject, q): q for q in questions}
+        if not keys:
+            return {}
+        
+        try:
+            result = await self.data.execute(
+                self.data.table('cache')
+                .select('key', 'response', 'response_z', 'hit_count')
+                .in_('key', list(keys))
+            )
+            
+            for row in result.data:
+                row['response'] = read_column(self.compressor, row, 'response')
+            return {row['key']: row for row in result.data if row['response']}
+        except Exception as e:
+            print(f"Cache get_many error: {e}")
+            return {}
+    
+    async def flush_hits(self):
+        """Записать в Supabase хиты, набранные локальным уровнем"""
+        pending, self.pending_hits = self.pending_hits, Counter()
+        
+        updates = []
+        for cache_key, hits in pending.items():
+            entry = self.local.get(cache_key)
+            if entry is None:
+                continue
+            
+            hit_count = entry[1] + hits
+            self.local[cache_key] = (entry[0], hit_count)
+            updates.append(self._update_hits(cache_key, hit_count))
+        
+        await asyncio.gather(*updates)
+    
+    async def forget(self, keys: list):
+        """Убрать записи, удалённые из Supabase, из памяти и SQLite"""
+        for cache_key in keys:
+            self.local.pop(cache_key, None)
+            self.pending_hits.pop(cache_key, None)
+        if self.store:
+            try:
+                await self.store.delete(keys)
+            except Exception as e:
+                print(f"Cache local store error: {e}")
+    
+    def local_stats(self) -> dict:
+        """Статистика локального уровня"""
+        return {'size': len(self.local), 'capacity': self.local_size, 'hits': self.local_hits}
     
     async def set(self, subject: str, question: str, response: str):
-        """Сохранить в кеш"""
+        """Сохранить в кеш (ответ, обрезанный лимитом токенов, не сохраняется)"""
+        if getattr(response, 'truncated', False):
+            # Иначе недописанный ответ получали бы все, кто спросит то же самое
+            self.truncated_skipped += 1
+            return
+        
         cache_key = self._hash_query(subject, question)
+        self._local_put(cache_key, response)
+        
+        # С локальным уровнем запись в Supabase уходит фоновой синхронизацией
+        if self.store:
+            try:
+                await self.store.put(cache_key, subject, question[:500], response)
+                return
+            except Exception as e:
+                print(f"Cache local store error: {e}")
         
         try:
-            self.db.table('cache').upsert({
-                'key': cache_key,
-                'subject': subject,
-                'question': question[:500],  # обрезаем для экономии
-                'response': response,
-                'hit_count': 0
-            }).execute()
+            await self.push_rows([{'key': cache_key, 'subject': subject, 'question': question, 'response': response}])
         except Exception as e:
             print(f"Cache set error: {e}")
+    
+    def _remote_row(self, row: dict) -> dict:
+        remote = {
+            'key': row['key'],
+            'subject': row['subject'],
+            'question': row['question'][:500]  # обрезаем для экономии
+        }
+        # hit_count не передаём: новая запись получает default 0, а повторная отправка
+        # существующего ключа (перегенерация, повтор синхронизации) не обнуляет накопленные хиты
+        if self.compressor:
+            self.compressor.write(remote, 'response', row['response'], row['subject'])
+        else:
+            remote['response'] = row['response']
+            remote['response_z'] = None
+        return remote
+    
+    async def push_rows(self, rows: list):
+        """Записать ответы в Supabase одним upsert (ошибки пробрасываются)"""
+        await self.data.execute(self.data.table('cache').upsert([self._remote_row(row) for row in rows]))
+    
+    async def existing_keys(self, keys: list) -> set:
+        """Какие из ключей ещё есть в Supabase (ошибки пробрасываются)"""
+        result = await self.data.execute(self.data.table('cache').select('key').in_('key', keys))
+        return {row['key'] for row in result.data}
+    
+    async def pull_since(self, since: str, after_key: str = '', limit: int = 200) -> tuple[list, tuple | None]:
+        """
+        Записи кеша после отметки (created_at, key) и новая отметка (ошибки пробрасываются).
+        Keyset по паре: записи с одинаковым created_at на границе страницы не теряются.
+        """
+        result = await self.data.execute(
+            self.data.table('cache')
+            .select('key', 'subject', 'question', 'response', 'response_z', 'hit_count', 'created_at')
+            .or_(f'created_at.gt."{since}",and(created_at.eq."{since}",key.gt."{after_key}")')
+            .order('created_at')
+            .order('key')
+            .limit(limit)
+        )
+        if not result.data:
+            return [], None
+        
+        # Отметка - по последней строке страницы, даже если её ответ не прочитался
+        cursor = (result.data[-1]['created_at'], result.data[-1]['key'])
+        for row in result.data:
+            row['response'] = read_column(self.compressor, row, 'response')
+        return [row for row in result.data if row['response']], cursor
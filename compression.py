@@ -0,0 +1,144 @@
+import base64
+import os
+
+try:
+    import zstandard as zstd
+except ImportError:  # сжатие необязательно, без пакета храним текст как есть
+    zstd = None
+
+# Первый байт полезной нагрузки - версия формата
+# 1 - кадр zstd; id словаря (если был) записан в заголовке кадра
+FORMAT_ZSTD = 1
+
+class Compressor:
+    """Сжатие текстов zstd со словарями, обученными по предметам"""
+    
+    def __init__(self, dict_dir: str = "zstd_dicts", level: int = 9, enabled: bool = True):
+        self.level = level
+        self.enabled = enabled and zstd is not None
+        self.dicts = {}        # subject -> ZstdCompressionDict
+        self.dicts_by_id = {}  # dict_id -> ZstdCompressionDict (для распаковки)
+        self._compressors = {}
+        self._decompressors = {}
+        
+        if enabled and zstd is None:
+            print("[WARNING] zstandard не установлен - сжатие выключено")
+        
+        # Файлы <subject>-<dict_id>.dict; старые словари нужны для распаковки
+        # старых записей, для сжатия берётся самый свежий
+        if zstd is not None and os.path.isdir(dict_dir):
+            paths = [os.path.join(dict_dir, n) for n in os.listdir(dict_dir) if n.endswith(".dict")]
+            for path in sorted(paths, key=os.path.getmtime):
+                with open(path, "rb") as f:
+                    self.add_dict(os.path.basename(path).rsplit("-", 1)[0], f.read())
+    
+    def add_dict(self, subject: str, data: bytes):
+        """Зарегистрировать словарь предмета"""
+        zdict = zstd.ZstdCompressionDict(data)
+        self.dicts[subject] = zdict
+        self.dicts_by_id[zdict.dict_id()] = zdict
+        self._compressors.pop(subject, None)
+    
+    def _compressor(self, subject: str | None):
+        if subject not in self._compressors:
+            zdict = self.dicts.get(subject)
+            self._compressors[subject] = zstd.ZstdCompressor(level=self.level, dict_data=zdict) \
+                if zdict else zstd.ZstdCompressor(level=self.level)
+        return self._compressors[subject]
+    
+    def _decompressor(self, dict_id: int):
+        if dict_id not in self._decompressors:
+            zdict = self.dicts_by_id.get(dict_id)
+            if dict_id and zdict is None:
+                raise ValueError(f"неизвестный словарь zstd: {dict_id}")
+            self._decompressors[dict_id] = zstd.ZstdDecompressor(dict_data=zdict) \
+                if zdict else zstd.ZstdDecompressor()
+        return self._decompressors[dict_id]
+    
+    def pack(self, text: str, subject: str | None = None) -> str | None:
+        """Сжать текст в base64-строку; None если сжатие выключено"""
+        if not self.enabled or text is None:
+            return None
+        
+        frame = self._compressor(subject).compress(text.encode())
+        return base64.b64encode(bytes([FORMAT_ZSTD]) + frame).decode()
+    
+    def unpack(self, payload: str) -> str:
+        """Распаковать строку, созданную pack"""
+        raw = base64.b64decode(payload)
+        version, frame = raw[0], raw[1:]
+        
+        if version != FORMAT_ZSTD:
+            raise ValueError(f"неизвестная версия формата сжатия: {version}")
+        if zstd is None:
+            raise RuntimeError("zstandard не установлен")
+        
+        dict_id = zstd.get_frame_parameters(frame).dict_id
+        return self._decompressor(dict_id).decompress(frame).decode()
+    
+    def read(self, row: dict, column: str) -> str | None:
+        """Значение колонки из строки таблицы: сжатое (column_z) или обычное"""
+        payload = row.get(f"{column}_z")
+        if payload:
+            try:
+                return self.unpack(payload)
+            except Exception as e:
+                print(f"Decompress error: {e}")
+                return None
+        return row.get(column)
+    
+    def write(self, row: dict, column: str, text: str, subject: str | None = None) -> dict:
+        """Положить текст в строку таблицы: сжатым, если сжатие включено"""
+        packed = self.pack(text, subject)
+        if packed is None:
+            # Явный NULL: иначе upsert существующей строки оставит прежний сжатый текст, а read() предпочтёт его
+            row[column] = text
+            row[f"{column}_z"] = None
+        else:
+            row[column] = None
+            row[f"{column}_z"] = packed
+        return row
+
+def read_column(compressor, row: dict, column: str) -> str | None:
+    """Прочитать колонку с учётом необязательного компрессора"""
+    return compressor.read(row, column) if compressor else row.get(column)
+
+def train_dict(samples: list, size: int = 32 * 1024) -> bytes:
+    """Обучить словарь zstd на примерах текстов"""
+    return zstd.train_dictionary(size, [s.encode() for s in samples if s]).as_bytes()
+
+async def _train_from_supabase(out_dir: str, size: int, limit: int):
+    """Обучить словари по предметам на содержимом таблицы cache"""
+    from config import Config
+    from datalayer import DataLayer
+    from db import Database
+    from prompts import PROMPTS
+    
+    config = Config()
+    compressor = Compressor(dict_dir=out_dir)
+    db = Database(DataLayer(config.SUPABASE_URL, config.SUPABASE_KEY), compressor=compressor)
+    os.makedirs(out_dir, exist_ok=True)
+    
+    for subject in PROMPTS:
+        samples = await db.get_compression_samples(subject, limit=limit)
+        if len(samples) < 20:
+            print(f"{subject}: мало примеров ({len(samples)}), пропускаем")
+            continue
+        
+        data = train_dict(samples, size)
+        dict_id = zstd.ZstdCompressionDict(data).dict_id()
+        with open(os.path.join(out_dir, f"{subject}-{dict_id}.dict"), "wb") as f:
+            f.write(data)
+        print(f"{subject}: словарь {len(data)} байт из {len(samples)} примеров")
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    
+    parser = argparse.ArgumentParser(description="Обучение словарей zstd по предметам")
+    parser.add_argument("--out", default=os.getenv("ZSTD_DICT_DIR", "zstd_dicts"))
+    parser.add_argument("--size", type=int, default=32 * 1024, help="размер словаря в байтах")
+    parser.add_argument("--limit", type=int, default=2000, help="примеров на предмет")
+    args = parser.parse_args()
+    
+    asyncio.run(_train_from_supabase(args.out, args.size, args.limit))
@@ -1,6 +1,9 @@
 import os
+import logging
 from dataclasses import dataclass, field
 
+logger = logging.getLogger(__name__)
+
 @dataclass
 class Config:
     BOT_TOKEN: str = os.getenv("BOT_TOKEN")
@@ -13,6 +16,14 @@ class Config:
     # Supabase
     SUPABASE_URL: str = os.getenv("SUPABASE_URL")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY")
+    SUPABASE_TIMEOUT: float = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+    
+    # Локальный уровень SQLite для кеша и журнала (пусто - выключен)
+    LOCAL_STORE_PATH: str = os.getenv("LOCAL_STORE_PATH", "local_store.db")
+    LOCAL_SYNC_INTERVAL: float = float(os.getenv("LOCAL_SYNC_INTERVAL", "10"))
+    LOCAL_STORE_MAX_ROWS: int = int(os.getenv("LOCAL_STORE_MAX_ROWS", "20000"))
+    # Сколько ждать Supabase при чтении кеша, если есть локальный уровень
+    CACHE_REMOTE_TIMEOUT: float = float(os.getenv("CACHE_REMOTE_TIMEOUT", "1.5"))
     
     # Admin IDs для статистики
     ADMIN_IDS: list = field(default_factory=lambda: [
@@ -20,10 +31,126 @@ class Config:
         if x.strip() and x.strip().isdigit()
     ])
     
+    # Веб-админка на сервере бота (/admin; пустой пароль - выключена)
+    ADMIN_PASSWORD: str = os.getenv("ADMIN_PASSWORD", "")
+    ADMIN_REFRESH_INTERVAL: float = float(os.getenv("ADMIN_REFRESH_INTERVAL", "60"))
+    
+    # Память диалога: бюджет токенов на историю в одном запросе
+    HISTORY_TOKEN_BUDGET: int = int(os.getenv("HISTORY_TOKEN_BUDGET", "1200"))
+    # Потолок всего промпта: системный промпт + история + вопрос
+    PROMPT_TOKEN_BUDGET: int = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+    
+    # Кеш: размер локального уровня в памяти и прогрев после деплоя
+    CACHE_LOCAL_SIZE: int = int(os.getenv("CACHE_LOCAL_SIZE", "2000"))
+    WARMUP_PER_SUBJECT: int = int(os.getenv("WARMUP_PER_SUBJECT", "50"))
+    # Предгенерация ответов: запросов к Groq в сутки (0 - выключено) и часы по UTC
+    WARMUP_PREGEN_BUDGET: int = int(os.getenv("WARMUP_PREGEN_BUDGET", "0"))
+    WARMUP_OFFPEAK_HOURS: tuple = field(default_factory=lambda: tuple(
+        int(h) for h in os.getenv("WARMUP_OFFPEAK_HOURS", "21-3").split("-")
+    ))
+    
+    # Ограничение таблицы cache: записи, мегабайты ответов, период очистки
+    CACHE_MAX_ROWS: int = int(os.getenv("CACHE_MAX_ROWS", "20000"))
+    CACHE_MAX_MB: int = int(os.getenv("CACHE_MAX_MB", "50"))
+    CACHE_RETENTION_HOURS: int = int(os.getenv("CACHE_RETENTION_HOURS", "6"))
+    
+    # Версии кеша: ключ зависит от промпта и моделей; прошлая версия отдаётся grace часов,
+    # отданные из неё ответы перегенерируются в фоне (запросов в минуту, 0 - не перегенерировать)
+    CACHE_NAMESPACES: bool = os.getenv("CACHE_NAMESPACES", "1") == "1"
+    CACHE_NAMESPACE_GRACE_HOURS: float = float(os.getenv("CACHE_NAMESPACE_GRACE_HOURS", "72"))
+    CACHE_REGEN_PER_MINUTE: float = float(os.getenv("CACHE_REGEN_PER_MINUTE", "6"))
+    
+    # Сжатие ответов кеша и вопросов в логе (zstd + словари по предметам)
+    COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "0") == "1"
+    ZSTD_DICT_DIR: str = os.getenv("ZSTD_DICT_DIR", "zstd_dicts")
+    
+    # Монитор event loop: гистограмма задержки, стек при блокировке дольше LOOP_BLOCK_MS;
+    # LOOP_DEBUG=1 - отмечать синхронный ввод-вывод из потока цикла (для разработки)
+    LOOP_MONITOR: bool = os.getenv("LOOP_MONITOR", "1") == "1"
+    LOOP_BLOCK_MS: float = float(os.getenv("LOOP_BLOCK_MS", "100"))
+    LOOP_DEBUG: bool = os.getenv("LOOP_DEBUG", "0") == "1"
+    
+    # Сессии FSM: строки длиннее SESSION_INLINE_LIMIT - сжатыми в общем хранилище на SESSION_BLOB_MB
+    # (вытесняется LRU); сессия без активности SESSION_TTL секунд теряет всё, кроме предмета
+    SESSION_TTL: float = float(os.getenv("SESSION_TTL", str(6 * 3600)))
+    SESSION_INLINE_LIMIT: int = int(os.getenv("SESSION_INLINE_LIMIT", "1024"))
+    SESSION_BLOB_MB: float = float(os.getenv("SESSION_BLOB_MB", "32"))
+    # Память процесса: RSS раз в MEMORY_SAMPLE_INTERVAL секунд; MEMORY_TRACE=1 - tracemalloc с запуска
+    MEMORY_SAMPLE_INTERVAL: float = float(os.getenv("MEMORY_SAMPLE_INTERVAL", "60"))
+    MEMORY_TRACE: bool = os.getenv("MEMORY_TRACE", "0") == "1"
+    
+    # Лимит ответа (max_tokens) по предмету, модели и типу вопроса - учится на usage.completion_tokens;
+    # доля ANSWER_BUDGET_CONTROL запросов идёт с прежним лимитом 384 для замера экономии
+    ANSWER_BUDGET: bool = os.getenv("ANSWER_BUDGET", "1") == "1"
+    ANSWER_BUDGET_CONTROL: float = float(os.getenv("ANSWER_BUDGET_CONTROL", "0.05"))
+    
+    # Каталог выгрузок /export (части и checkpoint.json по таблицам)
+    EXPORT_DIR: str = os.getenv("EXPORT_DIR", "exports")
+    
+    # Ожидаемое число пользователей для bloom-фильтра известных id
+    USERS_BLOOM_CAPACITY: int = int(os.getenv("USERS_BLOOM_CAPACITY", "100000"))
+    
+    # Лимиты на пользователя "запросов/секунд": текст, фото, админ-команды
+    RATE_LIMIT_TEXT: tuple = field(default_factory=lambda: tuple(
+        float(x) for x in os.getenv("RATE_LIMIT_TEXT", "20/60").split("/")
+    ))
+    RATE_LIMIT_PHOTO: tuple = field(default_factory=lambda: tuple(
+        float(x) for x in os.getenv("RATE_LIMIT_PHOTO", "5/120").split("/")
+    ))
+    RATE_LIMIT_ADMIN: tuple = field(default_factory=lambda: tuple(
+        float(x) for x in os.getenv("RATE_LIMIT_ADMIN", "60/60").split("/")
+    ))
+    # Общие лимиты для нескольких экземпляров (пусто - счётчики в памяти)
+    RATE_LIMIT_REDIS_URL: str = os.getenv("RATE_LIMIT_REDIS_URL", "")
+    
+    # Суточная квота токенов на один ключ Groq (0 - неизвестна, прогноз без остатка)
+    GROQ_DAILY_TOKEN_QUOTA: int = int(os.getenv("GROQ_DAILY_TOKEN_QUOTA", "0"))
+    USAGE_FLUSH_INTERVAL: int = int(os.getenv("USAGE_FLUSH_INTERVAL", "60"))  # запись usage_log, сек
+    
+    # Пакетный режим для фото с несколькими заданиями
+    BATCH_CONCURRENCY: int = int(os.getenv("BATCH_CONCURRENCY", "3"))       # параллельных запросов на ученика
+    BATCH_MAX_EXERCISES: int = int(os.getenv("BATCH_MAX_EXERCISES", "10"))  # заданий за раз
+    
+    # Локальный быстрый путь: арифметика, линейные уравнения, словари для перевода слов
+    FASTPATH_ENABLED: bool = os.getenv("FASTPATH_ENABLED", "1") == "1"
+    FASTPATH_DICT_DIR: str = os.getenv("FASTPATH_DICT_DIR", "data/dict")
+    FASTPATH_ARITHMETIC_RESULT: bool = os.getenv("FASTPATH_ARITHMETIC_RESULT", "0") == "1"
+    
+    # Спекулятивный ответ после OCR: запросов к Groq в сутки (0 - выключено), жизнь заготовки, заданий с фото
+    SPECULATION_BUDGET: int = int(os.getenv("SPECULATION_BUDGET", "0"))
+    SPECULATION_TTL: float = float(os.getenv("SPECULATION_TTL", "600"))
+    SPECULATION_MAX_PROMPTS: int = int(os.getenv("SPECULATION_MAX_PROMPTS", "3"))
+    
+    # Полосы работы "параллельно/ожидающих/SLO очереди, мс": кеш и команды, запросы к LLM, фото
+    LANE_FAST: tuple = field(default_factory=lambda: tuple(
+        float(x) for x in os.getenv("LANE_FAST", "32/256/200").split("/")
+    ))
+    LANE_LLM: tuple = field(default_factory=lambda: tuple(
+        float(x) for x in os.getenv("LANE_LLM", "8/32/3000").split("/")
+    ))
+    LANE_VISION: tuple = field(default_factory=lambda: tuple(
+        float(x) for x in os.getenv("LANE_VISION", "3/6/10000").split("/")
+    ))
+    
+    # Исходящие сообщения: общий лимит Telegram (сообщений/сек) и на один чат (сообщений/сек, запас)
+    SEND_GLOBAL_RATE: float = float(os.getenv("SEND_GLOBAL_RATE", "25"))
+    SEND_CHAT_RATE: float = float(os.getenv("SEND_CHAT_RATE", "1"))
+    SEND_CHAT_BURST: float = float(os.getenv("SEND_CHAT_BURST", "3"))
+    
+    # Запись обезличенного трафика для replay.py (пусто - выключено) и доля записываемых вопросов
+    RECORD_TRAFFIC_PATH: str = os.getenv("RECORD_TRAFFIC_PATH", "")
+    RECORD_TRAFFIC_SAMPLE: float = float(os.getenv("RECORD_TRAFFIC_SAMPLE", "1.0"))
+    
+    # Сколько ждать завершения текущих ответов при остановке (SIGTERM), сек
+    SHUTDOWN_TIMEOUT: float = float(os.getenv("SHUTDOWN_TIMEOUT", "25"))
+    
+    # Ленивая инициализация: SDK и клиенты создаются при первом использовании
+    LAZY_INIT: bool = os.getenv("LAZY_INIT", "1") == "1"
+    
     def __post_init__(self):
         """Проверка после инициализации"""
         if not self.ADMIN_IDS:
-            print(f"[WARNING] ADMIN_IDS пуст! Проверьте .env файл.")
-            print(f"[DEBUG] ADMIN_IDS из env: '{os.getenv('ADMIN_IDS', 'НЕ НАЙДЕНО')}'")
+            logger.warning("ADMIN_IDS пуст! Проверьте .env файл.")
+            logger.debug(f"ADMIN_IDS из env: '{os.getenv('ADMIN_IDS', 'НЕ НАЙДЕНО')}'")
         else:
-            print(f"[INFO] Admin IDs loaded: {self.ADMIN_IDS}")
\ No newline at end of file
+            logger.debug(f"Admin IDs loaded: {self.ADMIN_IDS}")
\ No newline at end of file
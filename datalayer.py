@@ -0,0 +1,87 @@
+import asyncio
+import random
+import threading
+
+class DataLayer:
+    """
+    Единый асинхронный доступ к Supabase для Cache, Database и админки.
+    Один клиент на процесс - один пул HTTP/2 соединений PostgREST.
+    """
+    
+    def __init__(self, supabase_url: str, supabase_key: str, timeout: float = 10.0,
+                 attempts: int = 3, backoff: float = 0.3):
+        self.url = supabase_url
+        self.key = supabase_key
+        self.timeout = timeout
+        self.attempts = attempts
+        self.backoff = backoff
+        self._client = None
+        self._lock = threading.Lock()
+        
+        self.stats = {'queries': 0, 'retries': 0, 'errors': 0}
+    
+    @property
+    def client(self):
+        """
+        Клиент создаётся при первом обращении (SDK импортируется тогда же);
+        ключ передаём заголовком, без auth-сессии
+        """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from supabase import AsyncClient
+                    from supabase.lib.client_options import AsyncClientOptions
+                    
+                    self._client = AsyncClient(self.url, self.key, AsyncClientOptions(
+                        headers={"Authorization": f"Bearer {self.key}"},
+                        postgrest_client_timeout=self.timeout,
+                        auto_refresh_token=False,
+                        persist_session=False,
+                    ))
+        return self._client
+    
+    def prepare(self):
+        """Создать клиент заранее (можно вызывать из потока)"""
+        return self.client
+    
+    def table(self, name: str):
+        """Построитель запроса к таблице"""
+        return self.client.table(name)
+    
+    def rpc(self, fn: str, params: dict | None = None):
+        """Построитель вызова SQL-функции"""
+        return self.client.rpc(fn, params or {})
+    
+    async def execute(self, query, timeout: float | None = None, attempts: int | None = None):
+        """Выполнить запрос с таймаутом и повторами с экспоненциальной задержкой"""
+        import httpx  # уже загружен вместе с клиентом
+        
+        # Сетевые сбои и таймауты повторяем, ошибки PostgREST (4xx) - нет
+        retryable = (httpx.TransportError, asyncio.TimeoutError)
+        attempts = attempts or self.attempts
+        delay = self.backoff
+        
+        for attempt in range(attempts):
+            self.stats['queries'] += 1
+            try:
+                return await asyncio.wait_for(query.execute(), timeout or self.timeout)
+            except retryable:
+                if attempt == attempts - 1:
+                    self.stats['errors'] += 1
+                    raise
+                self.stats['retries'] += 1
+                await asyncio.sleep(delay * (1 + random.random()))
+                delay *= 2
+            except Exception:
+                self.stats['errors'] += 1
+                raise
+    
+    async def gather(self, *queries, timeout: float | None = None) -> list:
+        """Независимые запросы параллельно - по времени примерно один round-trip"""
+        return await asyncio.gather(*(self.execute(q, timeout=timeout) for q in queries))
+    
+    async def close(self):
+        """Закрыть пул соединений"""
+        if self._client is not None:
+            await self._client.postgrest.aclose()
+            self._client = None
@@ -1,18 +1,23 @@
-from supabase import create_client, Client
 from datetime import datetime, timedelta
 from collections import Counter
 
+from compression import read_column
+
 class Database:
-    def __init__(self, supabase_url: str, supabase_key: str):
-        self.db: Client = create_client(supabase_url, supabase_key)
+    def __init__(self, data, compressor=None, store=None, meter=None):
+        self.data = data  # общий DataLayer (один пул соединений с Cache и админкой)
+        self.compressor = compressor
+        self.store = store  # LocalStore: журнал переживает недоступность Supabase
+        self.meter = meter  # ThroughputMeter админки: поток вопросов без запросов к БД
     
     async def get_user(self, user_id: int) -> dict | None:
         """Получить пользователя"""
         try:
-            result = self.db.table('users') \
-                .select('*') \
-                .eq('user_id', user_id) \
-                .execute()
+            result = await self.data.execute(
+                self.data.table('users')
+                .select('*')
+                .eq('user_id', user_id)
+            )
             
             return result.data[0] if result.data else None
         except Exception as e:
@@ -22,46 +27,135 @@ class Database:
     async def create_user(self, user_id: int, username: str | None):
         """Создать нового пользователя"""
         try:
-            self.db.table('users').insert({
-                'user_id': user_id,
-                'username': username,
-                'created_at': datetime.utcnow().isoformat()
-            }).execute()
+            await self.data.execute(
+                self.data.table('users').insert({
+                    'user_id': user_id,
+                    'username': username,
+                    'created_at': datetime.utcnow().isoformat()
+                }),
+                attempts=1
+            )
         except Exception as e:
             print(f"DB create_user error: {e}")
     
     async def update_user_subject(self, user_id: int, subject: str):
         """Обновить выбранный предмет"""
         try:
-            self.db.table('users') \
-                .update({'current_subject': subject}) \
-                .eq('user_id', user_id) \
-                .execute()
+            await self.data.execute(
+                self.data.table('users')
+                .update({'current_subject': subject})
+                .eq('user_id', user_id)
+            )
         except Exception as e:
             print(f"DB update_user_subject error: {e}")
     
-    async def log_question(self, user_id: int, subject: str, question: str, from_cache: bool = False):
-        """Логировать вопрос для статистики"""
+    async def log_question(self, user_id: int, subject: str, question: str, from_cache: bool = False,
+                           from_local: bool = False):
+        """Логировать вопрос для статистики (from_local - ответ быстрого пути, не попадание в кеш)"""
+        if self.meter:
+            self.meter.mark(from_cache)
+        
+        row = {
+            'user_id': user_id,
+            'subject': subject,
+            'from_cache': from_cache,
+            'from_local': from_local,
+            'created_at': datetime.utcnow().isoformat()
+        }
+        if self.compressor:
+            self.compressor.write(row, 'question', question[:500], subject)
+        else:
+            row['question'] = question[:500]
+            row['question_z'] = None
+        
+        # С локальным журналом запись в Supabase уходит фоновой синхронизацией
+        if self.store:
+            try:
+                await self.store.add_event('question', row)
+                return
+            except Exception as e:
+                print(f"DB local log error: {e}")
+        
         try:
-            self.db.table('questions_log').insert({
-                'user_id': user_id,
-                'subject': subject,
-                'question': question[:500],
-                'from_cache': from_cache,
-                'created_at': datetime.utcnow().isoformat()
-            }).execute()
+            # insert не идемпотентен - без повторов, чтобы не задвоить запись
+            await self.data.execute(self.data.table('questions_log').insert(row), attempts=1)
         except Exception as e:
             print(f"DB log_question error: {e}")
     
+    async def insert_questions(self, rows: list):
+        """Пачка записей в questions_log (ошибки пробрасываются для повторной отправки)"""
+        # Записи журнала, сделанные до появления from_local и question_z: у пачки должен быть один набор колонок
+        for row in rows:
+            row.setdefault('from_local', False)
+            row.setdefault('question_z', None)
+        await self.data.execute(self.data.table('questions_log').insert(rows), attempts=1)
+    
+    async def insert_usage(self, rows: list):
+        """Пачка агрегатов расхода токенов в usage_log (ошибки пробрасываются)"""
+        await self.data.execute(self.data.table('usage_log').insert(rows), attempts=1)
+    
+    async def get_namespaces(self) -> list:
+        """Реестр версий кеша: subject, namespace, created_at (ошибки пробрасываются)"""
+        result = await self.data.execute(
+            self.data.table('cache_namespaces').select('subject', 'namespace', 'created_at')
+        )
+        return result.data
+    
+    async def register_namespace(self, subject: str, namespace: str) -> bool:
+        """Зарегистрировать новую версию ответов предмета (повтор безопасен); True если записано"""
+        try:
+            await self.data.execute(
+                self.data.table('cache_namespaces').upsert(
+                    {'subject': subject, 'namespace': namespace, 'created_at': datetime.utcnow().isoformat()},
+                    on_conflict='subject,namespace', ignore_duplicates=True
+                )
+            )
+            return True
+        except Exception as e:
+            print(f"DB register_namespace error: {e}")
+            return False
+    
+    async def get_key_usage_today(self, page_size: int = 1000) -> dict | None:
+        """Расход токенов за сегодня по ключу, модели и предмету - все строки (keyset по id); None - ошибка"""
+        try:
+            today = datetime.utcnow().date().isoformat()
+            usage = {'keys': Counter(), 'models': Counter(), 'subjects': Counter()}
+            after = 0
+            while True:
+                result = await self.data.execute(
+                    self.data.table('usage_log')
+                    .select('id', 'key_id', 'model', 'subject', 'total_tokens')
+                    .gte('created_at', today)
+                    .gt('id', after)
+                    .order('id')
+                    .limit(page_size)
+                )
+                if not result.data:
+                    return usage
+                
+                for row in result.data:
+                    tokens = row['total_tokens'] or 0
+                    usage['keys'][row['key_id']] += tokens
+                    usage['models'][row['model']] += tokens
+                    if row.get('subject'):
+                        usage['subjects'][row['subject']] += tokens
+                after = result.data[-1]['id']
+        except Exception as e:
+            print(f"DB get_key_usage_today error: {e}")
+            return None
+    
+    def _count(self, table: str, column: str):
+        """Запрос количества строк: сами строки не нужны, берём count из заголовка"""
+        return self.data.table(table).select(column, count='exact').limit(1)
+    
     async def get_stats(self) -> dict:
         """Общая статистика"""
         try:
-            total_users = self.db.table('users').select('user_id', count='exact').execute()
-            total_questions = self.db.table('questions_log').select('id', count='exact').execute()
-            cache_hits = self.db.table('questions_log') \
-                .select('id', count='exact') \
-                .eq('from_cache', True) \
-                .execute()
+            total_users, total_questions, cache_hits = await self.data.gather(
+                self._count('users', 'user_id'),
+                self._count('questions_log', 'id'),
+                self._count('questions_log', 'id').eq('from_cache', True)
+            )
             
             cache_hit_rate = (cache_hits.count / total_questions.count * 100) if total_questions.count > 0 else 0
             
@@ -78,7 +172,7 @@ class Database:
     async def get_subject_stats(self) -> list:
         """Статистика по предметам"""
         try:
-            result = self.db.table('questions_log').select('subject').execute()
+            result = await self.data.execute(self.data.table('questions_log').select('subject'))
             
             subjects = [row['subject'] for row in result.data if row.get('subject')]
             counter = Counter(subjects)
@@ -91,38 +185,21 @@ class Database:
     async def get_stats_today(self) -> dict:
         """Статистика за сегодня"""
         try:
-            today = datetime.utcnow().date()
-            
-            new_users = self.db.table('users') \
-                .select('user_id', count='exact') \
-                .gte('created_at', today.isoformat()) \
-                .execute()
+            today = datetime.utcnow().date().isoformat()
             
-            questions_today = self.db.table('questions_log') \
-                .select('id', count='exact') \
-                .gte('created_at', today.isoformat()) \
-                .execute()
-            
-            active_users = self.db.table('questions_log') \
-                .select('user_id') \
-                .gte('created_at', today.isoformat()) \
-                .execute()
+            # Пять независимых запросов параллельно
+            new_users, questions_today, active_users, cache_hits, questions = await self.data.gather(
+                self._count('users', 'user_id').gte('created_at', today),
+                self._count('questions_log', 'id').gte('created_at', today),
+                self.data.table('questions_log').select('user_id').gte('created_at', today),
+                self._count('questions_log', 'id').eq('from_cache', True).gte('created_at', today),
+                self.data.table('questions_log').select('subject').gte('created_at', today)
+            )
             
             unique_active = len(set(row['user_id'] for row in active_users.data))
             
-            cache_hits = self.db.table('questions_log') \
-                .select('id', count='exact') \
-                .eq('from_cache', True) \
-                .gte('created_at', today.isoformat()) \
-                .execute()
-            
             cache_hit_rate = (cache_hits.count / questions_today.count * 100) if questions_today.count > 0 else 0
             
-            questions = self.db.table('questions_log') \
-                .select('subject') \
-                .gte('created_at', today.isoformat()) \
-                .execute()
-            
             subjects = [row['subject'] for row in questions.data if row.get('subject')]
             top_subjects = [{'subject': s, 'count': c} for s, c in Counter(subjects).most_common(5)]
             
@@ -140,38 +217,27 @@ class Database:
     async def get_stats_week(self) -> dict:
         """Статистика за неделю"""
         try:
-            week_ago = datetime.utcnow() - timedelta(days=7)
-            
-            new_users = self.db.table('users') \
-                .select('user_id', count='exact') \
-                .gte('created_at', week_ago.isoformat()) \
-                .execute()
+            week_ago = (datetime.utcnow() - timedelta(days=7)).isoformat()
+            days = [datetime.utcnow().date() - timedelta(days=i) for i in range(7)]
             
-            questions_week = self.db.table('questions_log') \
-                .select('id', count='exact') \
-                .gte('created_at', week_ago.isoformat()) \
-                .execute()
-            
-            active_users = self.db.table('questions_log') \
-                .select('user_id') \
-                .gte('created_at', week_ago.isoformat()) \
-                .execute()
+            new_users, questions_week, active_users, *day_counts = await self.data.gather(
+                self._count('users', 'user_id').gte('created_at', week_ago),
+                self._count('questions_log', 'id').gte('created_at', week_ago),
+                self.data.table('questions_log').select('user_id').gte('created_at', week_ago),
+                *(
+                    self._count('questions_log', 'id')
+                    .gte('created_at', day.isoformat())
+                    .lt('created_at', (day + timedelta(days=1)).isoformat())
+                    for day in days
+                )
+            )
             
             unique_active = len(set(row['user_id'] for row in active_users.data))
             
-            daily_breakdown = []
-            for i in range(7):
-                day = datetime.utcnow().date() - timedelta(days=i)
-                day_questions = self.db.table('questions_log') \
-                    .select('id', count='exact') \
-                    .gte('created_at', day.isoformat()) \
-                    .lt('created_at', (day + timedelta(days=1)).isoformat()) \
-                    .execute()
-                
-                daily_breakdown.append({
-                    'date': day.strftime('%d.%m'),
-                    'count': day_questions.count
-                })
+            daily_breakdown = [
+                {'date': day.strftime('%d.%m'), 'count': day_questions.count}
+                for day, day_questions in zip(days, day_counts)
+            ]
             
             daily_breakdown.reverse()
             avg_daily = questions_week.count / 7
@@ -190,15 +256,16 @@ class Database:
     async def get_top_users(self, limit: int = 10) -> list:
         """Топ активных пользователей"""
         try:
-            questions = self.db.table('questions_log').select('user_id').execute()
+            questions = await self.data.execute(self.data.table('questions_log').select('user_id'))
             
             user_counts = Counter(row['user_id'] for row in questions.data)
             top_user_ids = [user_id for user_id, _ in user_counts.most_common(limit)]
             
-            users = self.db.table('users') \
-                .select('user_id', 'username') \
-                .in_('user_id', top_user_ids) \
-                .execute()
+            users = await self.data.execute(
+                self.data.table('users')
+                .select('user_id', 'username')
+                .in_('user_id', top_user_ids)
+            )
             
             result = []
             for user_id, count in user_counts.most_common(limit):
@@ -217,18 +284,19 @@ class Database:
     async def get_cache_stats(self) -> dict:
         """Статистика кеша"""
         try:
-            total = self.db.table('cache').select('key', count='exact').execute()
-            
-            top_cached = self.db.table('cache') \
-                .select('question', 'hit_count', 'subject') \
-                .order('hit_count', desc=True) \
-                .limit(10) \
-                .execute()
+            total, top_cached, all_hits, subject_rows = await self.data.gather(
+                self._count('cache', 'key'),
+                self.data.table('cache')
+                .select('question', 'hit_count', 'subject')
+                .order('hit_count', desc=True)
+                .limit(10),
+                self.data.table('cache').select('hit_count'),
+                self.data.table('cache').select('subject')
+            )
             
-            all_hits = self.db.table('cache').select('hit_count').execute()
             avg_hits = sum(row['hit_count'] for row in all_hits.data) / len(all_hits.data) if all_hits.data else 0
             
-            subjects = [row['subject'] for row in self.db.table('cache').select('subject').execute().data]
+            subjects = [row['subject'] for row in subject_rows.data]
             most_cached = Counter(subjects).most_common(1)[0][0] if subjects else "N/A"
             
             return {
@@ -241,18 +309,171 @@ class Database:
             print(f"DB get_cache_stats error: {e}")
             return {'total_cached': 0, 'top_cached': [], 'avg_hits': 0, 'most_cached_subject': 'N/A'}
     
+    async def get_top_cached(self, subject: str, limit: int = 50) -> list:
+        """Самые востребованные записи кеша по предмету"""
+        try:
+            result = await self.data.execute(
+                self.data.table('cache')
+                .select('key', 'response', 'response_z', 'hit_count')
+                .eq('subject', subject)
+                .order('hit_count', desc=True)
+                .limit(limit)
+            )
+            
+            for row in result.data:
+                row['response'] = read_column(self.compressor, row, 'response')
+            return [row for row in result.data if row['response']]
+        except Exception as e:
+            print(f"DB get_top_cached error: {e}")
+            return []
+    
+    async def get_popular_questions(self, subject: str, days: int = 14, limit: int = 50) -> list:
+        """Самые частые вопросы по предмету за последние дни"""
+        try:
+            since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+            
+            result = await self.data.execute(
+                self.data.table('questions_log')
+                .select('question', 'question_z')
+                .eq('subject', subject)
+                .gte('created_at', since)
+                .order('created_at', desc=True)
+                .limit(5000)
+            )
+            
+            questions = (read_column(self.compressor, row, 'question') for row in result.data)
+            counter = Counter(q for q in questions if q)
+            return [{'question': q, 'count': c} for q, c in counter.most_common(limit)]
+        except Exception as e:
+            print(f"DB get_popular_questions error: {e}")
+            return []
+    
     async def clear_old_cache(self, days: int = 30) -> int:
         """Очистить старый кеш"""
         try:
             cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
             
-            result = self.db.table('cache') \
-                .delete() \
-                .lt('created_at', cutoff_date) \
-                .eq('hit_count', 0) \
-                .execute()
+            result = await self.data.execute(
+                self.data.table('cache')
+                .delete()
+                .lt('created_at', cutoff_date)
+                .eq('hit_count', 0)
+            )
             
             return len(result.data) if result.data else 0
         except Exception as e:
             print(f"DB clear_old_cache error: {e}")
             return 0
+    
+    async def get_cache_size(self, sample: int = 200) -> tuple[int, float]:
+        """Число записей в кеше и средний размер ответа (по выборке)"""
+        try:
+            total, recent = await self.data.gather(
+                self._count('cache', 'key'),
+                self.data.table('cache').select('response', 'response_z').order('created_at', desc=True).limit(sample)
+            )
+            
+            # Считаем фактически хранимый объём: сжатый, если запись сжата
+            sizes = [len(row.get('response_z') or (row.get('response') or '').encode()) for row in recent.data]
+            avg_size = sum(sizes) / len(sizes) if sizes else 0
+            
+            return total.count or 0, avg_size
+        except Exception as e:
+            print(f"DB get_cache_size error: {e}")
+            return 0, 0
+    
+    async def get_eviction_candidates(self, limit: int = 800, half_life_days: float = 14.0) -> list:
+        """Записи кеша с наименьшей оценкой LFU со старением (функция из migrations/0005)"""
+        try:
+            result = await self.data.execute(
+                self.data.rpc('cache_eviction_candidates', {'half_life_days': half_life_days, 'lim': limit})
+            )
+            
+            return result.data
+        except Exception as e:
+            print(f"DB get_eviction_candidates error: {e}")
+        
+        # Миграция 0005 не применена - наименее используемые и самые старые
+        try:
+            result = await self.data.execute(
+                self.data.table('cache')
+                .select('key', 'hit_count', 'created_at')
+                .order('hit_count')
+                .order('created_at')
+                .limit(limit)
+            )
+            
+            return result.data
+        except Exception as e:
+            print(f"DB get_eviction_candidates error: {e}")
+            return []
+    
+    async def delete_cache_keys(self, keys: list) -> int:
+        """Удалить записи кеша по ключам"""
+        if not keys:
+            return 0
+        
+        try:
+            result = await self.data.execute(self.data.table('cache').delete().in_('key', keys))
+            
+            return len(result.data) if result.data else 0
+        except Exception as e:
+            print(f"DB delete_cache_keys error: {e}")
+            return 0
+    
+    async def get_compression_samples(self, subject: str, limit: int = 2000) -> list:
+        """Тексты ответов и вопросов предмета для обучения словаря сжатия"""
+        try:
+            responses, questions = await self.data.gather(
+                self.data.table('cache')
+                .select('response', 'response_z')
+                .eq('subject', subject)
+                .order('hit_count', desc=True)
+                .limit(limit),
+                self.data.table('questions_log')
+                .select('question', 'question_z')
+                .eq('subject', subject)
+                .order('created_at', desc=True)
+                .limit(limit)
+            )
+            
+            samples = [read_column(self.compressor, row, 'response') for row in responses.data]
+            samples += [read_column(self.compressor, row, 'question') for row in questions.data]
+            return [s for s in samples if s]
+        except Exception as e:
+            print(f"DB get_compression_samples error: {e}")
+            return []
+    
+    async def upsert_users(self, rows: list, ignore_duplicates: bool = False) -> bool:
+        """Пачка идемпотентных upsert в users; True если записано"""
+        try:
+            await self.data.execute(
+                self.data.table('users').upsert(rows, on_conflict='user_id', ignore_duplicates=ignore_duplicates)
+            )
+            return True
+        except Exception as e:
+            print(f"DB upsert_users error: {e}")
+            return False
+    
+    async def iter_pages(self, table: str, key: str, columns: str = '*', after=None, page_size: int = 1000):
+        """
+        Вся таблица страницами по page_size строк: keyset по уникальному столбцу key
+        (без OFFSET). Конец - пустая страница: PostgREST может молча урезать limit.
+        """
+        while True:
+            query = self.data.table(table).select(columns).order(key).limit(page_size)
+            if after is not None:
+                query = query.gt(key, after)
+            
+            result = await self.data.execute(query)
+            if not result.data:
+                return
+            
+            yield result.data
+            after = result.data[-1][key]
+    
+    async def iter_user_ids(self, page_size: int = 1000):
+        """Все user_id постранично (keyset по user_id)"""
+        async for page in self.iter_pages('users', 'user_id', columns='user_id', page_size=page_size):
+            for row in page:
+                yield row['user_id']
@@ -0,0 +1,120 @@
+import asyncio
+import re
+
+# Начало упражнения: "1.", "2)", "№3", "Задание 4", "Упражнение 5", "Exercise 6"
+EXERCISE_START = re.compile(
+    r'^\s*(?:(?:№|N|задание|упражнение|пример|задача|exercise|aufgabe)\s*(\d{1,3})\b[.):]?'
+    r'|(\d{1,3})\s*[.)](?!\d))\s*',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# Ученик спрашивает про конкретный номер: "объясни №3", "задание 2", "во втором номере"
+EXERCISE_REF = re.compile(
+    r'(?:№|номер\w*|задани\w*|упражнени\w*|пример\w*|задач\w*)\s*(\d{1,3})\b'
+    r'|\b(\d{1,3})\s*(?:-?(?:й|е|ое|ий))?\s*(?:номер\w*|задани\w*|упражнени\w*|пример\w*|задач\w*)',
+    re.IGNORECASE
+)
+
+# Запрос "на всё сразу": тогда задания решаются параллельно
+BATCH_PATTERN = re.compile(
+    r'\b(вс[её]|все\s+задани|кажд\w*|реши\w*|сделай|выполни|помоги|провер\w*|объясни)\b',
+    re.IGNORECASE
+)
+
+# Единая формулировка для пакетного режима - ответы переиспользуются через кеш
+DEFAULT_QUESTION = "Объясни, как решить это задание"
+
+def split_exercises(text: str) -> tuple[str, list[tuple[str, str]]]:
+    """
+    Разбить распознанный текст на пронумерованные упражнения.
+    Возвращает (общее условие, [(номер, текст), ...]); без нумерации - ("", []).
+    """
+    starts = list(EXERCISE_START.finditer(text))
+    
+    # "Упражнение 12. Вставьте буквы." перед пунктами 1., 2. - общее условие, а не упражнение
+    first = 0
+    while first + 1 < len(starts) and starts[first].group(1) and starts[first + 1].group(2):
+        first += 1
+    
+    exercises = []
+    for i, match in enumerate(starts[first:], start=first):
+        end = starts[i + 1].start() if i + 1 < len(starts) else len(text)
+        body = text[match.end():end].strip()
+        if body:
+            exercises.append((match.group(1) or match.group(2), body))
+    
+    # Нумерация должна быть осмысленной: хотя бы два разных номера
+    if len({number for number, _ in exercises}) < 2:
+        return "", []
+    
+    instruction = text[:starts[first].start()].strip()
+    return instruction, exercises
+
+def find_exercise(question: str, exercises: list[tuple[str, str]]) -> tuple[str, str] | None:
+    """Упражнение, о котором спрашивает ученик, если он назвал номер"""
+    match = EXERCISE_REF.search(question)
+    if not match:
+        return None
+    
+    number = match.group(1) or match.group(2)
+    return next((ex for ex in exercises if ex[0] == number), None)
+
+def exercise_prompt(instruction: str, text: str, question: str = DEFAULT_QUESTION) -> str:
+    """
+    Промпт одного упражнения. Номер в него не входит: одно и то же упражнение
+    из разных тетрадей попадает в один ключ кеша.
+    """
+    condition = f"{instruction}\n{text}" if instruction else text
+    return f"Контекст (задание с фото):\n{condition}\n\nВопрос ученика: {question}"
+
+def wants_batch(question: str) -> bool:
+    """Вопрос относится ко всем заданиям на фото?"""
+    return bool(BATCH_PATTERN.search(question))
+
+class BatchSolver:
+    """
+    Параллельное решение упражнений с фото в пределах бюджета на пользователя.
+    Результаты отдаются по мере готовности (быстрые и закешированные - сразу).
+    """
+    
+    def __init__(self, per_user: int = 3, max_exercises: int = 10):
+        self.per_user = per_user
+        self.max_exercises = max_exercises
+        self._slots = {}  # user_id -> [semaphore, число активных пачек]
+        
+        self.stats = {'batches': 0, 'exercises': 0}
+    
+    def _acquire_slots(self, user_id: int) -> asyncio.Semaphore:
+        slot = self._slots.setdefault(user_id, [asyncio.Semaphore(self.per_user), 0])
+        slot[1] += 1
+        return slot[0]
+    
+    def _release_slots(self, user_id: int):
+        slot = self._slots[user_id]
+        slot[1] -= 1
+        if slot[1] == 0:
+            del self._slots[user_id]
+    
+    async def solve(self, user_id: int, exercises: list, solve_one):
+        """
+        Асинхронный генератор (упражнение, результат) в порядке завершения.
+        solve_one(упражнение) - корутина; одновременно у пользователя не больше per_user.
+        """
+        exercises = exercises[:self.max_exercises]
+        semaphore = self._acquire_slots(user_id)
+        self.stats['batches'] += 1
+        self.stats['exercises'] += len(exercises)
+        
+        async def run(exercise):
+            async with semaphore:
+                return exercise, await solve_one(exercise)
+        
+        tasks = [asyncio.create_task(run(exercise)) for exercise in exercises]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Прерванная пачка не оставляет висящих запросов
+            for task in tasks:
+                task.cancel()
+            self._release_slots(user_id)
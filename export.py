@@ -0,0 +1,209 @@
+"""
+Потоковая выгрузка questions_log, users и cache для офлайн-анализа.
+
+Таблица читается страницами (keyset, без OFFSET и без лимита PostgREST на строки)
+и пишется частями: exports/<таблица>/part-00000.ndjson.gz (или .parquet).
+Память не зависит от размера таблицы. После каждой закрытой части сохраняется
+checkpoint.json - прерванная выгрузка продолжается с него.
+
+    python export.py questions_log cache              # gzip NDJSON в exports/
+    python export.py users --format parquet           # нужен pip install pyarrow
+    python export.py cache --restart                  # заново, без checkpoint
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import time
+
+from compression import read_column
+
+# Таблица -> уникальный столбец для keyset-пагинации и сжатые столбцы
+TABLES = {
+    'questions_log': ('id', ('question',)),
+    'users': ('user_id', ()),
+    'cache': ('key', ('response',)),
+}
+
+FORMATS = ('ndjson', 'parquet')
+
+class _NDJSONPart:
+    suffix = '.ndjson.gz'
+    
+    def __init__(self, path: str):
+        self.file = gzip.open(path, 'wt', encoding='utf-8')
+    
+    def write(self, rows: list):
+        for row in rows:
+            self.file.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+    
+    def close(self):
+        self.file.close()
+
+class _ParquetPart:
+    suffix = '.parquet'
+    
+    def __init__(self, path: str):
+        import pyarrow  # опциональная зависимость
+        import pyarrow.parquet
+        
+        self.pa = pyarrow
+        self.path = path
+        self.writer = None
+        self.schema = None
+    
+    def write(self, rows: list):
+        if self.writer is None:
+            # Схема - по первой странице; столбцы из одних null становятся строками
+            schema = self.pa.Table.from_pylist(rows).schema
+            self.schema = self.pa.schema([
+                field.with_type(self.pa.string()) if self.pa.types.is_null(field.type) else field
+                for field in schema
+            ])
+            self.writer = self.pa.parquet.ParquetWriter(self.path, self.schema, compression='zstd')
+        # Одна страница - одна группа строк
+        self.writer.write_table(self.pa.Table.from_pylist(rows, schema=self.schema))
+    
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+class Exporter:
+    """Выгрузка таблиц частями с продолжением с места обрыва"""
+    
+    def __init__(self, db, out_dir: str = "exports", page_size: int = 1000, part_rows: int = 100_000):
+        self.db = db
+        self.out_dir = out_dir
+        self.page_size = page_size
+        self.part_rows = part_rows
+        
+        self.progress = {}  # таблица -> {'rows', 'parts', 'status'}
+        self.task = None    # выгрузка, запущенная админ-командой
+    
+    def _checkpoint_path(self, table: str) -> str:
+        return os.path.join(self.out_dir, table, 'checkpoint.json')
+    
+    def _load_checkpoint(self, table: str) -> dict:
+        try:
+            with open(self._checkpoint_path(table), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'after': None, 'parts': [], 'rows': 0, 'done': False, 'format': None}
+    
+    def _save_checkpoint(self, table: str, checkpoint: dict):
+        # Через временный файл - checkpoint не бывает наполовину записанным
+        path = self._checkpoint_path(table)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, default=str)
+        os.replace(path + '.tmp', path)
+    
+    def _decode(self, rows: list, compressed: tuple) -> list:
+        """Сжатые столбцы (*_z) - обратно в текст"""
+        for row in rows:
+            for column in compressed:
+                row[column] = read_column(self.db.compressor, row, column)
+                row.pop(f"{column}_z", None)
+        return rows
+    
+    async def export(self, table: str, fmt: str = "ndjson", restart: bool = False) -> dict:
+        """Выгрузить таблицу; возвращает checkpoint (пути частей и число строк)"""
+        if fmt not in FORMATS:
+            raise ValueError(f"Формат {fmt}: только {', '.join(FORMATS)}")
+        part_class = _ParquetPart if fmt == 'parquet' else _NDJSONPart
+        key, compressed = TABLES[table]
+        os.makedirs(os.path.join(self.out_dir, table), exist_ok=True)
+        
+        # Продолжаем только незавершённую выгрузку в том же формате
+        checkpoint = self._load_checkpoint(table)
+        if restart or checkpoint['done'] or checkpoint.get('format') != fmt:
+            for name in checkpoint['parts']:
+                if os.path.exists(name):
+                    os.remove(name)
+            checkpoint = {'after': None, 'parts': [], 'rows': 0, 'done': False, 'format': fmt}
+        
+        progress = self.progress[table] = {'rows': checkpoint['rows'], 'parts': len(checkpoint['parts']),
+                                           'status': 'running', 'started': time.time()}
+        part, part_path, part_size, last_key = None, None, 0, checkpoint['after']
+        
+        def close_part():
+            # Часть готова: переименовать и только потом сдвинуть checkpoint
+            part.close()
+            final = part_path[:-len('.tmp')]
+            os.replace(part_path, final)
+            checkpoint['parts'].append(final)
+            checkpoint['after'] = last_key
+            checkpoint['rows'] += part_size
+            self._save_checkpoint(table, checkpoint)
+            progress['parts'] = len(checkpoint['parts'])
+        
+        try:
+            async for rows in self.db.iter_pages(table, key, after=checkpoint['after'], page_size=self.page_size):
+                if part is None:
+                    number = len(checkpoint['parts'])
+                    part_path = os.path.join(self.out_dir, table, f"part-{number:05d}{part_class.suffix}.tmp")
+                    part = part_class(part_path)
+                    part_size = 0
+                
+                part.write(self._decode(rows, compressed))
+                part_size += len(rows)
+                last_key = rows[-1][key]
+                progress['rows'] = checkpoint['rows'] + part_size
+                
+                if part_size >= self.part_rows:
+                    close_part()
+                    part = None
+            
+            if part is not None:
+                close_part()
+            checkpoint['done'] = True
+            self._save_checkpoint(table, checkpoint)
+            progress['status'] = 'done'
+        except BaseException:
+            # Незакрытая часть не попала в checkpoint - при продолжении она перепишется
+            if part is not None:
+                part.close()
+                os.remove(part_path)
+            progress['status'] = 'interrupted'
+            raise
+        
+        return checkpoint
+    
+    async def export_all(self, tables: list, fmt: str = "ndjson", restart: bool = False) -> dict:
+        return {table: await self.export(table, fmt=fmt, restart=restart) for table in tables}
+
+async def _main(tables: list, fmt: str, out_dir: str, page_size: int, part_rows: int, restart: bool):
+    from config import Config
+    from datalayer import DataLayer
+    from db import Database
+    from compression import Compressor
+    
+    config = Config()
+    data = DataLayer(config.SUPABASE_URL, config.SUPABASE_KEY, timeout=config.SUPABASE_TIMEOUT)
+    db = Database(data, compressor=Compressor(dict_dir=config.ZSTD_DICT_DIR, enabled=False))
+    exporter = Exporter(db, out_dir, page_size=page_size, part_rows=part_rows)
+    
+    try:
+        for table in tables:
+            checkpoint = await exporter.export(table, fmt=fmt, restart=restart)
+            print(f"{table}: {checkpoint['rows']} строк, частей {len(checkpoint['parts'])}")
+    finally:
+        await data.close()
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Потоковая выгрузка таблиц Supabase")
+    parser.add_argument("tables", nargs="*", default=list(TABLES), metavar="table",
+                        help=f"таблицы: {', '.join(TABLES)} (по умолчанию все)")
+    parser.add_argument("--format", default="ndjson", choices=FORMATS)
+    parser.add_argument("--out", default=os.getenv("EXPORT_DIR", "exports"))
+    parser.add_argument("--page-size", type=int, default=1000, help="строк за запрос (не больше max rows PostgREST)")
+    parser.add_argument("--part-rows", type=int, default=100_000, help="строк в одном файле")
+    parser.add_argument("--restart", action="store_true", help="начать заново, не продолжать с checkpoint")
+    args = parser.parse_args()
+    unknown = set(args.tables) - set(TABLES)
+    if unknown:
+        parser.error(f"неизвестные таблицы: {', '.join(sorted(unknown))}")
+    
+    asyncio.run(_main(args.tables, args.format, args.out, args.page_size, args.part_rows, args.restart))
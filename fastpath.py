@@ -0,0 +1,361 @@
+import ast
+import math
+import mmap
+import os
+import re
+from fractions import Fraction
+
+# Предметы, для которых работает локальный движок
+ARITHMETIC_SUBJECTS = ('math', 'physics')
+EQUATION_SUBJECTS = ('math',)
+DICTIONARY_SUBJECTS = {'english': 'en', 'german': 'de', 'french': 'fr'}
+
+# "Сколько будет 15*7", "посчитай 2^10", "12:4=?"
+ARITHMETIC_QUERY = re.compile(
+    r'^\s*(?:сколько\s+будет|посчитай(?:те)?|вычисли(?:те)?|чему\s+равно)?\s*(?P<expr>.+?)\s*(?:=\s*)?\??\s*$',
+    re.IGNORECASE
+)
+ARITHMETIC_CHARS = re.compile(r'^[\d\s+\-*/().]+$')
+
+# "Реши уравнение 2x + 3 = 7", "найди x: 5x = 3x + 4"
+EQUATION_QUERY = re.compile(
+    r'^\s*(?:(?:реши(?:те)?\s+)?уравнение|реши(?:те)?|найди(?:те)?\s+[a-zх])?\s*:?\s*(?P<expr>[^=]+=[^=]+?)\s*\??\s*$',
+    re.IGNORECASE
+)
+EQUATION_CHARS = re.compile(r'^[\d\s+\-*/().=a-zх]+$', re.IGNORECASE)
+
+# "Как будет кошка", "переведи cat", "что значит «Hund»"; язык в запросе не важен - его задаёт предмет
+TRANSLATE_QUERY = re.compile(
+    r'^\s*(?:как\s+(?:будет|сказать|написать|перевести|переводится)|переведи(?:те)?|перевод|'
+    r'что\s+(?:значит|означает|такое))\s+(?:слово\s+|фразу\s+)?(?P<phrase>.+?)\s*[?!.]*\s*$',
+    re.IGNORECASE
+)
+LANGUAGE_WORDS = re.compile(r'\s*\b(?:на|по)[\s-]+(?:английск|немецк|французск|русск)\w*', re.IGNORECASE)
+
+OPERATORS = {ast.Add: '+', ast.Sub: '−', ast.Mult: '×', ast.Div: ':', ast.Pow: '^'}
+
+# Длина чисел (цифр) в вычислениях и результате быстрого пути
+MAX_DIGITS = 15
+
+class NotConfident(Exception):
+    """Запрос вне возможностей движка - идём обычным путём"""
+
+def _normalize_math(text: str) -> str:
+    text = text.replace('×', '*').replace('·', '*').replace('÷', '/').replace(':', '/')
+    text = text.replace('−', '-').replace('–', '-').replace('^', '**')
+    # Десятичная запятая: 2,5 -> 2.5
+    return re.sub(r'(\d),(\d)', r'\1.\2', text)
+
+def _number(value: Fraction) -> str:
+    if value.denominator == 1:
+        return str(value.numerator)
+    decimal = f"{float(value):.6g}"
+    # Конечная дробь - как десятичная, иначе ещё и обыкновенной
+    return decimal if len(decimal) <= 8 and Fraction(decimal) == value else f"{value.numerator}/{value.denominator} ≈ {decimal}"
+
+def _term(k: Fraction, variable: str) -> str:
+    """Коэффициент при переменной: x, -x, 2x, 1/3·x"""
+    if abs(k) == 1:
+        return variable if k > 0 else f"-{variable}"
+    number = _number(k)
+    return f"{k.numerator}/{k.denominator}·{variable}" if '≈' in number else f"{number}{variable}"
+
+def _constant(node) -> Fraction:
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return _bounded(Fraction(str(node.value)))
+    raise NotConfident
+
+def evaluate(node) -> Fraction:
+    """Безопасное вычисление: только числа, + - * / ** и скобки, без eval"""
+    if isinstance(node, ast.Expression):
+        return evaluate(node.body)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = evaluate(node.operand)
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+        left, right = evaluate(node.left), evaluate(node.right)
+        if isinstance(node.op, ast.Add):
+            return _bounded(left + right)
+        if isinstance(node.op, ast.Sub):
+            return _bounded(left - right)
+        if isinstance(node.op, ast.Mult):
+            return _bounded(left * right)
+        if isinstance(node.op, ast.Div):
+            if right == 0:
+                raise ZeroDivisionError
+            return _bounded(left / right)
+        # Степень: только целая и небольшая, чтобы не считать 9**9**9
+        if right.denominator != 1 or abs(right) > 64 or abs(left) > 10 ** 6 or (left == 0 and right < 0):
+            raise NotConfident
+        # Размер результата оцениваем до вычисления: 1000000^64 - уже не школьная арифметика
+        if left and abs(right) * math.log10(max(abs(left.numerator), left.denominator)) > MAX_DIGITS:
+            raise NotConfident
+        return _bounded(left ** int(right))
+    return _constant(node)
+
+def _bounded(value: Fraction) -> Fraction:
+    """Число длиннее MAX_DIGITS цифр (в числителе или знаменателе) - не для быстрого ответа"""
+    if abs(value.numerator) >= 10 ** MAX_DIGITS or value.denominator >= 10 ** MAX_DIGITS:
+        raise NotConfident
+    return value
+
+def _first_step(node) -> str | None:
+    """Первое действие по порядку операций (для выражений из нескольких действий)"""
+    if isinstance(node, ast.BinOp):
+        for child in (node.left, node.right):
+            step = _first_step(child)
+            if step:
+                return step
+        if not isinstance(node.left, ast.BinOp) and not isinstance(node.right, ast.BinOp):
+            left, right = evaluate(node.left), evaluate(node.right)
+            return f"{_number(left)} {OPERATORS[type(node.op)]} {_number(right)} = {_number(evaluate(node))}"
+    return None
+
+def _hint(node) -> str:
+    """Подсказка к одному действию - как его посчитать, без результата"""
+    left, right = evaluate(node.left), evaluate(node.right)
+    a, b = _number(left), _number(right)
+    if isinstance(node.op, ast.Mult):
+        for first, second in ((left, right), (right, left)):
+            if first.denominator == 1 and first > 10 and first % 10:
+                tens, units = first - first % 10, first % 10
+                return (f"Разложи на разряды: {_number(first)} × {_number(second)} = "
+                        f"{_number(tens)} × {_number(second)} + {_number(units)} × {_number(second)}. "
+                        f"Посчитай оба произведения и сложи — что получилось?")
+        return f"Умножь {a} на {b} — можно в столбик. Что получилось?"
+    if isinstance(node.op, ast.Div):
+        return f"Подумай, на какое число нужно умножить {b}, чтобы получилось {a}. Что выходит?"
+    if isinstance(node.op, ast.Pow):
+        if right < 0:
+            return f"Отрицательная степень: {a}^{b} = 1 : {a}^{_number(-right)}. Сначала посчитай {a}^{_number(-right)}."
+        return f"{a}^{b} — это {a}, умноженное само на себя {b} раз. Умножай по шагам — что получилось?"
+    action = "Сложи" if isinstance(node.op, ast.Add) else "Вычти"
+    return f"{action} по разрядам (или в столбик): сначала единицы, потом десятки. Что получилось?"
+
+def _linear(node, variable: str) -> tuple[Fraction, Fraction]:
+    """Выражение как k*x + b; нелинейное - NotConfident"""
+    if isinstance(node, ast.Name):
+        if node.id != variable:
+            raise NotConfident
+        return Fraction(1), Fraction(0)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        k, b = _linear(node.operand, variable)
+        return (-k, -b) if isinstance(node.op, ast.USub) else (k, b)
+    if isinstance(node, ast.BinOp):
+        (k1, b1), (k2, b2) = _linear(node.left, variable), _linear(node.right, variable)
+        if isinstance(node.op, ast.Add):
+            return k1 + k2, b1 + b2
+        if isinstance(node.op, ast.Sub):
+            return k1 - k2, b1 - b2
+        if isinstance(node.op, ast.Mult) and (k1 == 0 or k2 == 0):
+            return k1 * b2 + k2 * b1, b1 * b2
+        if isinstance(node.op, ast.Div) and k2 == 0 and b2 != 0:
+            return k1 / b2, b1 / b2
+        raise NotConfident
+    return Fraction(0), _constant(node)
+
+class Dictionary:
+    """
+    Словарь на диске: отсортированный по байтам TSV "слово\\tперевод",
+    поиск бинарный по mmap - в память не читается, открывается при первом запросе.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._map = None
+    
+    def _open(self):
+        if self._map is None:
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+    
+    def lookup(self, key: str) -> str | None:
+        data = self._open()
+        target = key.encode('utf-8')
+        lo, hi = 0, len(data)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = data.rfind(b'\n', 0, mid) + 1
+            end = data.find(b'\n', start)
+            if end == -1:
+                end = len(data)
+            tab = data.find(b'\t', start, end)
+            line_key = data[start:tab]
+            if line_key < target:
+                lo = end + 1
+            elif line_key > target:
+                hi = start
+            else:
+                return data[tab + 1:end].decode('utf-8')
+        return None
+    
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+QUOTES = '"\'«»„“”'
+ARTICLE = re.compile(r"^(?:(?:der|die|das|le|la|les|the|to)\s+|l')")
+
+def normalize_word(text: str) -> str:
+    text = text.strip().strip(QUOTES).strip()
+    return re.sub(r'\s+', ' ', text.lower().replace('ё', 'е'))
+
+def build_dictionary(pairs: list, path: str):
+    """Индекс из пар (русское, иностранное): обе стороны - ключи, сортировка по байтам"""
+    entries = {}
+    for russian, foreign in pairs:
+        entries.setdefault(normalize_word(russian).encode('utf-8'), foreign.strip())
+        # Иностранное слово ищется и с артиклем, и без: "der Hund" и "Hund"
+        for key in {normalize_word(foreign), ARTICLE.sub('', normalize_word(foreign))}:
+            entries.setdefault(key.encode('utf-8'), russian.strip())
+    with open(path, 'wb') as f:
+        for key in sorted(entries):
+            f.write(key + b'\t' + entries[key].encode('utf-8') + b'\n')
+
+class LocalAnswerer:
+    """
+    Локальный быстрый путь до кеша и Groq: арифметика и линейные уравнения
+    (подсказка, а не ответ - как требует промпт) и перевод отдельных слов.
+    Результат арифметики целиком - только с reveal_arithmetic.
+    Всё, в чём движок не уверен, возвращает None - и вопрос идёт обычным путём.
+    """
+    
+    def __init__(self, dict_dir: str = "data/dict", enabled: bool = True, reveal_arithmetic: bool = False):
+        self.enabled = enabled
+        self.reveal_arithmetic = reveal_arithmetic
+        self.dictionaries = {}
+        for subject, language in DICTIONARY_SUBJECTS.items():
+            path = os.path.join(dict_dir, f"{language}.tsv")
+            if os.path.exists(path):
+                self.dictionaries[subject] = Dictionary(path)
+        
+        self.stats = {'arithmetic': 0, 'equation': 0, 'dictionary': 0, 'fallthrough': 0}
+    
+    def answer(self, subject: str, question: str) -> str | None:
+        if not self.enabled or len(question) > 120:
+            return None
+        
+        for kind, solver in (('arithmetic', self._arithmetic), ('equation', self._equation),
+                             ('dictionary', self._translate)):
+            try:
+                result = solver(subject, question)
+            except (NotConfident, SyntaxError, ValueError, ZeroDivisionError, OverflowError, RecursionError):
+                result = None
+            if result:
+                self.stats[kind] += 1
+                return result
+        
+        self.stats['fallthrough'] += 1
+        return None
+    
+    def _arithmetic(self, subject: str, question: str) -> str | None:
+        if subject not in ARITHMETIC_SUBJECTS:
+            return None
+        match = ARITHMETIC_QUERY.match(question)
+        expression = _normalize_math(match.group('expr')) if match else ''
+        if not ARITHMETIC_CHARS.match(expression) or not re.search(r'\d\s*(?:[-+*/]|\*\*)\s*[\d(]', expression):
+            return None
+        
+        tree = ast.parse(expression, mode='eval')
+        try:
+            value = evaluate(tree)
+        except ZeroDivisionError:
+            return "На ноль делить нельзя — проверь, нет ли в выражении деления на 0."
+        
+        shown = expression.replace('**', '^').replace('*', '×').replace('/', ':')
+        several = isinstance(tree.body, ast.BinOp) and (
+            isinstance(tree.body.left, ast.BinOp) or isinstance(tree.body.right, ast.BinOp))
+        if self.reveal_arithmetic:
+            answer = f"{shown} = {_number(value)}"
+            # В выражении несколько действий - напоминаем порядок
+            if several:
+                answer += f"\n\nПорядок действий: сначала {_first_step(tree.body)}, дальше по тому же правилу."
+            return answer
+        
+        # Как требует промпт математики: шаг к ответу, а не сам ответ
+        if several:
+            return (f"{shown}\n\nПорядок действий: сначала {_first_step(tree.body)}, "
+                    f"дальше по тому же правилу. Что получается в итоге?")
+        if not isinstance(tree.body, ast.BinOp):
+            return None  # одно число - объяснять нечего
+        return f"{shown}\n\n{_hint(tree.body)}"
+    
+    def _equation(self, subject: str, question: str) -> str | None:
+        if subject not in EQUATION_SUBJECTS:
+            return None
+        match = EQUATION_QUERY.match(question)
+        if not match:
+            return None
+        expression = _normalize_math(match.group('expr')).replace('х', 'x').replace('Х', 'x')
+        if not EQUATION_CHARS.match(expression):
+            return None
+        
+        variables = set(re.findall(r'[a-z]', expression, re.IGNORECASE))
+        if len(variables) != 1:
+            return None
+        variable = variables.pop()
+        
+        # Неявное умножение: 2x, 3(x+1), (x+1)(x-1)
+        expression = re.sub(r'(\d|\))\s*(?=[a-zA-Z(])', r'\1*', expression)
+        left_text, right_text = expression.split('=')
+        (k1, b1) = _linear(ast.parse(left_text.strip(), mode='eval').body, variable)
+        (k2, b2) = _linear(ast.parse(right_text.strip(), mode='eval').body, variable)
+        
+        k, b = k1 - k2, b2 - b1
+        if k == 0:
+            return None  # нет решений или бесконечно много - пусть объяснит учитель
+        
+        # Как требует промпт: шаг к решению, а не готовый ответ
+        steps = []
+        if k2 != 0:
+            steps.append(f"Перенеси слагаемые с {variable} в левую часть, а числа — в правую, меняя знак.")
+        elif b1 != 0:
+            steps.append("Перенеси числа в правую часть с противоположным знаком.")
+        if k == 1:
+            if not steps:
+                return None  # уже решено, например "x = 5"
+            steps.append(f"Слева останется только {variable} — сколько получилось справа?")
+        else:
+            steps.append(f"Получится {_term(k, variable)} = {_number(b)}.")
+            if abs(k.numerator) == 1:
+                steps.append(f"Осталось умножить обе части на {_number(1 / k)}. Что выходит?")
+            else:
+                steps.append(f"Осталось разделить обе части на {_number(k)}. Что выходит?")
+        return " ".join(steps)
+    
+    def _translate(self, subject: str, question: str) -> str | None:
+        dictionary = self.dictionaries.get(subject)
+        if dictionary is None:
+            return None
+        match = TRANSLATE_QUERY.match(LANGUAGE_WORDS.sub('', question))
+        if not match:
+            return None
+        
+        phrase = normalize_word(match.group('phrase'))
+        if not phrase or len(phrase.split()) > 3:
+            return None
+        # Ключи словаря - и с артиклем, и без: "the cat" найдётся как "cat"
+        translation = dictionary.lookup(phrase) or dictionary.lookup(ARTICLE.sub('', phrase))
+        if not translation:
+            return None
+        return f"{match.group('phrase').strip().strip(QUOTES)} — {translation}"
+    
+    def close(self):
+        for dictionary in self.dictionaries.values():
+            dictionary.close()
+
+if __name__ == "__main__":
+    import argparse
+    import csv
+    
+    parser = argparse.ArgumentParser(description="Сборка словаря для быстрого пути из TSV пар (русское, иностранное)")
+    parser.add_argument("source", help="TSV: русское слово<TAB>перевод")
+    parser.add_argument("out", help="например data/dict/en.tsv")
+    args = parser.parse_args()
+    
+    with open(args.source, encoding='utf-8') as f:
+        pairs = [row[:2] for row in csv.reader(f, delimiter='\t') if len(row) >= 2 and not row[0].startswith('#')]
+    build_dictionary(pairs, args.out)
+    print(f"{len(pairs)} пар -> {args.out}")
@@ -1,17 +1,79 @@
+import asyncio
 import re
-from groq import Groq
+import threading
+import time
+
+from lanes import LaneBusy
+
+# Модели и параметры генерации; их смена меняет пространство имён кеша (namespaces.py)
+SIMPLE_MODEL = "llama-3.1-8b-instant"
+MEDIUM_MODEL = "llama-3.3-70b-versatile"
+COMPLEX_MODEL = "openai/gpt-oss-120b"
+GENERATION = {'temperature': 0.4, 'top_p': 0.9, 'max_tokens': 384}
+
+class Answer(str):
+    """Текст ответа модели; truncated - обрезан лимитом max_tokens (finish_reason=length)"""
+    truncated = False
 
 class GroqRouter:
-    def __init__(self, api_keys: list):
+    def __init__(self, api_keys: list, lazy: bool = True, usage=None, lanes=None, budget=None):
         self.api_keys = api_keys
         self.current_key_index = 0
-        self.clients = [Groq(api_key=key) for key in api_keys]
+        self.usage = usage  # UsageTracker: учёт токенов и выбор ключа по прогнозу квоты
+        self.lanes = lanes  # LaneScheduler: свои слоты и потоки для текста и фото
+        self.budget = budget  # AnswerBudget: max_tokens и стоп-последовательности по типу вопроса
+        # SDK импортируется и клиенты создаются при первом обращении
+        self._clients = [None] * len(api_keys)
+        self._lock = threading.Lock()
+        
+        if not lazy:
+            self.prepare()
+    
+    def _client(self, index: int):
+        if self._clients[index] is None:
+            with self._lock:
+                if self._clients[index] is None:
+                    from groq import Groq
+                    self._clients[index] = Groq(api_key=self.api_keys[index])
+        return self._clients[index]
+    
+    def prepare(self):
+        """Создать все клиенты заранее (можно вызывать из потока)"""
+        for index in range(len(self.api_keys)):
+            self._client(index)
+    
+    @property
+    def clients(self) -> list:
+        return [self._client(index) for index in range(len(self.api_keys))]
+    
+    def acquire(self) -> tuple[int, object]:
+        """Следующий ключ (индекс и клиент): по кругу, исчерпанные по прогнозу пропускаются"""
+        index = self.current_key_index
+        if self.usage:
+            index = self.usage.pick_key(index)
+        self.current_key_index = (index + 1) % len(self.api_keys)
+        return index, self._client(index)
     
     def get_client(self):
         """Rotation API ключей при rate limit"""
-        client = self.clients[self.current_key_index]
-        self.current_key_index = (self.current_key_index + 1) % len(self.clients)
-        return client
+        return self.acquire()[1]
+    
+    def record(self, index: int, model: str, response, started: float, **tags):
+        """Учесть токены и задержку вызова (started - time.monotonic() до запроса)"""
+        if self.usage:
+            self.usage.record(index, model, getattr(response, 'usage', None), time.monotonic() - started, **tags)
+    
+    async def run(self, lane: str, func, **kwargs):
+        """Синхронный вызов SDK в потоке: в своей полосе, без планировщика - в общем пуле"""
+        if self.lanes is None:
+            return await asyncio.to_thread(func, **kwargs)
+        return await self.lanes.run(lane, func, **kwargs)
+    
+    def note_error(self, index: int, error: Exception):
+        """Дневной лимит токенов/запросов - ключ исчерпан до сброса квоты"""
+        text = str(error).lower()
+        if self.usage and "rate_limit" in text and ("per day" in text or "tpd" in text or "rpd" in text):
+            self.usage.mark_exhausted(index)
     
     def assess_complexity(self, text: str) -> str:
         """
@@ -48,38 +110,66 @@ class GroqRouter:
         for pattern in complex_patterns:
             if isinstance(pattern, bool):
                 if pattern:
-                    return "llama-3.3-70b-versatile"
+                    return MEDIUM_MODEL
             elif re.search(pattern, text_lower):
-                return "openai/gpt-oss-120b"
+                return COMPLEX_MODEL
         
         # Проверяем простые паттерны
         for pattern in simple_patterns:
             if isinstance(pattern, bool):
                 if pattern:
-                    return "llama-3.1-8b-instant"
+                    return SIMPLE_MODEL
             elif re.search(pattern, text_lower):
-                return "llama-3.1-8b-instant"
+                return SIMPLE_MODEL
         
         # По умолчанию средняя модель
-        return "openai/gpt-oss-120b"
+        return COMPLEX_MODEL
     
-    async def get_response(self, messages: list, max_retries: int = 3):
-        """Запрос с fallback на другие API ключи"""
-        model = self.assess_complexity(messages[-1]["content"])
+    async def get_response(self, messages: list, max_retries: int = 3, model: str | None = None, max_tokens: int | None = None,
+                           user_id: int | None = None, subject: str | None = None, kind: str = "text"):
+        """
+        Запрос с fallback на другие API ключи (max_tokens по умолчанию - из AnswerBudget).
+        Возвращает Answer: строку с признаком обрезки лимитом (такой ответ не кешируется).
+        """
+        model = model or self.assess_complexity(messages[-1]["content"])
+        
+        # Лимит ответа под предмет, модель и тип вопроса; явный max_tokens вызывающего важнее
+        plan = self.budget.plan(messages, model, subject, kind) if self.budget and max_tokens is None else None
+        extra = {}
+        if plan:
+            max_tokens = plan['max_tokens']
+            if plan['stop']:
+                extra['stop'] = plan['stop']
+        max_tokens = max_tokens or GENERATION['max_tokens']
         
         for attempt in range(max_retries):
+            index = None
             try:
-                client = self.get_client()
-                response = client.chat.completions.create(
+                index, client = self.acquire()
+                started = time.monotonic()
+                # SDK синхронный - в потоке полосы llm, чтобы не блокировать event loop и быстрые запросы
+                response = await self.run(
+                    'llm',
+                    client.chat.completions.create,
                     model=model,
                     messages=messages,
-                    temperature=0.4,  # Было 0.7 - снижено для меньшей "креативности"
-                    max_tokens=384,   # Было 1024 - уменьшено для кратких ответов
-                    top_p=0.9
+                    temperature=GENERATION['temperature'],  # Было 0.7 - снижено для меньшей "креативности"
+                    max_tokens=max_tokens,   # Без AnswerBudget 384 (было 1024) - для кратких ответов
+                    top_p=GENERATION['top_p'],
+                    **extra
                 )
-                return response.choices[0].message.content
+                self.record(index, model, response, started, user_id=user_id, subject=subject, kind=kind)
+                if plan:
+                    self.budget.observe(plan, response, time.monotonic() - started)
+                answer = Answer(response.choices[0].message.content)
+                answer.truncated = response.choices[0].finish_reason == 'length'
+                return answer
             
+            except LaneBusy:
+                raise
             except Exception as e:
+                if index is not None:
+                    self.note_error(index, e)
                 if "rate_limit" in str(e).lower() and attempt < max_retries - 1:
                     continue
                 elif attempt == max_retries - 1:
@@ -1,10 +1,17 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+import asyncio
+import os
 import re
 
+from prompts import build_messages, get_system_tokens
+from exercises import split_exercises, find_exercise, wants_batch, exercise_prompt, DEFAULT_QUESTION
+from tokens import estimate_tokens
+from lanes import LaneBusy, BUSY_MESSAGES
+
 router = Router()
 
 class UserState(StatesGroup):
@@ -81,16 +88,14 @@ def beautify_math(text: str) -> str:
     return text
 
 @router.message(Command("start"))
-async def cmd_start(message: Message, db, state: FSMContext):
+async def cmd_start(message: Message, users, state: FSMContext):
     user_id = message.from_user.id
     
     # Сбрасываем состояние
     await state.clear()
     
-    # Создаем пользователя если новый
-    user = await db.get_user(user_id)
-    if not user:
-        await db.create_user(user_id, message.from_user.username)
+    # Создаем пользователя если новый (проверка в памяти, запись в БД - отложенной пачкой)
+    users.ensure_user(user_id, message.from_user.username)
     
     # Инлайн кнопки выбора предмета
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -119,13 +124,14 @@ async def cmd_start(message: Message, db, state: FSMContext):
     )
 
 @router.callback_query(F.data.startswith("subject:"))
-async def select_subject(callback: CallbackQuery, state: FSMContext, db):
+async def select_subject(callback: CallbackQuery, state: FSMContext, users, history):
     subject = callback.data.split(":")[1]
     
     await state.update_data(subject=subject)
     await state.set_state(UserState.subject_selected)
+    await history.reset(state)
     
-    await db.update_user_subject(callback.from_user.id, subject)
+    users.set_subject(callback.from_user.id, subject, callback.from_user.username)
     
     await callback.message.edit_text(
         f"✅ Выбран предмет: *{SUBJECTS[subject]}*\n\n"
@@ -164,7 +170,7 @@ async def cmd_change_subject(message: Message, state: FSMContext):
     )
 
 @router.message(F.photo)
-async def handle_photo(message: Message, state: FSMContext, vision, db):
+async def handle_photo(message: Message, state: FSMContext, vision, db, history, batch, speculator=None):
     user_id = message.from_user.id
     data = await state.get_data()
     subject = data.get('subject')
@@ -208,6 +214,18 @@ async def handle_photo(message: Message, state: FSMContext, vision, db):
     )
     await state.set_state(UserState.waiting_for_question)
     
+    # Новое фото — новый диалог; сам текст хранится один раз, реплики на него ссылаются
+    await history.reset(state, ocr_text=extracted_text)
+    
+    # Пока ученик пишет вопрос - готовим объяснение "по умолчанию" (те же промпты, что в handle_text)
+    if speculator:
+        instruction, exercises = split_exercises(extracted_text)
+        if exercises:
+            prompts = [exercise_prompt(instruction, text) for _, text in exercises[:batch.max_exercises]]
+        else:
+            prompts = [ocr_question(extracted_text, DEFAULT_QUESTION)]
+        speculator.start(user_id, subject, prompts)
+    
     # Показываем что распознали и ЖДЕМ вопрос
     await message.answer(
         f"📝 {summary}\n\n"
@@ -215,8 +233,10 @@ async def handle_photo(message: Message, state: FSMContext, vision, db):
         parse_mode="Markdown"
     )
 
-@router.message(F.text)
-async def handle_text(message: Message, state: FSMContext, groq, cache, db):
+# Команды - не сюда: иначе этот хендлер перехватит все команды, объявленные ниже
+@router.message(F.text & ~F.text.startswith('/'))
+async def handle_text(message: Message, state: FSMContext, groq, cache, db, history, batch, speculator=None,
+                      answerer=None):
     user_id = message.from_user.id
     
     # Игнорируем команды - они обрабатываются отдельными хендлерами
@@ -235,19 +255,61 @@ async def handle_text(message: Message, state: FSMContext, groq, cache, db):
     # Проверяем - это вопрос после фото или обычный вопрос?
     if current_state == UserState.waiting_for_question:
         # Это вопрос по распознанному тексту
-        recognized_text = data.get('last_recognized_text', '')
+        recognized_text = data.get('last_recognized_text')
+        if not recognized_text:
+            # Текст вытеснен из хранилища сессий или сессия истекла
+            await state.set_state(UserState.subject_selected)
+            await message.answer("📷 Я уже не помню то фото. Пришли его ещё раз, пожалуйста.")
+            return
+        instruction, exercises = split_exercises(recognized_text)
+        exercise = find_exercise(message.text, exercises) if exercises else None
         
-        # Формируем контекст: распознанный текст + вопрос пользователя
-        full_question = f"Контекст (распознанный текст):\n{recognized_text}\n\nВопрос ученика: {message.text}"
+        if exercise:
+            # Ученик назвал номер - в промпт идёт только это упражнение
+            await process_question(
+                message, exercise_prompt(instruction, exercise[1], message.text), subject, groq, cache, db,
+                state=state, history=history, turn_question=message.text, ocr=True
+            )
+        elif exercises and wants_batch(message.text):
+            # Вопрос ко всем заданиям на фото - решаем их параллельно
+            await solve_exercises(
+                message, instruction, exercises, subject, groq, cache, db, batch,
+                state=state, history=history, speculator=speculator
+            )
+        elif speculator and not exercises and speculator.matches(message.text):
+            # "Реши" / "объясни" - объяснение уже готовится с момента распознавания
+            question = ocr_question(recognized_text, DEFAULT_QUESTION)
+            await process_question(
+                message, question, subject, groq, cache, db,
+                state=state, history=history, turn_question=message.text, ocr=True,
+                speculator=speculator
+            )
+        else:
+            # Формируем контекст: распознанный текст + вопрос пользователя
+            full_question = ocr_question(recognized_text, message.text)
+            
+            await process_question(
+                message, full_question, subject, groq, cache, db,
+                state=state, history=history, turn_question=message.text, ocr=True
+            )
         
-        await process_question(message, full_question, subject, groq, cache, db)
+        # Заготовки по этому фото больше не понадобятся
+        if speculator:
+            speculator.discard(message.from_user.id)
         
         # Возвращаем в обычный режим
         await state.set_state(UserState.subject_selected)
         await state.update_data(last_recognized_text=None)
     else:
         # Обычный текстовый вопрос без фото
-        await process_question(message, message.text, subject, groq, cache, db)
+        await process_question(
+            message, message.text, subject, groq, cache, db,
+            state=state, history=history, answerer=answerer
+        )
+
+def ocr_question(recognized_text: str, question: str) -> str:
+    """Вопрос по распознанному тексту: контекст + вопрос ученика"""
+    return f"Контекст (распознанный текст):\n{recognized_text}\n\nВопрос ученика: {question}"
 
 async def generate_summary(text: str, subject: str, vision) -> str:
     """Генерирует краткий саммари распознанного текста"""
@@ -265,40 +327,107 @@ async def generate_summary(text: str, subject: str, vision) -> str:
     else:
         return f"Распознал текст. Начало: *{text_preview}...*"
 
-async def process_question(message, question: str, subject: str, groq, cache, db):
-    """Основная логика обработки вопроса"""
+async def solve_exercises(message, instruction: str, exercises: list, subject: str, groq, cache, db, batch,
+                          state=None, history=None, speculator=None):
+    """Пакетный режим: упражнения с фото решаются параллельно, ответы приходят по мере готовности"""
+    total = min(len(exercises), batch.max_exercises)
+    await message.answer(f"📋 Нашёл заданий: {len(exercises)}. Разбираю {total}, ответы пришлю по мере готовности.")
+    
+    async def solve_one(exercise):
+        number, text = exercise
+        # Каждое упражнение - отдельный запрос со своим ключом кеша
+        question = exercise_prompt(instruction, text)
+        return await process_question(
+            message, question, subject, groq, cache, db,
+            title=f"Задание {number}",
+            speculator=speculator
+        )
+    
+    answers = []
+    async for (number, _), response in batch.solve(message.from_user.id, exercises, solve_one):
+        if response:
+            answers.append((number, response))
+    
+    # В историю - одна реплика со всеми ответами по порядку номеров
+    if history and state and answers:
+        answers.sort(key=lambda answer: int(answer[0]))
+        combined = "\n\n".join(f"Задание {number}: {response}" for number, response in answers)
+        await history.remember(state, subject, message.text, combined, ocr=True)
+
+async def process_question(message, question: str, subject: str, groq, cache, db,
+                           state=None, history=None, turn_question: str | None = None, ocr: bool = False,
+                           title: str | None = None, speculator=None, answerer=None) -> str | None:
+    """Основная логика обработки вопроса; возвращает ответ (None при ошибке)"""
+    
+    # Заголовок нужен, когда ответов несколько (пакетный режим)
+    prefix = f"📚 {title}\n\n" if title else "📚 "
+    
+    # turn_question - как реплика попадёт в историю (без полного распознанного текста)
+    turn_question = turn_question or question
+    
+    # Контекст диалога нужен только уточняющим вопросам
+    context = []
+    if history and state:
+        dialog = await history.load(state)
+        if dialog['turns'] and history.is_followup(turn_question):
+            reserved = get_system_tokens(subject) + estimate_tokens(question)
+            context = history.build_context(dialog, reserved=reserved)
+    
+    # Ответ на уточнение зависит от контекста - такой ответ не кешируем
+    use_cache = not context
+    
+    # Локальный быстрый путь: арифметика, уравнения, словарь - без кеша и Groq
+    local = answerer.answer(subject, question) if answerer and use_cache else None
+    if local:
+        await message.answer(f"{prefix}{local}")
+        # Отдельным флагом: в долю попаданий кеша локальные ответы не входят
+        await db.log_question(message.from_user.id, subject, question, from_local=True)
+        if history and state:
+            await history.remember(state, subject, turn_question, local, ocr=ocr)
+        return local
     
     # Проверка кеша
-    cached = await cache.get(subject, question)
+    cached = await cache.get(subject, question) if use_cache else None
     if cached:
         # Применяем beautification к закешированному ответу
         beautified = beautify_math(cached)
-        await message.answer(f"📚 {beautified}")
+        await message.answer(f"{prefix}{beautified}")
         await db.log_question(message.from_user.id, subject, question, from_cache=True)
-        return
+        if history and state:
+            await history.remember(state, subject, turn_question, cached, ocr=ocr)
+        return cached
     
     # Запрос к Groq
-    from prompts import get_system_prompt
-    
-    messages = [
-        {"role": "system", "content": get_system_prompt(subject)},
-        {"role": "user", "content": question}
-    ]
+    messages = build_messages(subject, question, context)
     
     try:
-        response = await groq.get_response(messages)
+        # Ответ, который начали готовить сразу после OCR (speculation.py), иначе - запрос.
+        # Забираем только после промаха кеша: заготовка, не понадобившаяся ответу, отменяется в discard
+        response = await speculator.claim(message.from_user.id, question) if speculator else None
+        if not response:
+            response = await groq.get_response(messages, user_id=message.from_user.id, subject=subject)
         
         # Применяем beautification к ответу
         beautified_response = beautify_math(response)
         
         # Сохранение в кеш (оригинальный ответ, beautify применяется при выдаче)
-        await cache.set(subject, question, response)
+        if use_cache:
+            await cache.set(subject, question, response)
         
         # Логируем вопрос
         await db.log_question(message.from_user.id, subject, question, from_cache=False)
         
-        await message.answer(f"📚 {beautified_response}")
+        await message.answer(f"{prefix}{beautified_response}")
+        
+        # Запоминаем после отправки: сжатие истории не задерживает ответ
+        if history and state:
+            await history.remember(state, subject, turn_question, response, ocr=ocr)
         
+        return response
+    
+    except LaneBusy:
+        # Полоса LLM переполнена - сразу говорим, а не держим ученика в очереди
+        await message.answer(BUSY_MESSAGES['llm'])
     except Exception as e:
         await message.answer(
             "😔 Извините, произошла временная ошибка.\n\n"
@@ -351,10 +480,11 @@ async def cmd_admin_menu(message: Message):
 
 💾 *Кеш:*
 /cache_stats - статистика кеша
-/clear_cache - очистить старый кеш (>30 дней)
+/clear_cache - очистить старый кеш (>30 дней и сверх лимита)
 
 🔧 *Система:*
-/health - проверка здоровья бота"""
+/health - проверка здоровья бота
+/export - выгрузка таблиц (`/export cache parquet`, `/export restart`)"""
     
     await message.answer(text, parse_mode="Markdown")
 
@@ -454,7 +584,7 @@ async def cmd_top_users(message: Message, db):
     await message.answer(text, parse_mode="Markdown")
 
 @router.message(Command("cache_stats"))
-async def cmd_cache_stats(message: Message, db):
+async def cmd_cache_stats(message: Message, db, cache, warmer, retention, regenerator):
     """Статистика кеша"""
     from config import Config
     config = Config()
@@ -469,6 +599,38 @@ async def cmd_cache_stats(message: Message, db):
     text += f"🔥 Самый популярный предмет: {cache_stats['most_cached_subject']}\n"
     text += f"⭐️ Средние хиты: {cache_stats['avg_hits']:.1f}\n\n"
     
+    local = cache.local_stats()
+    progress = warmer.progress
+    text += "*Локальный кеш и прогрев:*\n"
+    text += f"🧠 В памяти: {local['size']}/{local['capacity']} (хитов: {local['hits']})\n"
+    text += f"🔥 Прогрев: {progress['status']}, предметов {progress['subjects_done']}/{progress['subjects_total']}\n"
+    text += f"📥 Загружено: {progress['preloaded']}, предсгенерировано: {progress['pregenerated']}\n"
+    if progress['last_run']:
+        text += f"🕒 Последний прогрев: {progress['last_run']}\n"
+    text += "\n"
+    
+    if cache.namespaces:
+        text += "*Версии ответов:*\n"
+        for subject, info in cache.namespaces.summary().items():
+            line = f"{SUBJECTS.get(subject, subject)}: `{info['current']}`"
+            if info['previous']:
+                line += f" (прошлая `{info['previous']}` ещё {info['grace_hours_left']} ч)"
+            text += line + "\n"
+        regen = regenerator.stats
+        text += (
+            f"♻️ Из прошлой версии: {cache.stale_hits}, перегенерировано {regen['regenerated']}, "
+            f"в очереди {len(regenerator.queue)}, ошибок {regen['failed']}\n\n"
+        )
+    
+    evicted = retention.stats
+    text += "*Автоочистка:*\n"
+    text += f"🧹 Удалено всего: {evicted['deleted_total']} (последний проход: {evicted['deleted_last']})\n"
+    if evicted['rows'] is not None:
+        text += f"📏 Размер: {evicted['rows']}/{retention.max_rows} записей, ~{evicted['bytes'] / 1024 / 1024:.1f} МБ\n"
+    if evicted['last_run']:
+        text += f"🕒 Последний проход: {evicted['last_run']} ({evicted['last_duration']:.1f} с)\n"
+    text += "\n"
+    
     text += "*Топ-5 популярных вопросов:*\n"
     for idx, item in enumerate(cache_stats['top_cached'][:5], 1):
         question = item['question'][:50] + "..." if len(item['question']) > 50 else item['question']
@@ -477,7 +639,8 @@ async def cmd_cache_stats(message: Message, db):
     await message.answer(text, parse_mode="Markdown")
 
 @router.message(Command("health"))
-async def cmd_health(message: Message, db, groq):
+async def cmd_health(message: Message, db, groq, local_sync, usage, rate_limit, send_queue, lanes, speculator,
+                     answerer, loop_monitor, sessions, heap, budget, users, cache):
     """Проверка здоровья системы"""
     from config import Config
     config = Config()
@@ -498,18 +661,120 @@ async def cmd_health(message: Message, db, groq):
     try:
         test_response = await groq.get_response([
             {"role": "user", "content": "Привет, это тест. Ответь одним словом: OK"}
-        ])
+        ], kind="health")
         text += "✅ Groq API: OK\n"
     except Exception as e:
         text += f"❌ Groq API: ОШИБКА ({str(e)[:50]})\n"
     
+    # Локальный уровень SQLite и синхронизация
+    if local_sync:
+        backlog = await local_sync.store.backlog()
+        text += f"💽 Локальное хранилище: ждут отправки {backlog['events']} событий, {backlog['cache']} ответов\n"
+        if local_sync.stats['last_error']:
+            text += f"⚠️ Последняя ошибка синхронизации: {local_sync.stats['last_error'][:50]}\n"
+    
+    # Профили пользователей: сколько созданий отсеял bloom-фильтр
+    text += (
+        f"👤 Пользователи: в фильтре {users.stats['loaded']}, новых {users.stats['created']}, "
+        f"создание пропущено по фильтру {users.stats['skipped']}, "
+        f"ждут записи {len(users.pending_new) + len(users.pending_subjects)}\n"
+    )
+    
     # Количество API ключей
     text += f"\n🔑 API ключей: {len(config.GROQ_API_KEYS)}\n"
     
+    # Полосы работы: занятость и время в очереди против SLO
+    for name, lane in lanes.stats().items():
+        text += (
+            f"🛣 {name}: {lane['active']}/{lane['concurrency']}, ждут {lane['waiting']}, "
+            f"очередь p95 {lane['queue_p95_ms']} мс (SLO {lane['slo_ms']:.0f}), "
+            f"вне SLO {lane['slo_missed']}, отказов {lane['rejected']}\n"
+        )
+    
+    # Задержка event loop и последняя блокировка
+    if loop_monitor:
+        loop = loop_monitor.snapshot()
+        text += (
+            f"🔁 Event loop: задержка p50 {loop['lag_p50_ms']} / p95 {loop['lag_p95_ms']} / "
+            f"max {loop['lag_max_ms']} мс, блокировок > {loop['threshold_ms']:.0f} мс: {loop['blocked']}\n"
+        )
+        if loop['blocks']:
+            last = loop['blocks'][-1]
+            text += f"  последняя: {last['blocked_ms']} мс в {last['task']}, {last['site']}\n"
+        if loop['sync_io']:
+            text += f"  синхронный ввод-вывод в цикле: {loop['sync_io_calls']} вызовов, мест {len(loop['sync_io'])}\n"
+    
+    # Память процесса и сессии FSM
+    memory, session = heap.summary(), sessions.summary()
+    text += (
+        f"🧠 Память: RSS {memory['rss_mb']} МБ, сессий {session['sessions']}, "
+        f"вынесенных текстов {session['blobs']} ({session['blob_kb']} из {session['blob_limit_kb']} КБ), "
+        f"истекло {session['expired']}, вытеснено {session['blob_evicted']}\n"
+    )
+    
+    # Лимит ответа: адаптивный против контрольной группы с прежними 384
+    if budget.enabled:
+        answers = budget.summary()
+        adaptive, control = answers['adaptive'], answers['control']
+        text += (
+            f"📏 Лимит ответа: в среднем {adaptive['avg_max_tokens'] or '—'} токенов вместо 384, "
+            f"обрезано {adaptive['truncation_rate'] or 0:.1%} (при 384: {control['truncation_rate'] or 0:.1%}), "
+            f"спасено длинных ответов {answers['rescued']}, зарезервировано меньше на {answers['reserved_saved']:,} токенов\n"
+        )
+        if answers['latency_p50_saved_ms'] is not None:
+            text += (
+                f"  задержка p50 {adaptive['latency_p50_ms']} мс против {control['latency_p50_ms']} мс "
+                f"у контрольной группы\n"
+            )
+        text += f"  обрезанных ответов не закешировано: {cache.truncated_skipped}\n"
+    
+    # Локальный быстрый путь
+    local = answerer.stats
+    text += (
+        f"⚡ Локально: арифметика {local['arithmetic']}, уравнения {local['equation']}, "
+        f"словарь {local['dictionary']}, дальше по обычному пути {local['fallthrough']}\n"
+    )
+    
+    # Спекулятивные ответы после OCR
+    if speculator.daily_budget:
+        spec = speculator.summary()
+        hit_rate = f"{spec['hit_rate']:.0%}" if spec['hit_rate'] is not None else "—"
+        text += (
+            f"🔮 Спекуляция: попаданий {spec['hits']}/{spec['started']} ({hit_rate}), "
+            f"впустую {spec['wasted']}, пропущено под нагрузкой {spec['skipped_pressure']}, "
+            f"бюджет {spec['budget_left']}\n"
+        )
+    
+    # Очередь исходящих сообщений
+    latency = send_queue.latency()
+    text += (
+        f"📤 Отправка: задержка очереди p50 {latency['p50']} / p95 {latency['p95']} мс, "
+        f"в очереди {sum(len(q) for q in send_queue.queues.values())}, "
+        f"RetryAfter {send_queue.stats['retry_after']}, ошибок {send_queue.stats['failed']}\n"
+    )
+    
+    # Отказы по лимитам на пользователя
+    text += f"🚦 Лимиты: пропущено {rate_limit.stats['allowed']}, отклонено {rate_limit.stats['rejected']}\n"
+    
+    # Расход токенов за сутки и прогноз исчерпания квоты по ключам
+    summary = usage.summary()
+    text += f"🪙 Токенов за сутки: {summary['total']:,}\n"
+    for key in summary['keys']:
+        line = f"  {key['key']}: {key['used']:,} ({key['rate_per_min']:,}/мин)"
+        if key['exhausted']:
+            line += " — исчерпан"
+        elif key['exhausts_in'] is not None and key['exhausts_today']:
+            line += f" — кончится через {key['exhausts_in'] / 3600:.1f} ч"
+        text += line + "\n"
+    if summary['models']:
+        text += "По моделям: " + ", ".join(f"{m} {t:,}" for m, t in summary['models']) + "\n"
+    if summary['subjects']:
+        text += "По предметам: " + ", ".join(f"{s} {t:,}" for s, t in summary['subjects']) + "\n"
+    
     await message.answer(text, parse_mode="Markdown")
 
 @router.message(Command("clear_cache"))
-async def cmd_clear_cache(message: Message, db):
+async def cmd_clear_cache(message: Message, db, retention):
     """Очистить старый кеш"""
     from config import Config
     config = Config()
@@ -517,10 +782,54 @@ async def cmd_clear_cache(message: Message, db):
     if message.from_user.id not in config.ADMIN_IDS:
         return
     
-    deleted = await db.clear_old_cache(days=30)
+    # Внеочередной проход автоочистки: старые записи без хитов + лимиты размера
+    deleted = await retention.run_once()
     
     await message.answer(
-        f"🧹 Очищен кеш старше 30 дней\n\n"
+        f"🧹 Очищен кеш старше 30 дней и сверх лимита размера\n\n"
         f"Удалено записей: {deleted}",
         parse_mode="Markdown"
-    )
\ No newline at end of file
+    )
+
+@router.message(Command("export"))
+async def cmd_export(message: Message, exporter):
+    """Выгрузка questions_log / users / cache в файлы (в фоне, с продолжением после обрыва)"""
+    from config import Config
+    from export import TABLES, FORMATS
+    config = Config()
+    
+    if message.from_user.id not in config.ADMIN_IDS:
+        return
+    
+    if exporter.task and not exporter.task.done():
+        progress = "\n".join(
+            f"• {table}: {p['rows']} строк, частей {p['parts']} ({p['status']})"
+            for table, p in exporter.progress.items()
+        )
+        await message.answer(f"⏳ Выгрузка уже идёт:\n{progress}")
+        return
+    
+    # /export [таблицы...] [ndjson|parquet] [restart]
+    args = message.text.split()[1:]
+    tables = [arg for arg in args if arg in TABLES] or list(TABLES)
+    fmt = next((arg for arg in args if arg in FORMATS), "ndjson")
+    restart = "restart" in args
+    
+    await message.answer(f"📤 Выгружаю {', '.join(tables)} ({fmt}). Пришлю файлы, когда закончу.")
+    exporter.task = asyncio.create_task(run_export(message, exporter, tables, fmt, restart))
+
+async def run_export(message: Message, exporter, tables: list, fmt: str, restart: bool):
+    """Фоновая часть /export: выгрузить и прислать файлы (до 50 МБ - лимит Telegram)"""
+    try:
+        for table in tables:
+            checkpoint = await exporter.export(table, fmt=fmt, restart=restart)
+            await message.answer(f"✅ {table}: {checkpoint['rows']} строк, частей {len(checkpoint['parts'])}")
+            
+            for path in checkpoint['parts']:
+                if os.path.getsize(path) > 50 * 1024 * 1024:
+                    await message.answer(f"📁 {path} больше 50 МБ — забрать с сервера или через `python export.py`")
+                    continue
+                await message.answer_document(FSInputFile(path))
+    except Exception as e:
+        await message.answer(f"❌ Выгрузка прервана: {e}\nПовторите /export — продолжится с места обрыва.")
+        print(f"Export error: {e}")
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import time
+import tracemalloc
+from collections import deque
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса (Linux - /proc; иначе пиковый из getrusage)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class HeapMonitor:
+    """
+    RSS процесса во времени и топ выделений памяти через tracemalloc.
+    Трассировка дорогая (память и CPU на каждое выделение) - включается явно:
+    MEMORY_TRACE=1 при старте или из админки на время разбора.
+    """
+    
+    def __init__(self, interval: float = 60.0, history: int = 1440, trace: bool = False, frames: int = 1):
+        self.interval = interval
+        self.frames = frames
+        self.samples = deque(maxlen=history)  # (unix-время, RSS байт)
+        self.baseline = None  # снимок при включении трассировки - для сравнения
+        if trace:
+            self.start_trace()
+    
+    def start_trace(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.baseline = tracemalloc.take_snapshot()
+    
+    def stop_trace(self):
+        tracemalloc.stop()
+        self.baseline = None
+    
+    def sample(self):
+        self.samples.append((int(time.time()), rss_bytes()))
+    
+    async def run(self):
+        """Фоновая задача: замер RSS раз в interval"""
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+    
+    def top(self, limit: int = 20, diff: bool = False) -> list:
+        """Крупнейшие места выделения памяти (или прирост с момента включения трассировки)"""
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*"),
+        ])
+        if diff and self.baseline:
+            stats = snapshot.compare_to(self.baseline, 'lineno')
+            return [
+                {'where': str(stat.traceback), 'size_kb': round(stat.size / 1024, 1),
+                 'diff_kb': round(stat.size_diff / 1024, 1), 'count': stat.count}
+                for stat in stats[:limit]
+            ]
+        return [
+            {'where': str(stat.traceback), 'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+            for stat in snapshot.statistics('lineno')[:limit]
+        ]
+    
+    def summary(self) -> dict:
+        traced, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            'rss_mb': round(rss_bytes() / 1024 / 1024, 1),
+            'rss_history_mb': [(at, round(size / 1024 / 1024, 1)) for at, size in self.samples],
+            'tracing': tracemalloc.is_tracing(),
+            'traced_mb': round(traced / 1024 / 1024, 1),
+            'traced_peak_mb': round(peak / 1024 / 1024, 1),
+        }
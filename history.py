@@ -0,0 +1,155 @@
+import asyncio
+import re
+
+from tokens import estimate_tokens
+
+SUMMARY_MODEL = "llama-3.1-8b-instant"
+
+# Признаки уточняющего вопроса, которому нужен контекст диалога
+FOLLOWUP_PATTERNS = [
+    r'^(а|и|но|то есть|тогда|а если|а как|а что|а почему)\b',
+    r'^(почему|зачем|подробнее|ещё|еще|дальше|продолжи)\b',
+    r'^не (понял|поняла|понятно|ясно)',
+    r'\b(это|этого|этот|эту|этом|его|её|там|выше|предыдущ|следующ)\b',
+]
+
+SUMMARY_PROMPT = """Сожми диалог ученика с учителем (предмет: {subject}) в краткую справку (3-5 предложений).
+Сохрани: тему, что ученик уже понял, на каком шаге остановились, термины и обозначения из задачи.
+Не добавляй новых объяснений."""
+
+class ConversationHistory:
+    """Память диалога в FSM с бюджетом токенов и сжатием старых реплик"""
+    
+    def __init__(self, groq, token_budget: int = 1200, keep_turns: int = 4, ocr_budget: int = 800,
+                 prompt_budget: int = 4000, subject_names: dict | None = None):
+        self.groq = groq
+        self.subject_names = subject_names or {}
+        self._background = set()  # сжатия истории, идущие после ответа
+        self._compressing = set()  # ключи FSM, для которых сжатие уже запущено
+        self.token_budget = token_budget
+        self.prompt_budget = prompt_budget
+        self.keep_turns = keep_turns
+        self.ocr_budget = ocr_budget
+    
+    @staticmethod
+    def is_followup(question: str) -> bool:
+        """Уточняющий вопрос к предыдущему ответу?"""
+        text = question.lower().strip()
+        return any(re.search(pattern, text) for pattern in FOLLOWUP_PATTERNS)
+    
+    @staticmethod
+    def _turn_tokens(turn: dict) -> int:
+        return estimate_tokens(turn["q"]) + estimate_tokens(turn["a"]) + 8
+    
+    async def load(self, state) -> dict:
+        """Достать историю из FSM"""
+        data = await state.get_data()
+        return {
+            'summary': data.get('history_summary'),
+            'turns': data.get('history') or [],
+            'ocr': data.get('history_ocr'),
+        }
+    
+    async def reset(self, state, ocr_text: str | None = None):
+        """Начать диалог заново (смена предмета или новое фото)"""
+        await state.update_data(history=[], history_summary=None, history_ocr=ocr_text)
+    
+    def build_context(self, history: dict, reserved: int = 0) -> list:
+        """
+        Сообщения контекста в пределах бюджета токенов.
+        reserved - токены системного промпта и вопроса, уже занятые в запросе.
+        Распознанный текст добавляется один раз, реплики ссылаются на него.
+        """
+        context = []
+        budget = min(self.token_budget, self.prompt_budget - reserved)
+        
+        if history['summary']:
+            context.append({"role": "system", "content": f"Кратко о предыдущем разговоре: {history['summary']}"})
+            budget -= estimate_tokens(history['summary'])
+        
+        # Берём свежие реплики с конца, пока хватает бюджета
+        selected = []
+        for turn in reversed(history['turns']):
+            cost = self._turn_tokens(turn)
+            if cost > budget:
+                break
+            selected.append(turn)
+            budget -= cost
+        selected.reverse()
+        
+        if history['ocr'] and any(turn.get('ocr') for turn in selected):
+            ocr_text = self._truncate(history['ocr'], min(self.ocr_budget, max(budget, 0)))
+            if ocr_text:
+                context.append({"role": "system", "content": f"Распознанный текст с фото ученика:\n{ocr_text}"})
+        
+        for turn in selected:
+            context.append({"role": "user", "content": turn["q"]})
+            context.append({"role": "assistant", "content": turn["a"]})
+        
+        return context
+    
+    @staticmethod
+    def _truncate(text: str, max_tokens: int) -> str:
+        if estimate_tokens(text) <= max_tokens:
+            return text
+        # Пропорционально укорачиваем по символам
+        ratio = max_tokens / estimate_tokens(text)
+        return text[:int(len(text) * ratio)].rstrip() + "…"
+    
+    async def remember(self, state, subject: str, question: str, answer: str, ocr: bool = False):
+        """Записать реплику; при переполнении старые сжимаются в фоне, ответ их не ждёт"""
+        history = await self.load(state)
+        turns = history['turns'] + [{"q": question, "a": answer, "ocr": ocr}]
+        await state.update_data(history=turns)
+        
+        total = estimate_tokens(history['summary']) + sum(self._turn_tokens(t) for t in turns)
+        if total > self.token_budget and len(turns) > self.keep_turns and state.key not in self._compressing:
+            self._compressing.add(state.key)
+            task = asyncio.create_task(self._compress(state, subject, history['summary'], turns[:-self.keep_turns]))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+    
+    async def _compress(self, state, subject: str, summary: str | None, old: list):
+        """Сжать старые реплики и убрать их из истории, если диалог не сбросили за это время"""
+        try:
+            summary = await self._summarize(subject, summary, old)
+            turns = (await self.load(state))['turns']
+            if turns[:len(old)] == old:
+                await state.update_data(history=turns[len(old):], history_summary=summary)
+        except Exception as e:
+            print(f"History compress error: {e}")
+        finally:
+            self._compressing.discard(state.key)
+    
+    async def wait_background(self):
+        """Дождаться сжатий при остановке"""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+    
+    def subject_name(self, subject: str) -> str:
+        """Название предмета для промпта: «Математика», а не math"""
+        name = self.subject_names.get(subject, subject)
+        # Эмодзи в конце названия кнопки промпту не нужен
+        return re.sub(r'\s+[^\w\s]+$', '', name)
+    
+    async def _summarize(self, subject: str, summary: str | None, turns: list) -> str | None:
+        """Сжать старые реплики дешёвой моделью"""
+        dialog = "\n".join(f"Ученик: {t['q']}\nУчитель: {t['a']}" for t in turns)
+        if summary:
+            dialog = f"Ранее: {summary}\n{dialog}"
+        
+        try:
+            return await self.groq.get_response(
+                [
+                    {"role": "system", "content": SUMMARY_PROMPT.format(subject=self.subject_name(subject))},
+                    {"role": "user", "content": dialog}
+                ],
+                model=SUMMARY_MODEL,
+                max_tokens=200,
+                subject=subject,
+                kind="summary"
+            )
+        except Exception as e:
+            print(f"History summarize error: {e}")
+            # Без сжатия просто теряем старые реплики, но бюджет соблюдаем
+            return summary
@@ -0,0 +1,154 @@
+import asyncio
+import contextvars
+import functools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+# Ответ при переполненной полосе: лучше сразу сказать, чем молча держать в очереди
+BUSY_MESSAGES = {
+    'fast': "⏳ Секунду, я немного занят. Повтори, пожалуйста, через пару секунд.",
+    'llm': "⏳ Сейчас очень много вопросов. Попробуй ещё раз через минуту.",
+    'vision': "⏳ Сейчас распознаю много фото. Пришли своё через минуту — я обязательно разберу.",
+}
+
+# Полоса, слот которой уже занят в текущей обработке (хендлер фото держит слот vision)
+_held = contextvars.ContextVar('lane_held', default=None)
+
+class LaneBusy(Exception):
+    """Очередь полосы переполнена - запрос не принят"""
+    
+    def __init__(self, lane: str):
+        super().__init__(f"lane {lane} is full")
+        self.lane = lane
+
+class Lane:
+    """
+    Полоса работы: свой лимит параллельности, своя очередь ожидания с ограничением
+    и свой пул потоков для синхронных SDK. SLO - допустимое время в очереди.
+    """
+    
+    def __init__(self, name: str, concurrency: int, max_waiting: int, slo_ms: float, threads: int | None = None):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.slo_ms = slo_ms
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=threads or concurrency, thread_name_prefix=f"lane-{name}")
+        
+        self.waiting = 0
+        self.active = 0
+        self.queue_times = deque(maxlen=1000)  # мс ожидания слота
+        self.stats = {'admitted': 0, 'rejected': 0, 'slo_missed': 0}
+    
+    def admits(self) -> bool:
+        """Есть свободный слот или место в очереди"""
+        return not self.semaphore.locked() or self.waiting < self.max_waiting
+    
+    @asynccontextmanager
+    async def slot(self):
+        """Занять слот полосы (LaneBusy - очередь переполнена)"""
+        if not self.admits():
+            self.stats['rejected'] += 1
+            raise LaneBusy(self.name)
+        
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        
+        waited = (time.monotonic() - started) * 1000
+        self.queue_times.append(waited)
+        self.stats['admitted'] += 1
+        if waited > self.slo_ms:
+            self.stats['slo_missed'] += 1
+        
+        self.active += 1
+        token = _held.set(self.name)
+        try:
+            yield
+        finally:
+            _held.reset(token)
+            self.active -= 1
+            self.semaphore.release()
+    
+    async def run(self, func, *args, **kwargs):
+        """Синхронный вызов в потоках полосы (с contextvars, как asyncio.to_thread)"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, functools.partial(context.run, func, *args, **kwargs))
+    
+    def snapshot(self) -> dict:
+        ordered = sorted(self.queue_times)
+        percentile = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))]) if ordered else 0
+        return {
+            'active': self.active,
+            'waiting': self.waiting,
+            'concurrency': self.concurrency,
+            'queue_p50_ms': percentile(0.5),
+            'queue_p95_ms': percentile(0.95),
+            'slo_ms': self.slo_ms,
+            **self.stats,
+        }
+
+class LaneScheduler:
+    """
+    Полосы fast (кеш, команды, кнопки), llm (запросы к Groq) и vision (фото).
+    Дешёвая работа не ждёт за 45-секундным OCR: у каждой полосы свои слоты и потоки.
+    """
+    
+    def __init__(self, limits: dict):
+        # limits: полоса -> (параллельно, ожидающих, SLO мс)
+        self.lanes = {
+            name: Lane(name, int(concurrency), int(max_waiting), slo_ms,
+                       threads=min(int(concurrency), 4) if name == 'fast' else None)
+            for name, (concurrency, max_waiting, slo_ms) in limits.items()
+        }
+    
+    def __getitem__(self, name: str) -> Lane:
+        return self.lanes[name]
+    
+    def classify(self, event) -> str | None:
+        """Полоса апдейта; None - слот берётся позже (текст: только при запросе к Groq)"""
+        if getattr(event, 'photo', None):
+            return 'vision'
+        if getattr(event, 'data', None) is not None:
+            return 'fast'  # кнопка
+        if (getattr(event, 'text', None) or '').startswith('/'):
+            return 'fast'
+        return None
+    
+    async def middleware(self, handler, event, data):
+        """Middleware: апдейт занимает слот своей полосы на всё время обработки"""
+        lane = self.lanes.get(self.classify(event))
+        if lane is None:
+            return await handler(event, data)
+        
+        if not lane.admits():
+            lane.stats['rejected'] += 1
+            try:
+                await event.answer(BUSY_MESSAGES[lane.name])
+            except Exception as e:
+                print(f"Lane busy reply error: {e}")
+            return None
+        
+        async with lane.slot():
+            return await handler(event, data)
+    
+    async def run(self, name: str, func, *args, **kwargs):
+        """Синхронный вызов в полосе: слот (если ещё не занят этой обработкой) + потоки полосы"""
+        lane = self.lanes[name]
+        if _held.get() == name:
+            return await lane.run(func, *args, **kwargs)
+        async with lane.slot():
+            return await lane.run(func, *args, **kwargs)
+    
+    def stats(self) -> dict:
+        return {name: lane.snapshot() for name, lane in self.lanes.items()}
+    
+    def shutdown(self):
+        for lane in self.lanes.values():
+            lane.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import signal
+import time
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+class Lifecycle:
+    """
+    Жизненный цикл процесса для деплоя без потерь: по SIGTERM перестаём брать
+    новые апдейты, дожидаемся текущих ответов (с дедлайном) и сбрасываем буферы.
+    """
+    
+    RUNNING = "running"
+    DRAINING = "draining"
+    STOPPED = "stopped"
+    
+    def __init__(self, drain_timeout: float = 25.0, hook_timeout: float = 5.0):
+        self.drain_timeout = drain_timeout
+        self.hook_timeout = hook_timeout
+        self.state = self.RUNNING
+        
+        self.inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._hooks = []  # (название, функция) - выполняются по порядку
+        self._on_stop = None
+        
+        self.stats = {'rejected': 0, 'drained': 0, 'abandoned': 0, 'drain_seconds': None}
+    
+    @property
+    def draining(self) -> bool:
+        return self.state != self.RUNNING
+    
+    @asynccontextmanager
+    async def track(self):
+        """Учесть выполняющуюся обработку - завершение её дождётся"""
+        self.inflight += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            if self.inflight == 0:
+                self._idle.set()
+    
+    async def middleware(self, handler, event, data):
+        """Outer-middleware: во время остановки апдейты не берём, остальные учитываем"""
+        if self.draining:
+            # Апдейт не обработан - Telegram отдаст его новому экземпляру
+            self.stats['rejected'] += 1
+            return None
+        
+        async with self.track():
+            return await handler(event, data)
+    
+    def on_shutdown(self, name: str, hook):
+        """Зарегистрировать сброс буфера / закрытие ресурса (sync или async) при остановке"""
+        self._hooks.append((name, hook))
+    
+    def install_signals(self, on_stop):
+        """Свой обработчик SIGTERM/SIGINT: on_stop останавливает приём апдейтов"""
+        self._on_stop = on_stop
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.begin_drain, sig)
+            except NotImplementedError:
+                # Windows: сигналы через loop не поддерживаются
+                pass
+    
+    def begin_drain(self, sig=None):
+        """Перейти в режим остановки (повторный сигнал игнорируется)"""
+        if self.draining:
+            return
+        
+        self.state = self.DRAINING
+        logger.warning(f"Received {sig.name if sig else 'stop'}, draining {self.inflight} in-flight requests")
+        if self._on_stop:
+            asyncio.create_task(self._on_stop())
+    
+    async def shutdown(self):
+        """Дождаться текущих обработок (не дольше drain_timeout) и выполнить хуки"""
+        # Polling мог завершиться и без сигнала - новые апдейты всё равно не берём
+        self.state = self.DRAINING
+        started = time.monotonic()
+        
+        inflight = self.inflight
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.drain_timeout)
+            self.stats['drained'] = inflight
+        except asyncio.TimeoutError:
+            self.stats['abandoned'] = self.inflight
+            self.stats['drained'] = inflight - self.inflight
+            logger.warning(f"Drain deadline reached, {self.inflight} requests abandoned")
+        
+        self.stats['drain_seconds'] = round(time.monotonic() - started, 2)
+        
+        # Хуки по порядку: сначала сброс буферов, потом закрытие соединений
+        for name, hook in self._hooks:
+            try:
+                result = hook()
+                if asyncio.iscoroutine(result):
+                    await asyncio.wait_for(result, self.hook_timeout)
+            except Exception as e:
+                print(f"Shutdown hook {name} error: {e}")
+        
+        self.state = self.STOPPED
+        logger.info(f"Shutdown complete: {self.stats}")
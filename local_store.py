@@ -0,0 +1,248 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    subject TEXT,
+    question TEXT,
+    response TEXT NOT NULL,
+    hit_count INTEGER DEFAULT 0,
+    created_at TEXT,
+    synced INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS cache_unsynced ON cache (synced) WHERE synced = 0;
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class LocalStore:
+    """
+    Локальный надёжный уровень на SQLite (WAL): кеш ответов и журнал событий.
+    Переживает недоступность Supabase, синхронизируется в фоне (LocalSync).
+    Кеш ограничен max_rows: лишние синхронизированные записи вытесняются по хитам (LFU).
+    """
+    
+    def __init__(self, path: str = "local_store.db", executor=None, max_rows: int = 20000):
+        self.path = path
+        self.max_rows = max_rows
+        self.executor = executor  # пул потоков полосы fast (None - общий пул asyncio)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+    
+    def _execute(self, sql: str, params=(), many: bool = False) -> list:
+        with self._lock:
+            if many:
+                self._conn.executemany(sql, params)
+                return []
+            return self._conn.execute(sql, params).fetchall()
+    
+    async def _run(self, sql: str, params=(), many: bool = False) -> list:
+        # Диск - в потоке, чтобы не блокировать event loop; свой пул - чтобы не ждать за Groq
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._execute, sql, params, many)
+    
+    # ---- кеш ответов ----
+    
+    async def get(self, cache_key: str) -> tuple[str, int] | None:
+        """Ответ и число хитов по ключу"""
+        rows = await self._run("SELECT response, hit_count FROM cache WHERE key = ?", (cache_key,))
+        return rows[0] if rows else None
+    
+    async def put(self, cache_key: str, subject: str, question: str, response: str,
+                  hit_count: int = 0, created_at: str | None = None, synced: bool = False):
+        """Сохранить ответ; несинхронизированные записи уйдут в Supabase фоном"""
+        await self.put_many([(cache_key, subject, question, response, hit_count, created_at, synced)])
+    
+    async def put_many(self, rows: list):
+        await self._run(
+            "INSERT INTO cache (key, subject, question, response, hit_count, created_at, synced) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET response = excluded.response, synced = excluded.synced, "
+            "hit_count = MAX(cache.hit_count, excluded.hit_count)",
+            [
+                (key, subject, question, response, hit_count,
+                 created_at or datetime.utcnow().isoformat(), int(synced))
+                for key, subject, question, response, hit_count, created_at, synced in rows
+            ],
+            many=True
+        )
+    
+    async def delete(self, keys: list):
+        await self._run("DELETE FROM cache WHERE key = ?", [(k,) for k in keys], many=True)
+    
+    async def trim(self) -> int:
+        """Вытеснить записи сверх max_rows: меньше хитов, старше - первыми; неотправленные не трогаем"""
+        total = (await self._run("SELECT COUNT(*) FROM cache"))[0][0]
+        excess = total - self.max_rows
+        if excess <= 0:
+            return 0
+        await self._run(
+            "DELETE FROM cache WHERE key IN "
+            "(SELECT key FROM cache WHERE synced = 1 ORDER BY hit_count, created_at LIMIT ?)",
+            (excess,)
+        )
+        return excess
+    
+    async def synced_keys(self, after: str = '', limit: int = 200) -> list:
+        """Ключи синхронизированных записей по порядку (для сверки с Supabase)"""
+        rows = await self._run(
+            "SELECT key FROM cache WHERE synced = 1 AND key > ? ORDER BY key LIMIT ?", (after, limit)
+        )
+        return [row[0] for row in rows]
+    
+    async def unsynced_cache(self, limit: int = 200) -> list:
+        rows = await self._run(
+            "SELECT key, subject, question, response FROM cache WHERE synced = 0 LIMIT ?", (limit,)
+        )
+        return [dict(zip(('key', 'subject', 'question', 'response'), row)) for row in rows]
+    
+    async def mark_synced(self, keys: list):
+        await self._run("UPDATE cache SET synced = 1 WHERE key = ?", [(k,) for k in keys], many=True)
+    
+    # ---- журнал событий (outbox) ----
+    
+    async def add_event(self, kind: str, payload: dict):
+        """Записать событие в локальный журнал"""
+        await self._run(
+            "INSERT INTO events (kind, payload, created_at) VALUES (?, ?, ?)",
+            (kind, json.dumps(payload, ensure_ascii=False), datetime.utcnow().isoformat())
+        )
+    
+    async def pending_events(self, kind: str, limit: int = 500) -> list:
+        rows = await self._run(
+            "SELECT id, payload FROM events WHERE kind = ? ORDER BY id LIMIT ?", (kind, limit)
+        )
+        return [(event_id, json.loads(payload)) for event_id, payload in rows]
+    
+    async def delete_events(self, ids: list):
+        await self._run("DELETE FROM events WHERE id = ?", [(i,) for i in ids], many=True)
+    
+    # ---- служебное ----
+    
+    async def get_meta(self, name: str) -> str | None:
+        rows = await self._run("SELECT value FROM meta WHERE name = ?", (name,))
+        return rows[0][0] if rows else None
+    
+    async def set_meta(self, name: str, value: str):
+        await self._run(
+            "INSERT INTO meta (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+            (name, value)
+        )
+    
+    async def backlog(self) -> dict:
+        """Сколько записей ждут отправки в Supabase"""
+        events = await self._run("SELECT COUNT(*) FROM events")
+        cache = await self._run("SELECT COUNT(*) FROM cache WHERE synced = 0")
+        return {'events': events[0][0], 'cache': cache[0][0]}
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class LocalSync:
+    """Фоновая двусторонняя синхронизация LocalStore <-> Supabase"""
+    
+    def __init__(self, store: LocalStore, cache, db, interval: float = 10.0, batch_size: int = 200):
+        self.store = store
+        self.cache = cache
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        
+        self.stats = {
+            'pushed_events': 0, 'pushed_cache': 0, 'pulled_cache': 0, 'removed_cache': 0, 'trimmed_cache': 0,
+            'last_ok': None, 'last_error': None,
+        }
+    
+    async def run(self):
+        """Фоновая задача"""
+        while True:
+            await self.sync_once()
+            await asyncio.sleep(self.interval)
+    
+    async def sync_once(self):
+        """Один цикл: отправить журнал и новые ответы, забрать чужие ответы, убрать удалённые"""
+        try:
+            await self.push_events()
+            await self.push_cache()
+            await self.pull_cache()
+            await self.reconcile_cache()
+            self.stats['trimmed_cache'] += await self.store.trim()
+            self.stats['last_ok'] = datetime.utcnow().strftime('%d.%m %H:%M:%S')
+        except Exception as e:
+            # Supabase недоступен - данные остаются локально до следующего цикла
+            self.stats['last_error'] = str(e)[:100]
+            print(f"Local sync error: {e}")
+    
+    async def push_events(self):
+        while True:
+            events = await self.store.pending_events('question', limit=self.batch_size)
+            if not events:
+                return
+            await self.db.insert_questions([payload for _, payload in events])
+            await self.store.delete_events([event_id for event_id, _ in events])
+            self.stats['pushed_events'] += len(events)
+            if len(events) < self.batch_size:
+                return
+    
+    async def push_cache(self):
+        while True:
+            rows = await self.store.unsynced_cache(limit=self.batch_size)
+            if not rows:
+                return
+            await self.cache.push_rows(rows)
+            await self.store.mark_synced([row['key'] for row in rows])
+            self.stats['pushed_cache'] += len(rows)
+            if len(rows) < self.batch_size:
+                return
+    
+    async def pull_cache(self):
+        """Забрать записи, созданные другими экземплярами бота (по отметке created_at + key)"""
+        since = await self.store.get_meta('cache_pulled_at') or '1970-01-01T00:00:00'
+        after_key = await self.store.get_meta('cache_pulled_key') or ''
+        rows, cursor = await self.cache.pull_since(since, after_key, limit=self.batch_size)
+        if cursor is None:
+            return
+        
+        if rows:
+            await self.store.put_many([
+                (row['key'], row['subject'], row['question'], row['response'],
+                 row.get('hit_count') or 0, row['created_at'], True)
+                for row in rows
+            ])
+        await self.store.set_meta('cache_pulled_at', cursor[0])
+        await self.store.set_meta('cache_pulled_key', cursor[1])
+        self.stats['pulled_cache'] += len(rows)
+    
+    async def reconcile_cache(self):
+        """
+        Сверить страницу локальных ключей с Supabase и удалить то, что там вытеснено
+        (очисткой этого или другого экземпляра). За цикл - одна страница, по кругу.
+        """
+        after = await self.store.get_meta('cache_reconciled_key') or ''
+        keys = await self.store.synced_keys(after, limit=self.batch_size)
+        if not keys:
+            await self.store.set_meta('cache_reconciled_key', '')
+            return
+        
+        existing = await self.cache.existing_keys(keys)
+        removed = [key for key in keys if key not in existing]
+        if removed:
+            await self.cache.forget(removed)
+            self.stats['removed_cache'] += len(removed)
+        await self.store.set_meta('cache_reconciled_key', keys[-1])
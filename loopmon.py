@@ -0,0 +1,191 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Границы корзин гистограммы задержки цикла, мс
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Аудит-события синхронного ввода-вывода, которые не должны случаться в потоке цикла
+SYNC_IO_EVENTS = frozenset({
+    'socket.connect', 'socket.getaddrinfo', 'socket.gethostbyname', 'time.sleep',
+    'open', 'subprocess.Popen', 'os.system', 'sqlite3.connect',
+})
+
+def _site(frame) -> str:
+    return f"{os.path.relpath(frame.f_code.co_filename, ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+
+def _own_code(filename: str) -> bool:
+    """Файл бота (не библиотека из .venv и не сам монитор)"""
+    return filename.startswith(ROOT + os.sep) and 'site-packages' not in filename and filename != __file__
+
+def _describe_task(task) -> str:
+    if task is None:
+        return "callback"  # блокирует не корутина, а колбэк цикла
+    coro = task.get_coro()
+    return f"{task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+
+class LoopMonitor:
+    """
+    Задержка event loop: корутина-зонд засыпает на interval и меряет, насколько проснулась позже.
+    Сторожевой поток снимает стек потока цикла, если шаг блокирует дольше threshold_ms.
+    В debug-режиме аудит-хук отмечает синхронный ввод-вывод из потока цикла (место в коде бота).
+    """
+    
+    def __init__(self, threshold_ms: float = 100.0, interval: float = 0.05, debug: bool = False,
+                 max_blocks: int = 20):
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.debug = debug
+        
+        self.buckets = [0] * (len(LAG_BUCKETS_MS) + 1)  # последняя - больше 5 с
+        self.lag_sum_ms = 0.0
+        self.lag_max_ms = 0.0
+        self.recent = deque(maxlen=1200)  # последние ~минута замеров, мс
+        self.blocks = deque(maxlen=max_blocks)  # снимки стека при блокировках
+        self.sync_io = Counter()  # место в коде -> число синхронных вызовов из цикла
+        self.stats = {'samples': 0, 'blocked': 0, 'sync_io_calls': 0}
+        
+        self._loop = None
+        self._thread_id = None
+        self._deadline = None  # когда зонд должен проснуться
+        self._captured = None  # дедлайн, для которого стек уже снят
+        self._open_block = None
+        self._task = None
+        self._stop = threading.Event()
+        self._in_hook = False
+    
+    def start(self):
+        """Запустить зонд и сторожевой поток (из работающего цикла)"""
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._task = asyncio.create_task(self._probe())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        if self.debug:
+            # Аудит-хук не снимается: в stop() только выключается флагом
+            sys.addaudithook(self._audit)
+    
+    async def stop(self):
+        self._stop.set()
+        self.debug = False
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+    
+    async def _probe(self):
+        while True:
+            self._deadline = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record((time.monotonic() - self._deadline) * 1000)
+    
+    def record(self, lag_ms: float):
+        lag_ms = max(lag_ms, 0.0)
+        index = next((i for i, bound in enumerate(LAG_BUCKETS_MS) if lag_ms <= bound), len(LAG_BUCKETS_MS))
+        self.buckets[index] += 1
+        self.lag_sum_ms += lag_ms
+        self.lag_max_ms = max(self.lag_max_ms, lag_ms)
+        self.recent.append(lag_ms)
+        self.stats['samples'] += 1
+        
+        if lag_ms > self.threshold_ms:
+            self.stats['blocked'] += 1
+            # Стек снят сторожем во время этой блокировки - дописать её длительность
+            if self._open_block is not None:
+                self._open_block['blocked_ms'] = round(lag_ms)
+        self._open_block = None
+    
+    def _watch(self):
+        """Сторожевой поток: цикл не проснулся к сроку - снять стек его потока"""
+        while not self._stop.wait(self.threshold_ms / 2000):
+            deadline = self._deadline
+            if deadline is None or deadline == self._captured:
+                continue
+            late_ms = (time.monotonic() - deadline) * 1000
+            if late_ms < self.threshold_ms:
+                continue
+            
+            self._captured = deadline
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            try:
+                task = asyncio.current_task(self._loop)
+            except RuntimeError:
+                task = None
+            
+            stack = traceback.format_list(traceback.extract_stack(frame)[-12:])
+            block = {
+                'at': time.strftime('%d.%m %H:%M:%S'),
+                'blocked_ms': round(late_ms),  # уточняется, когда цикл проснётся
+                'task': _describe_task(task),
+                'site': _site(frame),
+                'stack': "".join(stack),
+            }
+            self.blocks.append(block)
+            self._open_block = block
+            print(f"Event loop blocked > {self.threshold_ms:.0f} ms in {block['task']}:\n{block['stack']}")
+    
+    def _audit(self, event: str, args: tuple):
+        if event not in SYNC_IO_EVENTS or not self.debug or self._in_hook:
+            return
+        if threading.get_ident() != self._thread_id:
+            return
+        # Неблокирующие сокеты asyncio и sleep(0) - не блокировка
+        if event == 'socket.connect' and args[0].gettimeout() == 0.0:
+            return
+        if event == 'time.sleep' and not args[0]:
+            return
+        
+        self._in_hook = True
+        try:
+            # Место вызова - ближайший кадр из кода бота; чужие библиотеки сами по себе не отмечаем
+            frame = sys._getframe(1)
+            while frame and not _own_code(frame.f_code.co_filename):
+                frame = frame.f_back
+            if frame is None:
+                return
+            
+            site = f"{event} at {_site(frame)}"
+            self.stats['sync_io_calls'] += 1
+            self.sync_io[site] += 1
+            if self.sync_io[site] == 1:
+                print(f"Sync I/O in event loop: {site}")
+        finally:
+            self._in_hook = False
+    
+    def snapshot(self) -> dict:
+        ordered = sorted(self.recent)
+        percentile = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 1) if ordered else 0
+        labels = [f"≤{bound}" for bound in LAG_BUCKETS_MS] + [f">{LAG_BUCKETS_MS[-1]}"]
+        return {
+            'lag_p50_ms': percentile(0.5),
+            'lag_p95_ms': percentile(0.95),
+            'lag_p99_ms': percentile(0.99),
+            'lag_max_ms': round(self.lag_max_ms, 1),
+            'histogram_ms': dict(zip(labels, self.buckets)),
+            'threshold_ms': self.threshold_ms,
+            **self.stats,
+            'blocks': [{k: v for k, v in block.items() if k != 'stack'} for block in self.blocks],
+            'sync_io': dict(self.sync_io.most_common(20)),
+        }
+    
+    def prometheus(self) -> str:
+        """Гистограмма задержки в текстовом формате Prometheus"""
+        lines = ["# TYPE bot_event_loop_lag_seconds histogram"]
+        total = 0
+        for bound, count in zip(LAG_BUCKETS_MS, self.buckets):
+            total += count
+            lines.append(f'bot_event_loop_lag_seconds_bucket{{le="{bound / 1000}"}} {total}')
+        lines.append(f'bot_event_loop_lag_seconds_bucket{{le="+Inf"}} {self.stats["samples"]}')
+        lines.append(f"bot_event_loop_lag_seconds_sum {self.lag_sum_ms / 1000:.6f}")
+        lines.append(f"bot_event_loop_lag_seconds_count {self.stats['samples']}")
+        lines.append("# TYPE bot_event_loop_blocked_total counter")
+        lines.append(f"bot_event_loop_blocked_total {self.stats['blocked']}")
+        lines.append("# TYPE bot_event_loop_sync_io_total counter")
+        lines.append(f"bot_event_loop_sync_io_total {self.stats['sync_io_calls']}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,94 @@
+"""
+Миграции схемы Postgres (Supabase): migrations/NNNN_*.sql по порядку номеров,
+каждая в своей транзакции. Применённые версии - в таблице schema_migrations.
+
+DATABASE_URL - строка подключения из Supabase (Project Settings → Database),
+не ключ REST API: DDL через PostgREST не выполняется. Нужен pip install psycopg.
+
+    python migrate.py                        # применить новые миграции
+    python migrate.py --status               # что применено, что нет
+    python migrate.py --maintain             # партиции questions_log без pg_cron (хранить 12 месяцев)
+"""
+
+import json
+import os
+import re
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+def load_migrations(path: str = MIGRATIONS_DIR) -> list:
+    """[(версия, имя файла, SQL)] по возрастанию версии"""
+    migrations = []
+    for name in sorted(os.listdir(path)):
+        match = re.match(r'^(\d{4})_\w+\.sql$', name)
+        if match:
+            with open(os.path.join(path, name), encoding='utf-8') as f:
+                migrations.append((match.group(1), name, f.read()))
+    return migrations
+
+def connect(url: str):
+    import psycopg  # опциональная зависимость: нужна только для миграций
+    
+    return psycopg.connect(url, autocommit=True)
+
+def applied_versions(conn) -> set:
+    conn.execute(
+        "create table if not exists schema_migrations ("
+        " version text primary key, name text not null, applied_at timestamptz default now())"
+    )
+    return {row[0] for row in conn.execute("select version from schema_migrations")}
+
+def migrate(conn, upto: str | None = None, path: str = MIGRATIONS_DIR) -> list:
+    """Применить ещё не применённые миграции (до версии upto включительно); возвращает имена файлов"""
+    done = applied_versions(conn)
+    applied = []
+    for version, name, sql in load_migrations(path):
+        if upto and version > upto:
+            break
+        if version in done:
+            continue
+        
+        # Ошибка откатывает миграцию целиком, следующие не запускаются
+        with conn.transaction():
+            conn.execute(sql)
+            conn.execute("insert into schema_migrations (version, name) values (%s, %s)", (version, name))
+        applied.append(name)
+    return applied
+
+# Срок хранения questions_log по умолчанию - тот же, что у задания pg_cron (0004) и функции (0007)
+KEEP_MONTHS = 12
+
+def maintain(conn, months_ahead: int = 2, keep_months: int = KEEP_MONTHS) -> dict:
+    """Партиции questions_log вперёд и удаление старых (то же, что делает задание pg_cron)"""
+    result = conn.execute("select questions_log_maintain(%s, %s)", (months_ahead, keep_months)).fetchone()[0]
+    return result if isinstance(result, dict) else json.loads(result)
+
+def _main(args):
+    url = args.database_url
+    if not url:
+        raise SystemExit("Нужен DATABASE_URL (строка подключения Postgres) или --database-url")
+    
+    with connect(url) as conn:
+        if args.status:
+            done = applied_versions(conn)
+            for version, name, _ in load_migrations():
+                print(f"{'✅' if version in done else '⏳'} {name}")
+        elif args.maintain:
+            print(maintain(conn, args.months_ahead, args.keep_months))
+        else:
+            applied = migrate(conn, upto=args.upto)
+            print("\n".join(f"✅ {name}" for name in applied) or "Схема актуальна")
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Миграции схемы Supabase")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--status", action="store_true", help="показать применённые миграции")
+    parser.add_argument("--upto", help="применить миграции до этой версии включительно (0003)")
+    parser.add_argument("--maintain", action="store_true", help="создать партиции вперёд и удалить старые")
+    parser.add_argument("--months-ahead", type=int, default=2)
+    parser.add_argument("--keep-months", type=int, default=KEEP_MONTHS,
+                        help=f"хранить месяцев лога (по умолчанию {KEEP_MONTHS}, 0 - не удалять)")
+    
+    _main(parser.parse_args())
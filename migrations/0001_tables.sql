@@ -0,0 +1,54 @@
+-- Базовая схема: таблицы, с которыми работает бот.
+-- Повторный запуск на существующей базе ничего не ломает: только добавляет недостающее.
+
+create table if not exists users (
+  user_id bigint primary key,
+  username text,
+  current_subject text,
+  created_at timestamptz default now()
+);
+
+create table if not exists cache (
+  key text primary key,   -- "<версия>:<хеш вопроса>" (namespaces.py)
+  subject text not null,
+  question text,
+  response text,
+  response_z text,        -- сжатый ответ (COMPRESSION_ENABLED=1)
+  hit_count int not null default 0,
+  created_at timestamptz default now()
+);
+alter table cache add column if not exists response_z text;
+
+create table if not exists questions_log (
+  id bigserial primary key,
+  user_id bigint,
+  subject text,
+  question text,
+  question_z text,        -- сжатый вопрос
+  from_cache boolean default false,
+  created_at timestamptz default now()
+);
+alter table questions_log add column if not exists question_z text;
+
+create table if not exists usage_log (
+  id bigserial primary key,
+  created_at timestamptz default now(),
+  key_id text,            -- последние 4 символа ключа
+  model text,
+  user_id bigint,
+  subject text,
+  kind text,
+  calls int,
+  prompt_tokens int,
+  completion_tokens int,
+  total_tokens int,
+  latency_ms int          -- средняя по агрегату
+);
+create index if not exists usage_log_created_at on usage_log (created_at);
+
+create table if not exists cache_namespaces (
+  subject text not null,
+  namespace text not null,
+  created_at timestamptz default now(),
+  primary key (subject, namespace)
+);
@@ -0,0 +1,101 @@
+-- questions_log по месяцам: range-партиции по created_at (UTC).
+-- Существующая таблица переносится в партиционированную целиком; вставки вне
+-- созданных месяцев попадают в questions_log_default. Создание партиции для месяца,
+-- строки которого уже в default, в этой версии функции падает - исправлено в 0007.
+
+-- Партиции с месяца since по текущий + months_ahead; возвращает число созданных
+create or replace function questions_log_ensure_partitions(months_ahead int default 2, since timestamptz default now())
+returns int language plpgsql as $$
+declare
+  month_start timestamp := date_trunc('month', since at time zone 'UTC');
+  last_start timestamp := date_trunc('month', now() at time zone 'UTC') + make_interval(months => months_ahead);
+  part text;
+  created int := 0;
+begin
+  while month_start <= last_start loop
+    part := 'questions_log_' || to_char(month_start, 'YYYY_MM');
+    if to_regclass(part) is null then
+      execute format(
+        'create table %I partition of questions_log for values from (%L) to (%L)',
+        part, month_start at time zone 'UTC', (month_start + interval '1 month') at time zone 'UTC'
+      );
+      created := created + 1;
+    end if;
+    month_start := month_start + interval '1 month';
+  end loop;
+  return created;
+end $$;
+
+-- Удалить партиции старше keep_months полных месяцев; возвращает число удалённых
+create or replace function questions_log_drop_partitions(keep_months int)
+returns int language plpgsql as $$
+declare
+  oldest date := (date_trunc('month', now() at time zone 'UTC') - make_interval(months => keep_months))::date;
+  part record;
+  dropped int := 0;
+begin
+  for part in
+    select c.oid::regclass as name, c.relname
+    from pg_inherits i join pg_class c on c.oid = i.inhrelid
+    where i.inhparent = 'questions_log'::regclass and c.relname ~ '^questions_log_\d{4}_\d{2}$'
+  loop
+    if to_date(right(part.relname, 7), 'YYYY_MM') < oldest then
+      execute format('drop table %s', part.name);
+      dropped := dropped + 1;
+    end if;
+  end loop;
+  return dropped;
+end $$;
+
+-- Ежедневное обслуживание (pg_cron или python migrate.py --maintain); keep_months = 0 - не удалять
+create or replace function questions_log_maintain(months_ahead int default 2, keep_months int default 0)
+returns jsonb language sql as $$
+  select jsonb_build_object(
+    'created', questions_log_ensure_partitions(months_ahead),
+    'dropped', case when keep_months > 0 then questions_log_drop_partitions(keep_months) else 0 end
+  )
+$$;
+
+do $$
+declare
+  oldest timestamptz;
+begin
+  if (select relkind from pg_class where oid = to_regclass('questions_log')) = 'p' then
+    return;  -- уже партиционирована
+  end if;
+
+  -- Старая таблица уступает имена: ключ и последовательность id
+  if to_regclass('questions_log') is not null then
+    alter table questions_log rename to questions_log_unpartitioned;
+    alter index if exists questions_log_pkey rename to questions_log_unpartitioned_pkey;
+    alter sequence if exists questions_log_id_seq rename to questions_log_unpartitioned_id_seq;
+  end if;
+
+  -- Ключ партиционирования обязан входить в первичный ключ
+  create table questions_log (
+    id bigserial,
+    user_id bigint,
+    subject text,
+    question text,
+    question_z text,
+    from_cache boolean not null default false,
+    created_at timestamptz not null default now(),
+    primary key (id, created_at)
+  ) partition by range (created_at);
+  create table questions_log_default partition of questions_log default;
+
+  if to_regclass('questions_log_unpartitioned') is not null then
+    select min(created_at) into oldest from questions_log_unpartitioned;
+    perform questions_log_ensure_partitions(2, coalesce(oldest, now()));
+
+    insert into questions_log (id, user_id, subject, question, question_z, from_cache, created_at)
+    select id, user_id, subject, question, question_z, coalesce(from_cache, false), coalesce(created_at, now())
+    from questions_log_unpartitioned;
+    perform setval(pg_get_serial_sequence('questions_log', 'id'),
+                   coalesce((select max(id) from questions_log), 0) + 1, false);
+
+    drop table questions_log_unpartitioned;
+  else
+    perform questions_log_ensure_partitions(2);
+  end if;
+end $$;
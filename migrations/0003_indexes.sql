@@ -0,0 +1,36 @@
+-- Индексы под формы запросов db.py, cache.py и retention.py.
+-- На партиционированной questions_log индекс создаётся на всех партициях, включая будущие.
+
+-- cache.key: точный поиск, in_(keys), upsert и удаление по ключу.
+-- Старые базы без первичного ключа: сначала убрать дубли (остаётся запись с большим числом хитов)
+do $$
+begin
+  if not exists (
+    select 1
+    from pg_index i join pg_attribute a on a.attrelid = i.indrelid and a.attnum = i.indkey[0]
+    where i.indrelid = 'cache'::regclass and i.indisunique and i.indnkeyatts = 1 and a.attname = 'key'
+  ) then
+    delete from cache a using cache b
+    where a.key = b.key and (coalesce(a.hit_count, 0), a.ctid) < (coalesce(b.hit_count, 0), b.ctid);
+    create unique index cache_key_unique on cache (key);
+  end if;
+end $$;
+
+-- Прогрев и обучение словарей: eq(subject).order(hit_count desc)
+create index if not exists cache_subject_hits on cache (subject, hit_count desc);
+-- Вытеснение: order(hit_count, created_at); очистка: hit_count = 0 and created_at < ...; топ по хитам
+create index if not exists cache_hits_created on cache (hit_count, created_at);
+-- Подтягивание чужих записей: gt(created_at).order(created_at); свежие ответы для словарей
+create index if not exists cache_created_at on cache (created_at);
+
+-- Счётчики за сутки/неделю и активные ученики: gte(created_at), select user_id (index-only scan)
+create index if not exists questions_log_created_user on questions_log (created_at, user_id);
+-- Попадания в кеш: eq(from_cache, true) [и gte(created_at)]
+create index if not exists questions_log_cache_hits on questions_log (created_at) where from_cache;
+-- Прогрев: eq(subject).gte(created_at).order(created_at desc); разбивка по предметам
+create index if not exists questions_log_subject_created on questions_log (subject, created_at desc);
+-- Топ учеников
+create index if not exists questions_log_user_created on questions_log (user_id, created_at);
+
+-- Новые пользователи за период
+create index if not exists users_created_at on users (created_at);
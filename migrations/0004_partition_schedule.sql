@@ -0,0 +1,9 @@
+-- Ежедневное обслуживание партиций questions_log через pg_cron (Supabase: Database → Extensions → pg_cron):
+-- партиции на два месяца вперёд, удаление старше 12 месяцев (тот же срок по умолчанию у migrate.py --maintain).
+-- Без pg_cron миграция ничего не делает - запускайте python migrate.py --maintain из любого планировщика.
+do $$
+begin
+  if exists (select 1 from pg_extension where extname = 'pg_cron') then
+    perform cron.schedule('questions_log_maintain', '15 3 * * *', 'select questions_log_maintain(2, 12)');
+  end if;
+end $$;
@@ -0,0 +1,12 @@
+-- Кандидаты на вытеснение кеша по оценке LFU со старением (retention.py).
+-- Оценка считается по всей таблице: старые записи с большим прошлым числом хитов
+-- тоже попадают в кандидаты, когда их оценка затухла.
+create or replace function cache_eviction_candidates(half_life_days double precision default 14, lim int default 800)
+returns table (key text, hit_count int, created_at timestamptz, score double precision)
+language sql stable as $$
+  select c.key, c.hit_count, c.created_at,
+         (c.hit_count + 1) * power(0.5, extract(epoch from now() - coalesce(c.created_at, now())) / 86400 / half_life_days)
+  from cache c
+  order by 4, c.created_at
+  limit lim
+$$;
@@ -0,0 +1,3 @@
+-- Ответы локального быстрого пути (fastpath.py) - отдельным флагом, а не как попадания в кеш.
+-- На партиционированной questions_log колонка добавляется во все партиции.
+alter table questions_log add column if not exists from_local boolean not null default false;
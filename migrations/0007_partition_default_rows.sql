@@ -0,0 +1,55 @@
+-- Партиция месяца, строки которого уже лежат в questions_log_default: create table ... partition of
+-- для такого месяца падает (строки default нарушили бы её границы), и обслуживание ломалось бы каждую ночь.
+-- Теперь default на время создания отсоединяется, строки месяца переносятся в новую партицию,
+-- default присоединяется обратно. Ошибка по одному месяцу откатывает только его и выводится предупреждением.
+create or replace function questions_log_ensure_partitions(months_ahead int default 2, since timestamptz default now())
+returns int language plpgsql as $$
+declare
+  month_start timestamp := date_trunc('month', since at time zone 'UTC');
+  last_start timestamp := date_trunc('month', now() at time zone 'UTC') + make_interval(months => months_ahead);
+  part text;
+  lo timestamptz;
+  hi timestamptz;
+  stranded boolean;
+  created int := 0;
+begin
+  while month_start <= last_start loop
+    part := 'questions_log_' || to_char(month_start, 'YYYY_MM');
+    lo := month_start at time zone 'UTC';
+    hi := (month_start + interval '1 month') at time zone 'UTC';
+    if to_regclass(part) is null then
+      begin
+        stranded := false;
+        if to_regclass('questions_log_default') is not null then
+          select exists (select 1 from questions_log_default where created_at >= lo and created_at < hi)
+          into stranded;
+        end if;
+
+        if stranded then
+          -- Блокирует questions_log на время переноса: строк в default немного (только вне партиций)
+          alter table questions_log detach partition questions_log_default;
+          execute format('create table %I partition of questions_log for values from (%L) to (%L)', part, lo, hi);
+          insert into questions_log select * from questions_log_default where created_at >= lo and created_at < hi;
+          delete from questions_log_default where created_at >= lo and created_at < hi;
+          alter table questions_log attach partition questions_log_default default;
+        else
+          execute format('create table %I partition of questions_log for values from (%L) to (%L)', part, lo, hi);
+        end if;
+        created := created + 1;
+      exception when others then
+        raise warning 'questions_log partition % not created: %', part, sqlerrm;
+      end;
+    end if;
+    month_start := month_start + interval '1 month';
+  end loop;
+  return created;
+end $$;
+
+-- Срок хранения по умолчанию - 12 месяцев, как в задании pg_cron (0004) и в python migrate.py --maintain
+create or replace function questions_log_maintain(months_ahead int default 2, keep_months int default 12)
+returns jsonb language sql as $$
+  select jsonb_build_object(
+    'created', questions_log_ensure_partitions(months_ahead),
+    'dropped', case when keep_months > 0 then questions_log_drop_partitions(keep_months) else 0 end
+  )
+$$;
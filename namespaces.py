@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from groq_client import SIMPLE_MODEL, MEDIUM_MODEL, COMPLEX_MODEL, GENERATION
+from prompts import PROMPTS, build_messages, get_system_prompt
+
+# Ключи без префикса - записи, сделанные до версионирования кеша
+LEGACY = ""
+
+def namespace_for(subject: str) -> str:
+    """Версия ответов предмета: хеш системного промпта, моделей и параметров генерации"""
+    config = [get_system_prompt(subject), [SIMPLE_MODEL, MEDIUM_MODEL, COMPLEX_MODEL], GENERATION]
+    return hashlib.sha1(json.dumps(config, ensure_ascii=False, sort_keys=True).encode()).hexdigest()[:10]
+
+class CacheNamespaces:
+    """
+    Пространства имён кеша по предметам. Ключ записи - "<версия>:<хеш вопроса>",
+    поэтому правка промпта или смены моделей не требует чистить таблицу:
+    старые ответы отдаются ещё grace часов, пока новые догенерируются в фоне.
+    """
+    
+    def __init__(self, db, grace_hours: float = 72.0, subjects=None):
+        self.db = db
+        self.grace = grace_hours * 3600
+        self.current = {subject: namespace_for(subject) for subject in (subjects or PROMPTS)}
+        # До загрузки реестра прошлую версию не отдаём: срок переходного периода отсчитывается
+        # от даты регистрации версии в реестре, а не от старта процесса
+        self.previous = {}
+        self.loaded = False
+    
+    def key(self, subject: str, digest: str) -> str:
+        namespace = self.current.get(subject)
+        return f"{namespace}:{digest}" if namespace else digest
+    
+    def stale_key(self, subject: str, digest: str) -> str | None:
+        """Ключ в прошлой версии, пока идёт переходный период; None - не искать"""
+        previous = self.previous.get(subject)
+        if previous is None or previous[1] < time.time():
+            return None
+        return f"{previous[0]}:{digest}" if previous[0] else digest
+    
+    async def load(self, retry_delay: float = 5.0, max_delay: float = 300.0):
+        """Фоновая задача: загрузить реестр, повторяя с нарастающей паузой, пока не получится"""
+        delay = retry_delay
+        while not await self.load_once():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+    
+    async def load_once(self) -> bool:
+        """Сверить текущие версии с реестром cache_namespaces, новые - зарегистрировать"""
+        try:
+            rows = await self.db.get_namespaces()
+        except Exception as e:
+            print(f"Cache namespaces load error: {e}")
+            return False
+        
+        now = datetime.now(timezone.utc)
+        complete = True
+        for subject, namespace in self.current.items():
+            known = sorted(
+                (row for row in rows if row['subject'] == subject),
+                key=lambda row: row['created_at']
+            )
+            mine = next((row for row in known if row['namespace'] == namespace), None)
+            if mine is None:
+                if not await self.db.register_namespace(subject, namespace):
+                    # Версия не записана - срок не от чего отсчитывать, прошлую не отдаём до повтора
+                    complete = False
+                    continue
+                created = now
+            else:
+                created = datetime.fromisoformat(mine['created_at'])
+            
+            # Прошлая версия - последняя зарегистрированная до текущей (или ключи без префикса)
+            older = [row for row in known if row['namespace'] != namespace
+                     and datetime.fromisoformat(row['created_at']) < created]
+            previous = older[-1]['namespace'] if older else LEGACY
+            until = created.timestamp() + self.grace
+            self.previous[subject] = (previous, until) if until > time.time() else None
+        
+        self.loaded = complete
+        return complete
+    
+    def summary(self) -> dict:
+        now = time.time()
+        return {
+            subject: {
+                'current': namespace,
+                'previous': (self.previous[subject][0] or 'legacy') if self.previous.get(subject) else None,
+                'grace_hours_left': round((self.previous[subject][1] - now) / 3600, 1)
+                if self.previous.get(subject) else 0,
+            }
+            for subject, namespace in self.current.items()
+        }
+
+class Regenerator:
+    """
+    Фоновая перегенерация ответов, отданных из прошлой версии кеша:
+    не чаще per_minute запросов к Groq и не под нагрузкой.
+    """
+    
+    def __init__(self, groq, cache, per_minute: float = 6.0, max_queue: int = 1000, lanes=None):
+        self.groq = groq
+        self.cache = cache
+        self.per_minute = per_minute
+        self.max_queue = max_queue
+        self.lanes = lanes
+        self.queue = OrderedDict()  # ключ -> (предмет, вопрос); повторы не дублируются
+        self._ready = asyncio.Event()
+        
+        self.stats = {'queued': 0, 'regenerated': 0, 'dropped': 0, 'failed': 0}
+    
+    def submit(self, subject: str, question: str):
+        """Ответ отдан из прошлой версии - поставить вопрос на перегенерацию"""
+        if not self.per_minute:
+            return
+        key = self.cache._hash_query(subject, question)
+        if key in self.queue:
+            return
+        if len(self.queue) >= self.max_queue:
+            self.stats['dropped'] += 1
+            return
+        self.queue[key] = (subject, question)
+        self.stats['queued'] += 1
+        self._ready.set()
+    
+    def _busy(self) -> bool:
+        return bool(self.lanes and self.lanes['llm'].waiting)
+    
+    async def run(self):
+        while True:
+            await self._ready.wait()
+            while self.queue:
+                if self._busy():
+                    # Живые вопросы важнее - ждём, пока полоса LLM освободится
+                    await asyncio.sleep(5)
+                    continue
+                
+                _, (subject, question) = self.queue.popitem(last=False)
+                try:
+                    response = await self.groq.get_response(
+                        build_messages(subject, question), subject=subject, kind="regen"
+                    )
+                    await self.cache.set(subject, question, response)
+                    self.stats['regenerated'] += 1
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    print(f"Cache regenerate error: {e}")
+                await asyncio.sleep(60 / self.per_minute)
+            self._ready.clear()
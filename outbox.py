@@ -0,0 +1,246 @@
+import asyncio
+import re
+import time
+from collections import deque
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
+from aiogram.methods import SendMessage, SendChatAction
+
+# Лимит Telegram - 4096 символов UTF-16; берём с запасом (эмодзи занимают по два)
+MESSAGE_LIMIT = 4000
+
+# Места, где можно резать: абзац, строка, конец предложения, пробел (по убыванию предпочтения)
+BREAKS = [re.compile(r'\n\s*\n'), re.compile(r'\n'), re.compile(r'(?<=[.!?…])\s+'), re.compile(r' ')]
+
+# Разметка, внутри которой резать нельзя: формулы, код, жирный/курсив Markdown
+PAIRED = ('`', '$', '*', '_')
+
+def _balanced(text: str, markdown: bool) -> bool:
+    """Все парные символы закрыты и скобки сбалансированы - формула не разорвана"""
+    marks = PAIRED if markdown else ('`', '$')
+    if any(text.count(mark) % 2 for mark in marks):
+        return False
+    return text.count('(') <= text.count(')') and text.count('[') <= text.count(']')
+
+def split_text(text: str, limit: int = MESSAGE_LIMIT, markdown: bool = False) -> list[str]:
+    """Разбить длинный ответ по границам абзацев и предложений, не разрывая формулы"""
+    parts = []
+    while len(text) > limit:
+        cut = None
+        for pattern in BREAKS:
+            # Последняя граница в пределах лимита, не внутри формулы или разметки
+            for match in reversed(list(pattern.finditer(text, 0, limit))):
+                if match.start() > limit // 4 and _balanced(text[:match.start()], markdown):
+                    cut = match
+                    break
+            if cut:
+                break
+        
+        if cut:
+            parts.append(text[:cut.start()].rstrip())
+            text = text[cut.end():]
+        else:
+            parts.append(text[:limit])
+            text = text[limit:]
+    parts.append(text)
+    return [part for part in parts if part.strip()]
+
+class TokenBucket:
+    """rate токенов в секунду, запас burst"""
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+    
+    def wait_time(self) -> float:
+        """Сколько ждать до следующего токена (0 - можно сейчас)"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def take(self):
+        self.tokens -= 1
+    
+    def pause(self, seconds: float):
+        """Не выдавать токены seconds секунд (RetryAfter)"""
+        self.wait_time()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+# Методы, привязанные к чату: идут через очередь чата, чтобы сохранить порядок с текстом
+CHAT_METHODS = ('Send', 'Edit', 'Delete', 'Copy', 'Forward')
+# Обычная отправка: хендлер не ждёт доставки (результат не нужен, ошибки - в лог)
+FIRE_AND_FORGET = (SendMessage, SendChatAction)
+
+class SendQueue(BaseRequestMiddleware):
+    """
+    Очередь исходящих запросов к чатам (middleware сессии бота): message.answer,
+    answer_document, правки и удаления идут через очередь своего чата по порядку
+    с учётом общего и поминутного на чат лимитов Telegram и RetryAfter.
+    message.answer и «печатает...» возвращают управление сразу (None), доставка - в фоне;
+    остальные методы (правки, документы) ждут результата Telegram.
+    Короткие сообщения, ждущие в очереди подряд, склеиваются, длинные - режутся.
+    """
+    
+    def __init__(self, global_rate: float = 25.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 limit: int = MESSAGE_LIMIT):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.limit = limit
+        
+        self.queues = {}   # chat_id -> deque[(make_request, bot, method, время постановки, [future])]
+        self.buckets = {}  # chat_id -> TokenBucket (живёт дольше очереди - лимит не обнуляется)
+        self.workers = {}  # chat_id -> задача доставки
+        self.latencies = deque(maxlen=1000)  # мс от постановки в очередь до доставки
+        
+        self.stats = {'queued': 0, 'sent': 0, 'merged': 0, 'split': 0, 'retry_after': 0, 'failed': 0}
+    
+    @staticmethod
+    def _chat_bound(method) -> bool:
+        return getattr(method, 'chat_id', None) is not None and type(method).__name__.startswith(CHAT_METHODS)
+    
+    async def __call__(self, make_request, bot, method):
+        # Без чата (answerCallbackQuery, getMe...) - как есть
+        if not self._chat_bound(method):
+            return await make_request(bot, method)
+        
+        if isinstance(method, SendMessage):
+            markdown = bool(method.parse_mode) and 'markdown' in str(method.parse_mode).lower()
+            parts = split_text(method.text, self.limit, markdown)
+            if len(parts) > 1:
+                self.stats['split'] += len(parts) - 1
+            # Клавиатура - только у последней части
+            methods = [
+                method.model_copy(update={'text': part} if i == len(parts) - 1 else {'text': part, 'reply_markup': None})
+                for i, part in enumerate(parts)
+            ] or [method]
+        else:
+            methods = [method]
+        
+        loop = asyncio.get_running_loop()
+        queue = self.queues.setdefault(method.chat_id, deque())
+        now = time.monotonic()
+        wait = not isinstance(method, FIRE_AND_FORGET)
+        futures = []
+        for queued in methods:
+            # Без future: ошибку фоновой отправки некому забирать, она только логируется
+            pending = [loop.create_future()] if wait else []
+            futures.extend(pending)
+            queue.append((make_request, bot, queued, now, pending))
+            self.stats['queued'] += 1
+        
+        if len(self.buckets) > 10_000:
+            # Забыть чаты, у которых лимит давно восстановился
+            idle = now - self.chat_burst / self.chat_rate
+            self.buckets = {chat: b for chat, b in self.buckets.items() if b.updated > idle or chat in self.workers}
+        
+        if method.chat_id not in self.workers:
+            self.workers[method.chat_id] = asyncio.create_task(self._deliver(method.chat_id))
+        if not wait:
+            # Хендлер (и занятый им слот полосы) не ждёт лимитов чата и RetryAfter
+            return None
+        # Результат последней части - как у метода без очереди
+        results = await asyncio.gather(*futures)
+        return results[-1]
+    
+    def _merge(self, queue: deque):
+        """Склеить подряд идущие короткие сообщения без клавиатуры и с одной разметкой"""
+        make_request, bot, method, queued_at, futures = queue.popleft()
+        if not isinstance(method, SendMessage):
+            return make_request, bot, method, queued_at, futures
+        futures = list(futures)
+        while queue:
+            _, _, following, _, following_futures = queue[0]
+            if (not isinstance(following, SendMessage)
+                    or method.reply_markup or following.reply_markup
+                    or method.parse_mode != following.parse_mode
+                    or len(method.text) + len(following.text) + 2 > self.limit):
+                break
+            queue.popleft()
+            method = method.model_copy(update={'text': f"{method.text}\n\n{following.text}"})
+            # Склеенные сообщения - одно сообщение Telegram: все вызывающие получают его
+            futures.extend(following_futures)
+            self.stats['merged'] += 1
+        return make_request, bot, method, queued_at, futures
+    
+    async def _deliver(self, chat_id):
+        """Доставка в один чат по порядку"""
+        queue = self.queues[chat_id]
+        bucket = self.buckets.setdefault(chat_id, TokenBucket(self.chat_rate, self.chat_burst))
+        try:
+            while queue:
+                # «Печатает...» - не сообщение, лимит чата не тратит
+                limited = not isinstance(queue[0][2], SendChatAction)
+                # Ждём окна по лимитам; за это время в очередь могут прийти ещё сообщения для склейки
+                delay = max(bucket.wait_time(), self.global_bucket.wait_time()) if limited else 0
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                
+                make_request, bot, method, queued_at, futures = self._merge(queue)
+                if limited:
+                    bucket.take()
+                    self.global_bucket.take()
+                if await self._send(make_request, bot, method, queued_at, futures, queue, bucket):
+                    self.latencies.append((time.monotonic() - queued_at) * 1000)
+        finally:
+            del self.workers[chat_id]
+            if not queue:
+                self.queues.pop(chat_id, None)
+    
+    @staticmethod
+    def _resolve(futures: list, result=None, error: Exception | None = None):
+        for future in futures:
+            if future.done():
+                continue  # вызывающий отменён
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+    
+    async def _send(self, make_request, bot, method, queued_at: float, futures: list,
+                    queue: deque, bucket: TokenBucket) -> bool:
+        """Отправить; True - доставлено, при RetryAfter и ошибке разметки - обратно в очередь"""
+        try:
+            result = await make_request(bot, method)
+            self.stats['sent'] += 1
+            self._resolve(futures, result)
+            return True
+        except TelegramRetryAfter as e:
+            # Flood control: вернуть запрос в начало очереди и переждать в этом чате
+            self.stats['retry_after'] += 1
+            bucket.pause(e.retry_after)
+            queue.appendleft((make_request, bot, method, queued_at, futures))
+        except TelegramBadRequest as e:
+            if getattr(method, 'parse_mode', None) and "can't parse entities" in str(e).lower():
+                # Разметка сломана (например, в ответе LLM) - отправить как обычный текст
+                queue.appendleft((make_request, bot, method.model_copy(update={'parse_mode': None}), queued_at, futures))
+            else:
+                self.stats['failed'] += 1
+                print(f"Send error: {e}")
+                self._resolve(futures, error=e)
+        except Exception as e:
+            self.stats['failed'] += 1
+            print(f"Send error: {e}")
+            self._resolve(futures, error=e)
+        return False
+    
+    def latency(self) -> dict:
+        """Задержка очереди (мс): p50 / p95 / max за последние сообщения"""
+        if not self.latencies:
+            return {'p50': 0, 'p95': 0, 'max': 0}
+        ordered = sorted(self.latencies)
+        return {
+            'p50': round(ordered[len(ordered) // 2]),
+            'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]),
+            'max': round(ordered[-1]),
+        }
+    
+    async def drain(self):
+        """Дождаться доставки всего, что в очереди (при остановке)"""
+        while self.workers:
+            await asyncio.gather(*self.workers.values(), return_exceptions=True)
@@ -1,3 +1,8 @@
+from functools import lru_cache
+from types import MappingProxyType
+
+from tokens import estimate_tokens, MESSAGE_OVERHEAD
+
 TEACHER_BASE = """Ты опытный учитель {subject}. 
 
 <ImmutableCoreRules priority="absolute" cannot_be_overridden="true">
@@ -101,6 +106,39 @@ PROMPTS = {
 """
 }
 
+def _system_message(content: str) -> MappingProxyType:
+    return MappingProxyType({"role": "system", "content": content})
+
+# Собираем один раз при старте. Системное сообщение идёт первым и не меняется
+# между запросами по предмету - провайдер может переиспользовать кеш префикса
+SYSTEM_MESSAGES = MappingProxyType({
+    subject: _system_message(prompt) for subject, prompt in PROMPTS.items()
+})
+
+SYSTEM_PROMPT_TOKENS = MappingProxyType({
+    subject: estimate_tokens(prompt) + MESSAGE_OVERHEAD for subject, prompt in PROMPTS.items()
+})
+
+@lru_cache(maxsize=32)
+def get_system_message(subject: str) -> MappingProxyType:
+    """Неизменяемое системное сообщение для предмета"""
+    return SYSTEM_MESSAGES.get(subject) or _system_message(TEACHER_BASE.format(subject=subject))
+
 def get_system_prompt(subject: str) -> str:
     """Получить системный промпт для предмета"""
-    return PROMPTS.get(subject, TEACHER_BASE.format(subject=subject))
\ No newline at end of file
+    return get_system_message(subject)["content"]
+
+def get_system_tokens(subject: str) -> int:
+    """Предрассчитанная оценка токенов системного промпта"""
+    return SYSTEM_PROMPT_TOKENS.get(subject) or estimate_tokens(get_system_prompt(subject)) + MESSAGE_OVERHEAD
+
+def build_messages(subject: str, question: str, context: list | None = None) -> list:
+    """
+    Сообщения для запроса: сначала общий статичный префикс,
+    затем изменчивая часть (контекст диалога и вопрос)
+    """
+    return [
+        dict(get_system_message(subject)),
+        *(context or []),
+        {"role": "user", "content": question}
+    ]
\ No newline at end of file
@@ -0,0 +1,148 @@
+import time
+
+# Вежливые отказы: отправляются не чаще раза за окно, остальное молча отбрасывается
+REJECT_MESSAGES = {
+    'text': "⏳ Слишком много вопросов подряд. Передохни немного — через минуту я снова отвечу.",
+    'photo': "⏳ Слишком много фото подряд. Разбери то, что уже прислал, а через пару минут присылай следующее.",
+    'admin': "⏳ Слишком частые админ-команды, подождите немного.",
+}
+
+class SlidingWindow:
+    """
+    Скользящее окно на двух счётчиках (текущее и предыдущее окно):
+    оценка = предыдущее * доля его перекрытия + текущее. Память - O(1) на ключ.
+    """
+    
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+    
+    def estimate(self, previous: int, current: int, elapsed: float) -> float:
+        """elapsed - сколько прошло от начала текущего окна"""
+        return previous * max(0.0, 1 - elapsed / self.window) + current
+
+class MemoryRateLimiter:
+    """Счётчики в памяти процесса: (вид, user_id) -> (номер окна, текущее, предыдущее)"""
+    
+    def __init__(self, limits: dict, sweep_every: int = 10_000):
+        self.limits = {kind: SlidingWindow(limit, window) for kind, (limit, window) in limits.items()}
+        self.counters = {}
+        self.sweep_every = sweep_every
+        self._calls = 0
+    
+    async def hit(self, kind: str, user_id: int) -> bool:
+        """Учесть запрос; False - лимит исчерпан (отказанные запросы не считаются)"""
+        rule = self.limits[kind]
+        now = time.time()
+        index = int(now // rule.window)
+        
+        key = (kind, user_id)
+        window, current, previous = self.counters.get(key, (index, 0, 0))
+        if window != index:
+            # Окно сдвинулось: текущее становится предыдущим (или обнуляется, если прошло больше окна)
+            previous = current if window == index - 1 else 0
+            current = 0
+        
+        if rule.estimate(previous, current, now - index * rule.window) >= rule.limit:
+            self.counters[key] = (index, current, previous)
+            return False
+        
+        self.counters[key] = (index, current + 1, previous)
+        self._sweep(now)
+        return True
+    
+    def _sweep(self, now: float):
+        """Изредка выбрасывать ключи, по которым не было запросов дольше двух окон"""
+        self._calls += 1
+        if self._calls % self.sweep_every:
+            return
+        for key, (window, _, _) in list(self.counters.items()):
+            rule = self.limits[key[0]]
+            if int(now // rule.window) - window >= 2:
+                del self.counters[key]
+
+class RedisRateLimiter:
+    """
+    То же окно в Redis-совместимом хранилище - общие лимиты для нескольких экземпляров.
+    При недоступности хранилища запросы пропускаются (лимит не должен ронять бота).
+    """
+    
+    def __init__(self, url: str, limits: dict, prefix: str = "rl"):
+        import redis.asyncio as redis  # опциональная зависимость
+        
+        self.redis = redis.from_url(url)
+        self.limits = {kind: SlidingWindow(limit, window) for kind, (limit, window) in limits.items()}
+        self.prefix = prefix
+    
+    async def hit(self, kind: str, user_id: int) -> bool:
+        rule = self.limits[kind]
+        now = time.time()
+        index = int(now // rule.window)
+        current_key = f"{self.prefix}:{kind}:{user_id}:{index}"
+        previous_key = f"{self.prefix}:{kind}:{user_id}:{index - 1}"
+        
+        try:
+            previous, current = await self.redis.mget(previous_key, current_key)
+            if rule.estimate(int(previous or 0), int(current or 0), now - index * rule.window) >= rule.limit:
+                return False
+            
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.incr(current_key)
+                pipe.expire(current_key, int(rule.window * 2) + 1)
+                await pipe.execute()
+            return True
+        except Exception as e:
+            print(f"Rate limiter redis error: {e}")
+            return True
+
+class RateLimitMiddleware:
+    """
+    Middleware: отказ до начала дорогой работы (скачивание фото, OCR, LLM).
+    Отдельные лимиты на текст, фото и админ-команды.
+    """
+    
+    def __init__(self, limiter, admin_ids: list):
+        self.limiter = limiter
+        self.admin_ids = set(admin_ids)
+        self._notified = {}  # (вид, user_id) -> когда последний раз предупредили
+        
+        self.stats = {'allowed': 0, 'rejected': 0}
+    
+    def classify(self, event) -> str:
+        """Вид запроса по апдейту"""
+        if getattr(event, 'photo', None):
+            return 'photo'
+        text = getattr(event, 'text', None) or ''
+        if text.startswith('/') and event.from_user.id in self.admin_ids:
+            return 'admin'
+        return 'text'
+    
+    async def __call__(self, handler, event, data):
+        user = getattr(event, 'from_user', None)
+        if user is None:
+            return await handler(event, data)
+        
+        kind = self.classify(event)
+        if await self.limiter.hit(kind, user.id):
+            self.stats['allowed'] += 1
+            return await handler(event, data)
+        
+        self.stats['rejected'] += 1
+        await self._reject(event, kind, user.id)
+        return None
+    
+    async def _reject(self, event, kind: str, user_id: int):
+        """Предупредить один раз за окно; повторные отказы - без ответа"""
+        now = time.monotonic()
+        window = self.limiter.limits[kind].window
+        if now - self._notified.get((kind, user_id), float('-inf')) < window:
+            return
+        self._notified[(kind, user_id)] = now
+        if len(self._notified) > 10_000:
+            self._notified = {k: t for k, t in self._notified.items() if now - t < window}
+        
+        try:
+            # Message - ответным сообщением, CallbackQuery - всплывающим уведомлением
+            await event.answer(REJECT_MESSAGES[kind])
+        except Exception as e:
+            print(f"Rate limit reply error: {e}")
@@ -0,0 +1,423 @@
+"""
+Регрессия задержки ответа на записанном трафике.
+
+Запись (в боте): RECORD_TRAFFIC_PATH=traffic.ndjson.gz - каждый текстовый вопрос
+сохраняется обезличенным вместе с ответами и временем Groq и Supabase.
+
+Проигрывание (офлайн, без сети): настоящие handlers / Cache / GroqRouter / Database
+поверх заглушек, которые отвечают записанным с записанной задержкой (ускоренно):
+
+    python replay.py traffic.ndjson.gz --update-baseline       # сохранить эталон
+    python replay.py traffic.ndjson.gz                         # сравнить с эталоном
+    python replay.py traffic.ndjson.gz --speed 20 --threshold 0.15
+"""
+import argparse
+import asyncio
+import contextvars
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import secrets
+import statistics
+import sys
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+# Текущий записываемый вопрос (наследуется фоновыми задачами и потоками)
+_episode = contextvars.ContextVar("replay_episode", default=None)
+
+PII_PATTERNS = [
+    (re.compile(r'[\w.+-]+@[\w-]+\.[\w.]+'), '<email>'),
+    (re.compile(r'(?<!\w)@\w{4,}'), '<username>'),
+    (re.compile(r'\+?\d[\d\s()-]{9,}\d'), '<phone>'),
+]
+
+# Из FSM берём только то, что влияет на путь ответа
+STATE_KEYS = ('subject', 'last_recognized_text', 'history', 'history_summary', 'history_ocr')
+
+def scrub(value):
+    """Убрать из текста email, @username и телефоны (рекурсивно для dict/list)"""
+    if isinstance(value, str):
+        for pattern, replacement in PII_PATTERNS:
+            value = pattern.sub(replacement, value)
+        return value
+    if isinstance(value, list):
+        return [scrub(v) for v in value]
+    if isinstance(value, dict):
+        return {k: scrub(v) for k, v in value.items()}
+    return value
+
+def _signature(query) -> str:
+    """'GET /cache', 'POST /questions_log' - по нему ответы сопоставляются при проигрывании"""
+    method = getattr(query, 'http_method', 'GET')
+    return f"{getattr(method, 'value', method)} {getattr(query, 'path', '?')}"
+
+class TrafficRecorder:
+    """Запись обезличенного трафика в gzip NDJSON (одна строка - один вопрос)"""
+    
+    def __init__(self, path: str, sample: float = 1.0, buffer_size: int = 20):
+        self.path = path
+        self.sample = sample
+        self.buffer_size = buffer_size
+        self.salt = secrets.token_bytes(16)  # id пользователей не сопоставить между файлами
+        self.buffer = []
+        self.started = time.time()
+        
+        self.stats = {'recorded': 0, 'calls': 0}
+    
+    def _anon(self, user_id: int) -> str:
+        return hashlib.blake2b(str(user_id).encode(), key=self.salt, digest_size=8).hexdigest()
+    
+    def _call(self, kind: str, signature: str, started: float, result: dict):
+        episode = _episode.get()
+        if episode is None:
+            return
+        episode['calls'].append({
+            'kind': kind,
+            'sig': signature,
+            'ms': round((time.perf_counter() - started) * 1000, 2),
+            **result,
+        })
+        self.stats['calls'] += 1
+    
+    def wrap_datalayer(self, data_layer):
+        """Записывать ответы Supabase (DataLayer.execute)"""
+        execute = data_layer.execute
+        
+        async def recording_execute(query, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = await execute(query, *args, **kwargs)
+            except Exception as e:
+                self._call('supabase', _signature(query), started, {'error': str(e)[:200]})
+                raise
+            self._call('supabase', _signature(query), started, {
+                'data': scrub(result.data), 'count': getattr(result, 'count', None)
+            })
+            return result
+        
+        data_layer.execute = recording_execute
+    
+    def wrap_groq(self, groq_router):
+        """Записывать ответы Groq (chat.completions.create каждого клиента)"""
+        make_client = groq_router._client
+        
+        def recording_client(index: int):
+            client = make_client(index)
+            
+            def create(**kwargs):
+                started = time.perf_counter()
+                try:
+                    response = client.chat.completions.create(**kwargs)
+                except Exception as e:
+                    self._call('groq', kwargs.get('model', '?'), started, {'error': str(e)[:200]})
+                    raise
+                usage = getattr(response, 'usage', None)
+                self._call('groq', kwargs.get('model', '?'), started, {
+                    'content': scrub(response.choices[0].message.content),
+                    'usage': {k: getattr(usage, k, 0) for k in ('prompt_tokens', 'completion_tokens', 'total_tokens')},
+                })
+                return response
+            
+            return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        
+        groq_router._client = recording_client
+    
+    async def middleware(self, handler, event, data):
+        """Записать текстовый вопрос: вход, FSM и все внешние вызовы за время обработки"""
+        text = getattr(event, 'text', None)
+        state = data.get('state')
+        if not text or text.startswith('/') or state is None or random.random() >= self.sample:
+            return await handler(event, data)
+        
+        fsm = await state.get_data()
+        episode = {
+            't': round(time.time() - self.started, 3),
+            'user': self._anon(event.from_user.id),
+            'text': scrub(text),
+            'state': await state.get_state(),
+            'data': scrub({k: fsm[k] for k in STATE_KEYS if fsm.get(k) is not None}),
+            'calls': [],
+        }
+        token = _episode.set(episode)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            episode['ms'] = round((time.perf_counter() - started) * 1000, 2)
+            _episode.reset(token)
+            self.buffer.append(episode)
+            self.stats['recorded'] += 1
+            if len(self.buffer) >= self.buffer_size:
+                await self.flush()
+    
+    async def flush(self):
+        """Дописать накопленное в файл (gzip допускает дописывание новыми членами)"""
+        episodes, self.buffer = self.buffer, []
+        if episodes:
+            await asyncio.to_thread(self._write, episodes)
+    
+    def _write(self, episodes: list):
+        with gzip.open(self.path, 'at', encoding='utf-8') as f:
+            for episode in episodes:
+                f.write(json.dumps(episode, ensure_ascii=False) + "\n")
+
+# ---- проигрывание ----
+
+class _Query:
+    """Заглушка построителя PostgREST: любые цепочки, важны только метод и таблица"""
+    
+    VERBS = {'select': 'GET', 'insert': 'POST', 'upsert': 'POST', 'update': 'PATCH', 'delete': 'DELETE'}
+    
+    def __init__(self, path: str, http_method: str = 'POST'):
+        self.path = path
+        self.http_method = http_method
+    
+    def __getattr__(self, name):
+        def chain(*args, **kwargs):
+            if name in self.VERBS:
+                self.http_method = self.VERBS[name]
+            return self
+        return chain
+
+class _Player:
+    """Ответы одного вопроса: по сигнатуре, в записанном порядке, с ускоренной задержкой"""
+    
+    def __init__(self, calls: list, speed: float):
+        self.speed = speed
+        self.queues = defaultdict(deque)
+        for call in calls:
+            self.queues[(call['kind'], call['sig'])].append(call)
+        self.unmatched = 0
+    
+    def take(self, kind: str, signature: str):
+        queue = self.queues.get((kind, signature))
+        if not queue:
+            self.unmatched += 1
+            return None
+        return queue.popleft()
+    
+    def delay(self, call) -> float:
+        return call['ms'] / 1000 / self.speed if call else 0.0
+
+class ReplayDataLayer:
+    """DataLayer без сети: execute отдаёт записанный ответ Supabase"""
+    
+    def __init__(self, player: _Player):
+        self.player = player
+        self.stats = {'queries': 0, 'retries': 0, 'errors': 0}
+    
+    def table(self, name: str):
+        return _Query(f"/{name}")
+    
+    def rpc(self, fn: str, params: dict | None = None):
+        return _Query(f"/rpc/{fn}")
+    
+    async def execute(self, query, timeout: float | None = None, attempts: int | None = None):
+        self.stats['queries'] += 1
+        call = self.player.take('supabase', _signature(query))
+        await asyncio.sleep(self.player.delay(call))
+        if call and 'error' in call:
+            raise RuntimeError(call['error'])
+        return SimpleNamespace(data=call.get('data') if call else [], count=call.get('count') if call else 0)
+    
+    async def gather(self, *queries, timeout: float | None = None) -> list:
+        return await asyncio.gather(*(self.execute(q, timeout=timeout) for q in queries))
+
+class ReplayGroqClient:
+    """Клиент Groq без сети: записанный ответ с записанной задержкой (вызывается из потока)"""
+    
+    def __init__(self, player: _Player):
+        self.player = player
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+    
+    def create(self, **kwargs):
+        call = self.player.take('groq', kwargs.get('model', '?'))
+        time.sleep(self.player.delay(call))
+        if call and 'error' in call:
+            raise RuntimeError(call['error'])
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=call['content'] if call else "OK"))],
+            usage=SimpleNamespace(**(call['usage'] if call else {}))
+        )
+
+class _State:
+    """FSMContext в памяти"""
+    
+    def __init__(self, state, data: dict):
+        self.state = state
+        self.data = dict(data)
+    
+    async def get_state(self):
+        return self.state
+    
+    async def set_state(self, state=None):
+        self.state = state.state if hasattr(state, 'state') else state
+    
+    async def get_data(self) -> dict:
+        return dict(self.data)
+    
+    async def update_data(self, **kwargs):
+        self.data.update(kwargs)
+
+class _Message:
+    def __init__(self, text: str, user: str, timer):
+        self.text = text
+        self.from_user = SimpleNamespace(id=int(user, 16) % 10**9, username=None)
+        self.timer = timer
+        self.sent = []
+    
+    async def answer(self, text: str, **kwargs):
+        with self.timer('send'):
+            self.sent.append(text)
+
+class StageTimer:
+    """Сумма времени по стадиям за один вопрос"""
+    
+    def __init__(self):
+        self.stages = defaultdict(float)
+    
+    def __call__(self, stage: str):
+        timer = self
+        
+        class _Span:
+            def __enter__(self):
+                self.started = time.perf_counter()
+            
+            def __exit__(self, *exc):
+                timer.stages[stage] += (time.perf_counter() - self.started) * 1000
+        
+        return _Span()
+    
+    def wrap(self, obj, method: str, stage: str):
+        original = getattr(obj, method)
+        
+        async def timed(*args, **kwargs):
+            with self(stage):
+                return await original(*args, **kwargs)
+        
+        setattr(obj, method, timed)
+
+class Replayer:
+    """Прогон записанных вопросов через настоящий код ответа с заглушками сети"""
+    
+    def __init__(self, speed: float = 10.0):
+        self.speed = speed
+        self.unmatched = 0
+    
+    def load(self, path: str) -> list:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    
+    async def run_episode(self, episode: dict) -> dict:
+        import handlers
+        from cache import Cache
+        from db import Database
+        from exercises import BatchSolver
+        from groq_client import GroqRouter
+        from history import ConversationHistory
+        
+        player = _Player(episode['calls'], self.speed)
+        timer = StageTimer()
+        
+        # Свежие компоненты на каждый вопрос: результат не зависит от порядка прогона
+        data = ReplayDataLayer(player)
+        groq = GroqRouter(["replay"])
+        groq._clients = [ReplayGroqClient(player)]
+        cache = Cache(data)
+        db = Database(data)
+        history = ConversationHistory(groq)
+        
+        timer.wrap(cache, 'get', 'cache.get')
+        timer.wrap(cache, 'set', 'cache.set')
+        timer.wrap(groq, 'get_response', 'groq')
+        timer.wrap(db, 'log_question', 'db.log')
+        timer.wrap(history, 'remember', 'history')
+        
+        message = _Message(episode['text'], episode['user'], timer)
+        state = _State(episode['state'], episode['data'])
+        with timer('total'):
+            await handlers.handle_text(message, state, groq, cache, db, history, BatchSolver())
+            await cache.wait_background()
+        
+        self.unmatched += player.unmatched
+        return dict(timer.stages)
+    
+    async def run(self, episodes: list) -> dict:
+        """Стадия -> p50/p95/n (мс, в ускоренном времени)"""
+        samples = defaultdict(list)
+        for episode in episodes:
+            for stage, ms in (await self.run_episode(episode)).items():
+                samples[stage].append(ms)
+        
+        return {
+            stage: {
+                'p50': round(statistics.median(values), 3),
+                'p95': round(_percentile(values, 95), 3),
+                'n': len(values),
+            }
+            for stage, values in sorted(samples.items())
+        }
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def compare(current: dict, baseline: dict, threshold: float, slack_ms: float) -> list:
+    """Стадии, у которых p95 вырос больше чем на threshold (и больше чем на slack_ms)"""
+    regressions = []
+    for stage, stats in current.items():
+        base = baseline.get(stage)
+        if not base:
+            continue
+        limit = max(base['p95'] * (1 + threshold), base['p95'] + slack_ms)
+        if stats['p95'] > limit:
+            regressions.append((stage, base['p95'], stats['p95']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Регрессия задержки на записанном трафике")
+    parser.add_argument("traffic", help="файл записи (gzip NDJSON)")
+    parser.add_argument("--baseline", default="benchmarks/replay_baseline.json")
+    parser.add_argument("--update-baseline", action="store_true", help="сохранить результат как эталон")
+    parser.add_argument("--speed", type=float, default=10.0, help="ускорение записанных задержек")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимый рост p95 (0.2 = 20%%)")
+    parser.add_argument("--slack-ms", type=float, default=2.0, help="рост p95 меньше этого не считается")
+    args = parser.parse_args()
+    
+    replayer = Replayer(speed=args.speed)
+    episodes = replayer.load(args.traffic)
+    current = asyncio.run(replayer.run(episodes))
+    
+    print(f"Вопросов: {len(episodes)}, ускорение x{args.speed}, несопоставленных вызовов: {replayer.unmatched}")
+    print(f"{'стадия':<12} {'p50 мс':>9} {'p95 мс':>9} {'n':>6}")
+    for stage, stats in current.items():
+        print(f"{stage:<12} {stats['p50']:>9.2f} {stats['p95']:>9.2f} {stats['n']:>6}")
+    
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({'speed': args.speed, 'stages': current}, f, indent=2, ensure_ascii=False)
+        print(f"Эталон сохранён: {args.baseline}")
+        return
+    
+    if not os.path.exists(args.baseline):
+        sys.exit(f"Нет эталона {args.baseline}: запустите с --update-baseline")
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['speed'] != args.speed:
+        sys.exit(f"Эталон снят с ускорением x{baseline['speed']}, а не x{args.speed}")
+    
+    regressions = compare(current, baseline['stages'], args.threshold, args.slack_ms)
+    for stage, before, after in regressions:
+        print(f"РЕГРЕССИЯ {stage}: p95 {before:.2f} -> {after:.2f} мс")
+    if regressions:
+        sys.exit(1)
+    print("OK: p95 в пределах порога")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import asyncio
+import math
+import time
+from datetime import datetime
+
+class CacheRetention:
+    """
+    Автоматическое ограничение размера таблицы cache.
+    Оценка записи - LFU со старением: частота хитов, затухающая с возрастом записи.
+    Удаление небольшими пачками, чтобы не мешать чтению кеша; удалённые ключи
+    убираются и из локальных уровней (память и SQLite) этого экземпляра.
+    """
+    
+    def __init__(self, db, cache=None, max_rows: int = 20000, max_bytes: int = 50 * 1024 * 1024,
+                 half_life_days: float = 14.0, batch_size: int = 200, max_batches: int = 20,
+                 interval: int = 6 * 3600, pause: float = 1.0):
+        self.db = db
+        self.cache = cache
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.half_life_days = half_life_days
+        self.batch_size = batch_size
+        self.max_batches = max_batches  # потолок удалений за один проход
+        self.interval = interval
+        self.pause = pause  # пауза между пачками
+        
+        self.stats = {
+            'runs': 0,
+            'deleted_total': 0,
+            'deleted_last': 0,
+            'rows': None,
+            'bytes': None,
+            'last_run': None,
+            'last_duration': 0.0,
+        }
+    
+    def score(self, row: dict, now: datetime | None = None) -> float:
+        """Ценность записи: (хиты + 1), затухающие с возрастом"""
+        now = now or datetime.utcnow()
+        age_days = 0.0
+        if row.get('created_at'):
+            created = datetime.fromisoformat(row['created_at'].replace('Z', '+00:00')).replace(tzinfo=None)
+            age_days = max((now - created).total_seconds() / 86400, 0.0)
+        
+        decay = math.pow(0.5, age_days / self.half_life_days)
+        return ((row.get('hit_count') or 0) + 1) * decay
+    
+    def excess_rows(self, rows: int, avg_size: float) -> int:
+        """Сколько записей нужно удалить, чтобы уложиться в лимиты"""
+        excess = max(rows - self.max_rows, 0)
+        if avg_size and self.max_bytes:
+            excess = max(excess, rows - int(self.max_bytes / avg_size))
+        return max(excess, 0)
+    
+    async def run(self):
+        """Фоновая задача по расписанию"""
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run_once()
+    
+    async def run_once(self) -> int:
+        """Один проход очистки, возвращает число удалённых записей"""
+        started = time.monotonic()
+        deleted = 0
+        
+        try:
+            # Старые записи без хитов удаляем всегда
+            deleted += await self.db.clear_old_cache(days=30)
+            
+            rows, avg_size = await self.db.get_cache_size()
+            self.stats.update(rows=rows, bytes=int(rows * avg_size))
+            
+            excess = self.excess_rows(rows, avg_size)
+            batches = 0
+            while excess > 0 and batches < self.max_batches:
+                # Оценка считается в SQL по всей таблице; сортировка здесь - для запасного запроса
+                candidates = await self.db.get_eviction_candidates(
+                    limit=self.batch_size * 4, half_life_days=self.half_life_days
+                )
+                if not candidates:
+                    break
+                
+                now = datetime.utcnow()
+                candidates.sort(key=lambda row: self.score(row, now))
+                keys = [row['key'] for row in candidates[:min(self.batch_size, excess)]]
+                
+                removed = await self.db.delete_cache_keys(keys)
+                if not removed:
+                    break
+                if self.cache:
+                    await self.cache.forget(keys)
+                
+                deleted += removed
+                excess -= removed
+                batches += 1
+                
+                self.stats['rows'] = max(self.stats['rows'] - removed, 0)
+                self.stats['bytes'] = int(self.stats['rows'] * avg_size)
+                await asyncio.sleep(self.pause)
+        except Exception as e:
+            print(f"Cache retention error: {e}")
+        
+        self.stats['runs'] += 1
+        self.stats['deleted_total'] += deleted
+        self.stats['deleted_last'] = deleted
+        self.stats['last_run'] = datetime.utcnow().strftime('%d.%m %H:%M')
+        self.stats['last_duration'] = time.monotonic() - started
+        
+        return deleted
@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import time
+import zlib
+from collections import OrderedDict
+
+from aiogram.fsm.storage.memory import MemoryStorage
+
+# Значение в сессии, вынесенное в BlobStore: в FSM остаётся только ссылка
+BLOB_PREFIX = "\x00blob:"
+
+class BlobStore:
+    """
+    Сжатые большие значения сессий (распознанный текст) с вытеснением по объёму (LRU).
+    Ключ - хеш содержимого: одинаковый текст хранится один раз.
+    """
+    
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, level: int = 6):
+        self.max_bytes = max_bytes
+        self.level = level
+        self.blobs = OrderedDict()  # ссылка -> (сжатые байты, исходный размер)
+        self.bytes = 0
+        self.raw_bytes = 0
+        
+        self.stats = {'stored': 0, 'deduplicated': 0, 'evicted': 0, 'missing': 0}
+    
+    def put(self, text: str) -> str:
+        raw = text.encode()
+        ref = BLOB_PREFIX + hashlib.sha1(raw).hexdigest()
+        if ref in self.blobs:
+            self.blobs.move_to_end(ref)
+            self.stats['deduplicated'] += 1
+            return ref
+        
+        packed = zlib.compress(raw, self.level)
+        self.blobs[ref] = (packed, len(raw))
+        self.bytes += len(packed)
+        self.raw_bytes += len(raw)
+        self.stats['stored'] += 1
+        
+        while self.bytes > self.max_bytes and len(self.blobs) > 1:
+            self._drop(next(iter(self.blobs)))
+            self.stats['evicted'] += 1
+        return ref
+    
+    def _drop(self, ref: str):
+        packed, size = self.blobs.pop(ref)
+        self.bytes -= len(packed)
+        self.raw_bytes -= size
+    
+    def get(self, ref: str) -> str | None:
+        """Текст по ссылке; None - вытеснен"""
+        entry = self.blobs.get(ref)
+        if entry is None:
+            self.stats['missing'] += 1
+            return None
+        self.blobs.move_to_end(ref)
+        return zlib.decompress(entry[0]).decode()
+    
+    def retain(self, refs: set) -> int:
+        """Удалить блобы, на которые не ссылается ни одна сессия"""
+        orphans = [ref for ref in self.blobs if ref not in refs]
+        for ref in orphans:
+            self._drop(ref)
+        return len(orphans)
+
+class TTLMemoryStorage(MemoryStorage):
+    """
+    FSM в памяти с ограничением размера сессии: строки длиннее inline_limit уходят в BlobStore
+    (хендлеры получают их как обычно). Сессия без активности ttl секунд теряет всё, кроме keep.
+    """
+    
+    def __init__(self, blobs: BlobStore, ttl: float = 6 * 3600, inline_limit: int = 1024,
+                 keep: tuple = ('subject',), sweep_interval: float = 300.0):
+        super().__init__()
+        self.blobs = blobs
+        self.ttl = ttl
+        self.inline_limit = inline_limit
+        self.keep = keep
+        self.sweep_interval = sweep_interval
+        self.touched = {}  # ключ -> время последнего обращения (monotonic)
+        
+        self.stats = {'offloaded': 0, 'expired': 0, 'dropped': 0, 'orphans': 0, 'sweeps': 0}
+    
+    async def set_state(self, key, state=None):
+        self.touched[key] = time.monotonic()
+        await super().set_state(key, state)
+    
+    async def get_state(self, key):
+        self.touched[key] = time.monotonic()
+        return await super().get_state(key)
+    
+    async def set_data(self, key, data: dict):
+        self.touched[key] = time.monotonic()
+        stored = {}
+        for name, value in data.items():
+            if isinstance(value, str) and len(value) > self.inline_limit and not value.startswith(BLOB_PREFIX):
+                value = self.blobs.put(value)
+                self.stats['offloaded'] += 1
+            stored[name] = value
+        await super().set_data(key, stored)
+    
+    async def get_data(self, key) -> dict:
+        self.touched[key] = time.monotonic()
+        data = await super().get_data(key)
+        for name, value in data.items():
+            if isinstance(value, str) and value.startswith(BLOB_PREFIX):
+                data[name] = self.blobs.get(value)  # вытесненный блоб - None
+        return data
+    
+    async def get_value(self, storage_key, dict_key: str, default=None):
+        return (await self.get_data(storage_key)).get(dict_key, default)
+    
+    def sweep(self) -> int:
+        """Срезать простаивающие сессии и блобы без ссылок; возвращает число срезанных сессий"""
+        deadline = time.monotonic() - self.ttl
+        expired = 0
+        for key in [key for key, at in self.touched.items() if at < deadline]:
+            del self.touched[key]
+            record = self.storage.pop(key, None)
+            if record is None:
+                continue
+            expired += 1
+            kept = {name: record.data[name] for name in self.keep if name in record.data}
+            if kept:
+                # Предмет остаётся, незаконченный вопрос по фото - нет
+                record.data = kept
+                record.state = None
+                self.storage[key] = record
+            else:
+                self.stats['dropped'] += 1
+        
+        refs = {
+            value for record in self.storage.values() for value in record.data.values()
+            if isinstance(value, str) and value.startswith(BLOB_PREFIX)
+        }
+        self.stats['orphans'] += self.blobs.retain(refs)
+        self.stats['expired'] += expired
+        self.stats['sweeps'] += 1
+        return expired
+    
+    async def run(self):
+        """Фоновая задача: периодическая очистка"""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Session sweep error: {e}")
+    
+    def summary(self) -> dict:
+        return {
+            'sessions': len(self.storage),
+            'blobs': len(self.blobs.blobs),
+            'blob_kb': round(self.blobs.bytes / 1024, 1),
+            'blob_limit_kb': round(self.blobs.max_bytes / 1024),
+            'compression': round(self.blobs.raw_bytes / self.blobs.bytes, 1) if self.blobs.bytes else None,
+            **self.stats,
+            **{f"blob_{name}": count for name, count in self.blobs.stats.items()},
+        }
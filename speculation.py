@@ -0,0 +1,145 @@
+import asyncio
+import re
+import time
+from datetime import datetime
+
+from prompts import build_messages
+
+# Короткий запрос "по умолчанию" после фото: на него подходит заранее готовое объяснение
+DEFAULT_INTENT = re.compile(
+    r'^\s*(?:пожалуйста\W*)?(?:реши\w*|объясни\w*|помоги\w*|разбери\w*|сделай|выполни'
+    r'|как\s+(?:это\s+)?реш\w*|что\s+(?:тут\s+|здесь\s+)?делать)\b',
+    re.IGNORECASE
+)
+
+class Speculator:
+    """
+    Спекулятивная генерация: пока ученик набирает вопрос после фото,
+    объяснение задания уже готовится. Результат живёт ttl секунд и
+    отдаётся один раз - если вопрос совпал с ожидаемым.
+    """
+    
+    def __init__(self, groq, daily_budget: int = 0, ttl: float = 600.0, max_prompts: int = 3,
+                 lanes=None, usage=None):
+        self.groq = groq
+        self.daily_budget = daily_budget  # запросов к Groq в сутки, 0 - выключено
+        self.ttl = ttl
+        self.max_prompts = max_prompts
+        self.lanes = lanes  # давление на полосу llm - спекуляцию не запускаем
+        self.usage = usage  # квота ключей на исходе - тоже
+        
+        self.pending = {}  # (user_id, prompt) -> (срок, задача)
+        self.abandoned = set()  # выброшенные заготовки, чей запрос к Groq ещё идёт в потоке
+        self._day = None
+        self._used = 0
+        
+        self.stats = {'started': 0, 'hits': 0, 'wasted': 0, 'failed': 0,
+                      'skipped_budget': 0, 'skipped_pressure': 0}
+    
+    def budget_left(self) -> int:
+        today = datetime.utcnow().date()
+        if self._day != today:
+            self._day = today
+            self._used = 0
+        return max(self.daily_budget - self._used, 0)
+    
+    def under_pressure(self) -> bool:
+        """Живые вопросы важнее: очередь на LLM или все ключи кончатся до полуночи"""
+        if self.lanes:
+            lane = self.lanes['llm']
+            if lane.waiting or lane.active >= max(1, lane.concurrency // 2):
+                return True
+        if self.usage:
+            return all(self.usage.forecast(i)['exhausts_today'] for i in range(len(self.usage.labels)))
+        return False
+    
+    def matches(self, question: str) -> bool:
+        """Вопрос совпадает с намерением "по умолчанию" (реши / объясни)"""
+        return len(question) <= 60 and bool(DEFAULT_INTENT.search(question))
+    
+    def start(self, user_id: int, subject: str, prompts: list):
+        """После OCR: начать генерацию ответов на вопросы по умолчанию (не ждём результата)"""
+        self.discard(user_id)
+        if not self.daily_budget:
+            return
+        
+        # Заготовки по одной: следующая проверяет нагрузку, когда предыдущая уже отпустила слот llm
+        previous = None
+        for prompt in prompts[:self.max_prompts]:
+            task = asyncio.create_task(self._generate(user_id, subject, prompt, previous))
+            self.pending[(user_id, prompt)] = (time.monotonic() + self.ttl, task)
+            previous = task
+    
+    def _admit(self) -> bool:
+        """Потратить запрос из бюджета, если он есть и живым вопросам не тесно"""
+        if self.budget_left() <= 0:
+            self.stats['skipped_budget'] += 1
+            return False
+        if self.under_pressure():
+            self.stats['skipped_pressure'] += 1
+            return False
+        self._used += 1
+        self.stats['started'] += 1
+        return True
+    
+    async def _generate(self, user_id: int, subject: str, prompt: str, previous=None) -> str | None:
+        if previous:
+            await asyncio.wait([previous])
+        # Пока ждали очереди, заготовку могли выбросить - тогда запрос не начинаем
+        if asyncio.current_task() in self.abandoned or not self._admit():
+            return None
+        try:
+            return await self.groq.get_response(
+                build_messages(subject, prompt), user_id=user_id, subject=subject, kind="speculative"
+            )
+        except Exception as e:
+            self.stats['failed'] += 1
+            print(f"Speculation error: {e}")
+            return None
+    
+    async def claim(self, user_id: int, prompt: str) -> str | None:
+        """Дождаться заготовленного ответа на этот промпт (один раз); None - не спекулировали или ошибка"""
+        self._expire()
+        entry = self.pending.pop((user_id, prompt), None)
+        if entry is None:
+            return None
+        response = await entry[1]
+        if response:
+            # Попадание - только когда заготовка действительно стала ответом
+            self.stats['hits'] += 1
+        return response
+    
+    def _drop(self, key):
+        """
+        Заготовка не понадобится. Запрос к Groq в потоке полосы не прервать: задача
+        доживает до конца (слот llm занят по-честному), квота считается потраченной впустую.
+        """
+        _, task = self.pending.pop(key)
+        self.abandoned.add(task)
+        task.add_done_callback(self._abandoned_done)
+    
+    def _abandoned_done(self, task):
+        self.abandoned.discard(task)
+        if not task.cancelled() and task.result():
+            self.stats['wasted'] += 1
+    
+    def discard(self, user_id: int):
+        """Новое фото или ответ уже дан - прежние заготовки этого ученика не понадобятся"""
+        for key in [key for key in self.pending if key[0] == user_id]:
+            self._drop(key)
+        self._expire()
+    
+    def _expire(self):
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self.pending.items() if expires < now]:
+            self._drop(key)
+    
+    def summary(self) -> dict:
+        finished = self.stats['hits'] + self.stats['wasted']
+        return {
+            **self.stats,
+            'pending': len(self.pending),
+            'abandoned': len(self.abandoned),
+            'hit_rate': round(self.stats['hits'] / finished, 2) if finished else None,
+            'budget_left': self.budget_left(),
+        }
@@ -0,0 +1,20 @@
+import re
+
+# Без токенизатора считаем приблизительно:
+# кириллица режется BPE-словарями Llama мельче латиницы
+CYRILLIC = re.compile(r'[а-яА-ЯёЁ]')
+MESSAGE_OVERHEAD = 4  # служебные токены роли/разделителей на каждое сообщение
+
+def estimate_tokens(text: str | None) -> int:
+    """Оценка количества токенов в тексте"""
+    if not text:
+        return 0
+    
+    cyrillic = len(CYRILLIC.findall(text))
+    other = len(text) - cyrillic
+    
+    return int(cyrillic / 2.5 + other / 4) + 1
+
+def count_message_tokens(messages: list) -> int:
+    """Оценка токенов для списка сообщений chat completion"""
+    return sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
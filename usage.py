@@ -0,0 +1,197 @@
+import asyncio
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta
+
+class UsageTracker:
+    """
+    Учёт токенов Groq: по ключу, модели, пользователю и предмету.
+    Агрегаты копятся в памяти и пачкой уходят в usage_log; по скорости
+    расхода прогнозируется, когда каждый ключ исчерпает суточную квоту.
+    При старте расход за текущие сутки берётся из usage_log - рестарт не обнуляет квоту.
+    """
+    
+    def __init__(self, db, api_keys: list, daily_quota: int = 0, flush_interval: float = 60.0,
+                 rate_window: float = 900.0):
+        self.db = db
+        # В логи и статистику попадает только хвост ключа
+        self.labels = [f"…{key[-4:]}" for key in api_keys]
+        self.daily_quota = daily_quota  # токенов в сутки на ключ, 0 - неизвестна
+        self.flush_interval = flush_interval
+        self.rate_window = rate_window
+        
+        self.day = None
+        self._reset_day()
+        self.pending = {}  # (ключ, модель, user_id, предмет, вид) -> [вызовы, prompt, completion, total, мс]
+        
+        self.stats = {'calls': 0, 'flushes': 0, 'flush_errors': 0, 'loaded_tokens': None}
+    
+    def _reset_day(self):
+        """Квоты Groq суточные - счётчики обнуляются в полночь UTC"""
+        self.day = datetime.utcnow().date()
+        self.used = [0] * len(self.labels)
+        self.recent = [deque() for _ in self.labels]  # (время, токены) за rate_window
+        self.exhausted = set()  # ключи, на которых Groq вернул дневной лимит
+        self.by_model = Counter()
+        self.by_subject = Counter()
+        self.by_user = Counter()
+    
+    def _roll(self):
+        if datetime.utcnow().date() != self.day:
+            self._reset_day()
+    
+    def record(self, index: int, model: str, usage, latency: float,
+               user_id: int | None = None, subject: str | None = None, kind: str = "text"):
+        """Учесть один вызов (usage - response.usage из SDK)"""
+        self._roll()
+        prompt = getattr(usage, 'prompt_tokens', 0) or 0
+        completion = getattr(usage, 'completion_tokens', 0) or 0
+        total = getattr(usage, 'total_tokens', 0) or prompt + completion
+        
+        self.used[index] += total
+        self.recent[index].append((time.monotonic(), total))
+        self.by_model[model] += total
+        if subject:
+            self.by_subject[subject] += total
+        if user_id:
+            self.by_user[user_id] += total
+        
+        row = self.pending.setdefault((index, model, user_id, subject, kind), [0, 0, 0, 0, 0.0])
+        row[0] += 1
+        row[1] += prompt
+        row[2] += completion
+        row[3] += total
+        row[4] += latency * 1000
+        self.stats['calls'] += 1
+    
+    def mark_exhausted(self, index: int):
+        """Groq ответил дневным лимитом - ключ не используем до полуночи UTC"""
+        self._roll()
+        self.exhausted.add(index)
+    
+    def rate(self, index: int) -> float:
+        """Скорость расхода ключа, токенов в секунду (за последние rate_window секунд)"""
+        recent = self.recent[index]
+        now = time.monotonic()
+        while recent and now - recent[0][0] > self.rate_window:
+            recent.popleft()
+        return sum(tokens for _, tokens in recent) / self.rate_window
+    
+    def forecast(self, index: int) -> dict:
+        """Прогноз по ключу: расход, остаток и когда кончится квота при текущем темпе"""
+        self._roll()
+        now = datetime.utcnow()
+        until_reset = (datetime.combine(self.day + timedelta(days=1), datetime.min.time()) - now).total_seconds()
+        rate = self.rate(index)
+        
+        result = {
+            'key': self.labels[index],
+            'used': self.used[index],
+            'rate_per_min': round(rate * 60),
+            'exhausted': index in self.exhausted,
+            'exhausts_in': None,
+            'exhausts_today': index in self.exhausted,
+        }
+        if self.daily_quota:
+            left = max(self.daily_quota - self.used[index], 0)
+            result['left'] = left
+            result['exhausted'] = result['exhausted'] or left == 0
+            if rate > 0:
+                result['exhausts_in'] = left / rate
+            result['exhausts_today'] = result['exhausted'] or (
+                result['exhausts_in'] is not None and result['exhausts_in'] < until_reset
+            )
+        return result
+    
+    def pick_key(self, start: int) -> int:
+        """
+        Ключ для следующего запроса: по кругу начиная со start, пропуская исчерпанные;
+        если до полуночи кончатся все - тот, у которого больше остаток
+        """
+        order = [(start + i) % len(self.labels) for i in range(len(self.labels))]
+        forecasts = {index: self.forecast(index) for index in order}
+        
+        alive = [index for index in order if not forecasts[index]['exhausted']]
+        if not alive:
+            return start
+        
+        safe = [index for index in alive if not forecasts[index]['exhausts_today']]
+        if safe:
+            return safe[0]
+        return max(alive, key=lambda index: forecasts[index].get('left', 0))
+    
+    def summary(self, top: int = 5) -> dict:
+        """Сводка за сутки для /health и админки"""
+        self._roll()
+        return {
+            'keys': [self.forecast(index) for index in range(len(self.labels))],
+            'total': sum(self.used),
+            'models': self.by_model.most_common(top),
+            'subjects': self.by_subject.most_common(top),
+            'users': self.by_user.most_common(top),
+        }
+    
+    async def flush(self):
+        """Записать накопленные агрегаты в usage_log"""
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        
+        created_at = datetime.utcnow().isoformat()
+        rows = [
+            {
+                'created_at': created_at,
+                'key_id': self.labels[index],
+                'model': model,
+                'user_id': user_id,
+                'subject': subject,
+                'kind': kind,
+                'calls': calls,
+                'prompt_tokens': prompt,
+                'completion_tokens': completion,
+                'total_tokens': total,
+                'latency_ms': round(latency_ms / calls),
+            }
+            for (index, model, user_id, subject, kind), (calls, prompt, completion, total, latency_ms)
+            in pending.items()
+        ]
+        try:
+            await self.db.insert_usage(rows)
+            self.stats['flushes'] += 1
+        except Exception as e:
+            # Не удалось - вернуть агрегаты, уйдут со следующей пачкой
+            for group, values in pending.items():
+                row = self.pending.setdefault(group, [0, 0, 0, 0, 0.0])
+                for i, value in enumerate(values):
+                    row[i] += value
+            self.stats['flush_errors'] += 1
+            print(f"Usage flush error: {e}")
+    
+    async def load(self, attempts: int = 5, delay: float = 5.0) -> bool:
+        """
+        Досчитать расход за сегодня из usage_log (до первой записи этого процесса:
+        иначе свои же строки учлись бы дважды). Вызовы до загрузки уже в used - складываем.
+        """
+        for attempt in range(attempts):
+            usage = await self.db.get_key_usage_today()
+            if usage is not None:
+                break
+            await asyncio.sleep(delay * (attempt + 1))
+        else:
+            print("Usage load error: расход за сегодня не загружен, прогноз квоты занижен")
+            return False
+        
+        self._roll()
+        for index, label in enumerate(self.labels):
+            self.used[index] += usage['keys'].get(label, 0)
+        self.by_model.update(usage['models'])
+        self.by_subject.update(usage['subjects'])
+        self.stats['loaded_tokens'] = sum(usage['keys'].values())
+        return True
+    
+    async def run(self):
+        """Фоновая задача: загрузка расхода за сегодня и периодическая запись"""
+        await self.load()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
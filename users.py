@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import math
+from collections import OrderedDict
+from datetime import datetime
+
+class BloomFilter:
+    """Компактное множество id: ложные срабатывания возможны, пропуски - нет"""
+    
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(int(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+    
+    def _positions(self, item):
+        digest = hashlib.blake2b(str(item).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+    
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+    
+    def __contains__(self, item) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+class UserProfiles:
+    """
+    Профили пользователей в памяти процесса.
+    Проверка существования без запросов к БД, создание и смена предмета -
+    отложенные идемпотентные upsert, которые уходят пачками.
+    Фильтр Блума id из БД решает, нужна ли строка: при «есть» создание пропускается.
+    Ложное срабатывание (доля error_rate) лечится записью предмета - это тоже upsert,
+    он создаёт недостающую строку.
+    """
+    
+    def __init__(self, db, capacity: int = 100_000, error_rate: float = 0.001,
+                 max_profiles: int = 10_000, flush_interval: float = 5.0):
+        self.db = db
+        self.known = BloomFilter(capacity, error_rate)
+        self.profiles = OrderedDict()  # user_id -> профиль (LRU)
+        self.max_profiles = max_profiles
+        self.flush_interval = flush_interval
+        
+        self.pending_new = {}       # user_id -> строка для создания
+        self.pending_subjects = {}  # user_id -> строка со сменой предмета
+        
+        self.stats = {'loaded': 0, 'created': 0, 'skipped': 0, 'flushes': 0}
+    
+    def _remember(self, user_id: int, **fields):
+        profile = self.profiles.setdefault(user_id, {'user_id': user_id})
+        profile.update(fields)
+        self.profiles.move_to_end(user_id)
+        while len(self.profiles) > self.max_profiles:
+            self.profiles.popitem(last=False)
+    
+    def ensure_user(self, user_id: int, username: str | None):
+        """Зарегистрировать пользователя, если он новый; без запросов к БД"""
+        if user_id in self.profiles:
+            return
+        
+        self._remember(user_id, username=username)
+        if user_id in self.known:
+            # Вероятно уже есть в БД - создание не нужно
+            self.stats['skipped'] += 1
+            return
+        
+        self.known.add(user_id)
+        self.stats['created'] += 1
+        self.pending_new[user_id] = {
+            'user_id': user_id,
+            'username': username,
+            'created_at': datetime.utcnow().isoformat()
+        }
+    
+    def set_subject(self, user_id: int, subject: str, username: str | None = None):
+        """Запомнить выбранный предмет; в БД уйдёт со следующей пачкой (создав строку, если её нет)"""
+        self._remember(user_id, username=username, current_subject=subject)
+        self.pending_subjects[user_id] = {'user_id': user_id, 'username': username, 'current_subject': subject}
+    
+    async def load(self):
+        """Заполнить фильтр id всех известных пользователей"""
+        async for user_id in self.db.iter_user_ids():
+            self.known.add(user_id)
+            self.stats['loaded'] += 1
+    
+    async def flush(self):
+        """Записать накопленные изменения пачками"""
+        new, self.pending_new = self.pending_new, {}
+        subjects, self.pending_subjects = self.pending_subjects, {}
+        
+        # Сначала создание (существующие строки не трогаем), затем смена предмета
+        if new and not await self.db.upsert_users(list(new.values()), ignore_duplicates=True):
+            for user_id, row in new.items():
+                self.pending_new.setdefault(user_id, row)
+        
+        # Строку без предмета upsert создаёт (created_at - default БД): так чинится ложное «есть» фильтра
+        if subjects and not await self.db.upsert_users(list(subjects.values())):
+            for user_id, row in subjects.items():
+                self.pending_subjects.setdefault(user_id, row)
+        
+        self.stats['flushes'] += 1
+    
+    async def run(self):
+        """Фоновая задача: загрузка фильтра и периодическая запись"""
+        try:
+            await self.load()
+        except Exception as e:
+            print(f"User profiles load error: {e}")
+        
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self.pending_new or self.pending_subjects:
+                await self.flush()
@@ -1,6 +1,8 @@
-from groq import Groq
 import base64
 import asyncio
+import time
+
+VISION_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
 
 class VisionProcessor:
     def __init__(self, groq_router):
@@ -18,14 +20,16 @@ class VisionProcessor:
             return False, "Изображение слишком большое. Попробуйте сфотографировать ближе."
         
         base64_image = base64.b64encode(image_bytes).decode('utf-8')
-        client = self.groq.get_client()
+        index, client = self.groq.acquire()
+        started = time.monotonic()
         
         try:
             # Добавляем timeout 20 секунд
             response = await asyncio.wait_for(
-                asyncio.to_thread(
+                self.groq.run(
+                    'vision',
                     client.chat.completions.create,
-                    model="meta-llama/llama-4-scout-17b-16e-instruct",
+                    model=VISION_MODEL,
                     messages=[
                         {
                             "role": "user",
@@ -65,6 +69,8 @@ Non-educational (but respond politely):
                 timeout=20.0
             )
             
+            self.groq.record(index, VISION_MODEL, response, started, kind="vision_check")
+            
             result = response.choices[0].message.content
             import json
             analysis = json.loads(result)
@@ -101,14 +107,16 @@ Non-educational (but respond politely):
         """
         
         base64_image = base64.b64encode(image_bytes).decode('utf-8')
-        client = self.groq.get_client()
+        index, client = self.groq.acquire()
+        started = time.monotonic()
         
         try:
             # Добавляем timeout 45 секунд (OCR может быть медленнее)
             response = await asyncio.wait_for(
-                asyncio.to_thread(
+                self.groq.run(
+                    'vision',
                     client.chat.completions.create,
-                    model="meta-llama/llama-4-scout-17b-16e-instruct",
+                    model=VISION_MODEL,
                     messages=[
                         {
                             "role": "user",
@@ -139,6 +147,7 @@ Non-educational (but respond politely):
                 timeout=45.0
             )
             
+            self.groq.record(index, VISION_MODEL, response, started, kind="ocr")
             return response.choices[0].message.content
         
         except asyncio.TimeoutError:
@@ -0,0 +1,119 @@
+import asyncio
+from datetime import datetime
+
+from prompts import PROMPTS, build_messages
+
+class CacheWarmer:
+    """
+    Прогрев локального уровня кеша после деплоя
+    и предгенерация ответов на популярные вопросы в часы низкой нагрузки
+    """
+    
+    def __init__(self, cache, db, groq, per_subject: int = 50, pregen_budget: int = 0,
+                 offpeak_hours: tuple = (21, 3), interval: int = 3600):
+        self.cache = cache
+        self.db = db
+        self.groq = groq
+        self.subjects = list(PROMPTS)
+        self.per_subject = per_subject
+        self.pregen_budget = pregen_budget  # запросов к Groq в сутки, 0 - выключено
+        self.offpeak_hours = offpeak_hours  # (с, до) по UTC, включительно
+        self.interval = interval
+        
+        self._pregen_day = None
+        self._pregen_used = 0
+        
+        self.progress = {
+            'status': 'idle',
+            'subjects_done': 0,
+            'subjects_total': len(self.subjects),
+            'preloaded': 0,
+            'pregenerated': 0,
+            'last_run': None,
+        }
+    
+    def is_offpeak(self, now: datetime | None = None) -> bool:
+        """Сейчас часы низкой нагрузки?"""
+        hour = (now or datetime.utcnow()).hour
+        start, end = self.offpeak_hours
+        if start <= end:
+            return start <= hour <= end
+        return hour >= start or hour <= end
+    
+    def pregen_left(self) -> int:
+        """Остаток суточной квоты на предгенерацию"""
+        today = datetime.utcnow().date()
+        if self._pregen_day != today:
+            self._pregen_day = today
+            self._pregen_used = 0
+        return max(self.pregen_budget - self._pregen_used, 0)
+    
+    async def run(self):
+        """Фоновая задача: прогрев при старте, затем периодически"""
+        while True:
+            try:
+                await self.warm()
+                if self.pregen_budget and self.is_offpeak():
+                    await self.pregenerate()
+                await self.cache.flush_hits()
+            except Exception as e:
+                print(f"Cache warmup error: {e}")
+                self.progress['status'] = 'error'
+            
+            await asyncio.sleep(self.interval)
+    
+    async def warm(self):
+        """Загрузить популярные ответы в локальный уровень кеша"""
+        self.progress.update(status='warming', subjects_done=0, preloaded=0)
+        
+        for subject in self.subjects:
+            # Самые востребованные записи кеша
+            for row in await self.db.get_top_cached(subject, limit=self.per_subject):
+                self.cache.preload(row['key'], row['response'], row.get('hit_count') or 0)
+                self.progress['preloaded'] += 1
+            
+            # Частые вопросы из лога, ответы на которые уже есть в кеше
+            popular = await self.db.get_popular_questions(subject, limit=self.per_subject)
+            found = await self.cache.get_many(subject, [p['question'] for p in popular])
+            for key, row in found.items():
+                if key not in self.cache.local:
+                    self.cache.preload(key, row['response'], row.get('hit_count') or 0)
+                    self.progress['preloaded'] += 1
+            
+            self.progress['subjects_done'] += 1
+            await asyncio.sleep(0)
+        
+        self.progress.update(status='ready', last_run=datetime.utcnow().strftime('%d.%m %H:%M'))
+    
+    async def pregenerate(self):
+        """Сгенерировать ответы на частые вопросы без записи в кеше"""
+        self.progress['status'] = 'pregenerating'
+        
+        for subject in self.subjects:
+            popular = await self.db.get_popular_questions(subject, limit=self.per_subject)
+            # Вопросы по фото зависят от картинки, обрезанные - не совпадут с ключом кеша
+            questions = [
+                p['question'] for p in popular
+                if p['count'] > 1 and len(p['question']) < 500 and not p['question'].startswith('Контекст')
+            ]
+            cached = await self.cache.get_many(subject, questions)
+            
+            for question in questions:
+                if self.pregen_left() <= 0:
+                    self.progress['status'] = 'ready'
+                    return
+                if self.cache._hash_query(subject, question) in cached:
+                    continue
+                
+                try:
+                    response = await self.groq.get_response(
+                        build_messages(subject, question), subject=subject, kind="pregen"
+                    )
+                    await self.cache.set(subject, question, response)
+                    self.progress['pregenerated'] += 1
+                except Exception as e:
+                    print(f"Cache pregenerate error: {e}")
+                finally:
+                    self._pregen_used += 1
+        
+        self.progress['status'] = 'ready'